@@ -21,18 +21,27 @@
 
 cd "$(dirname "$0")"
 
+# capture_server.py（常駐プロセス）が起動している場合は、聴取中、録音中かを、その購読者で判定する。
+# 起動していない場合は、module-loopbackの有無（聴取中）、record.pyのプロセスの有無（録音中）で判定する。
+# 異常終了したcapture_server.pyのソケットファイルが残っている場合もあるので、ソケットファイルの有無ではなく、応答の有無で判定する。
+
 # マイク端子から入るラジオ音源を、イヤホン端子にループバックの終了
-# load済みのmodule-loopbackがある場合のみ処理
-readonly INFO_LOADED_MODULE_LOOPBACK=$(pactl list modules short | grep module-loopback)
-if [ "" != "${INFO_LOADED_MODULE_LOOPBACK}" ]; then
-	pactl unload-module module-loopback
+if python3 ./pymodules/capture_client.py status > /dev/null; then
+	python3 ./pymodules/capture_client.py loopback off > /dev/null
+	INFO_RECORDING=$(python3 ./pymodules/capture_client.py has record && echo "recording")
+else
+	# load済みのmodule-loopbackがある場合のみ処理
+	readonly INFO_LOADED_MODULE_LOOPBACK=$(pactl list modules short | grep module-loopback)
+	if [ "" != "${INFO_LOADED_MODULE_LOOPBACK}" ]; then
+		pactl unload-module module-loopback
+	fi
+	INFO_RECORDING=$(ps aux | grep "[r]ecord\.py")
 fi
 
 # ラジオOFF
-# ffmpegのプロセスがない場合のみ処理。プロセスがある場合は、ラジオ録音中なのでラジオ処理なし。
-readonly INFO_FFMPEG_PROCESS=$(ps aux | grep [f]fmpeg)
-if [ "" != "${INFO_FFMPEG_PROCESS}" ]; then
+# 録音中でない場合のみ処理。録音中の場合は、ラジオ処理なし。
+if [ "" != "${INFO_RECORDING}" ]; then
 	echo "Now Recording! Skipped Radio-Off."
 else
-	python3 ./pymodules/radio_off.py
+	python3 ./pymodules/radio_client.py off
 fi
@@ -29,19 +29,29 @@ if [ "" = "${FREQUENCY_MHZ}" ]; then
     exit
 fi
 
+# capture_server.py（常駐プロセス）が起動している場合は、聴取中、録音中かを、その購読者で判定する。
+# 起動していない場合は、module-loopbackの有無（聴取中）、record.pyのプロセスの有無（録音中）で判定する。
+# 異常終了したcapture_server.pyのソケットファイルが残っている場合もあるので、ソケットファイルの有無ではなく、応答の有無で判定する。
+
 # マイク端子から入るラジオ音源を、イヤホン端子にループバックする
-# load済みのmodule-loopbackがない場合のみ処理
-readonly INFO_LOADED_MODULE_LOOPBACK=$(pactl list modules short | grep module-loopback)
-if [ "" = "${INFO_LOADED_MODULE_LOOPBACK}" ]; then
-	# 「pactl load-module」の結果、loadされたモジュールの番号が標準出力されるので、出力をnullデバイスにリダイレクト。
-	pactl load-module module-loopback > /dev/null
+if python3 ./pymodules/capture_client.py status > /dev/null; then
+	# capture_server.pyのループバック再生を開始（開始済みの場合は何もしない）
+	python3 ./pymodules/capture_client.py loopback on > /dev/null
+	INFO_RECORDING=$(python3 ./pymodules/capture_client.py has record && echo "recording")
+else
+	# load済みのmodule-loopbackがない場合のみ処理
+	readonly INFO_LOADED_MODULE_LOOPBACK=$(pactl list modules short | grep module-loopback)
+	if [ "" = "${INFO_LOADED_MODULE_LOOPBACK}" ]; then
+		# 「pactl load-module」の結果、loadされたモジュールの番号が標準出力されるので、出力をnullデバイスにリダイレクト。
+		pactl load-module module-loopback > /dev/null
+	fi
+	INFO_RECORDING=$(ps aux | grep "[r]ecord\.py")
 fi
 
 # ラジオON
-# ffmpegのプロセスがない場合のみ処理。プロセスがある場合は、ラジオ録音中なのでラジオ処理なし。
-readonly INFO_FFMPEG_PROCESS=$(ps aux | grep [f]fmpeg)
-if [ "" != "${INFO_FFMPEG_PROCESS}" ]; then
+# 録音中でない場合のみ処理。録音中の場合は、ラジオ処理なし。
+if [ "" != "${INFO_RECORDING}" ]; then
 	echo "Now Recording! Skipped Radio-On."
 else
-	python3 ./pymodules/radio_on.py $FREQUENCY_MHZ
+	python3 ./pymodules/radio_client.py on $FREQUENCY_MHZ
 fi
@@ -29,18 +29,27 @@ if [ "" = "${FREQUENCY_MHZ}" ]; then
     exit
 fi
 
-# load済みのmodule-loopbackがない場合はリスニング中でない
-readonly INFO_LOADED_MODULE_LOOPBACK=$(pactl list modules short | grep module-loopback)
-if [ "" = "${INFO_LOADED_MODULE_LOOPBACK}" ]; then
+# capture_server.py（常駐プロセス）が起動している場合は、聴取中、録音中かを、その購読者で判定する。
+# 起動していない場合は、module-loopbackの有無（聴取中）、record.pyのプロセスの有無（録音中）で判定する。
+# 異常終了したcapture_server.pyのソケットファイルが残っている場合もあるので、ソケットファイルの有無ではなく、応答の有無で判定する。
+if python3 ./pymodules/capture_client.py status > /dev/null; then
+    INFO_LISTENING=$(python3 ./pymodules/capture_client.py has listen && echo "listening")
+    INFO_RECORDING=$(python3 ./pymodules/capture_client.py has record && echo "recording")
+else
+    INFO_LISTENING=$(pactl list modules short | grep module-loopback)
+    INFO_RECORDING=$(ps aux | grep "[r]ecord\.py")
+fi
+
+# 聴取中でない場合はエラー
+if [ "" = "${INFO_LISTENING}" ]; then
     echo "Error : Not listening to radio."
     exit
 fi
 
 # 周波数の設定
-# ffmpegのプロセスがない場合のみ処理。プロセスがある場合は、ラジオ録音中なのでラジオ処理なし。
-readonly INFO_FFMPEG_PROCESS=$(ps aux | grep [f]fmpeg)
-if [ "" != "${INFO_FFMPEG_PROCESS}" ]; then
+# 録音中でない場合のみ処理。録音中の場合は、ラジオ処理なし。
+if [ "" != "${INFO_RECORDING}" ]; then
 	echo "Now Recording! Skipped Radio tuning."
 else
-	python3 ./pymodules/radio_tune.py $FREQUENCY_MHZ
+	python3 ./pymodules/radio_client.py tune $FREQUENCY_MHZ
 fi
@@ -0,0 +1,161 @@
+# benchmark_rda5807m.py
+# RDA5807Mのドライバーの処理時間を、代表的な処理（ワークロード）ごとに計測する
+# 1つのI2Cバスで、何台のチューナーと、何本の状態のポーリングを処理できるかの見積もりに使用する。
+# ワークロード
+#   cold_start : 電源投入（begin）と周波数の設定。間に電源を切る（end）。
+#   tune       : ランダムな周波数への周波数の設定（チューニング完了まで待つ）
+#   seek       : 上方向のSeek
+#   scan       : バンド全体のスキャン（rda5807m/bandscan.py）
+#   poll       : 状態レジスタの読み込み（readStatusRegisters）の連続実行
+# 各ワークロードについて、1回あたりの所要時間（平均、p50、p99）、I2Cトランザクション数、バスの占有時間を表示する。
+# 計測結果は、JSON形式、Prometheusのテキスト形式でも出力できる。（rda5807m/instrumentation.py 参照）
+# Arguments
+#   --simulator [profile] : 実機の代わりにシミュレーター（rda5807m/simulator.py）を使用する。バンドプロファイルのパスは省略可能。 : Optional.
+#   --i2c-clock  : シミュレーターのI2Cのクロック周波数[Hz] : Optional. Default is 100000.
+#   --bus        : I2C bus number : Optional. Default is 1.
+#   --workloads  : 実行するワークロード（カンマ区切り） : Optional. Default is all.
+#   --repeat     : cold_start、tune、seek、scanの実行回数 : Optional. Default is 10 (scan is 1).
+#   --poll-sec   : pollの実行時間[秒] : Optional. Default is 5.
+#   --json       : 計測結果をJSON形式で出力するファイルパス : Optional.
+#   --prometheus : 計測結果をPrometheusのテキスト形式で出力するファイルパス : Optional.
+
+import argparse
+import json
+import random
+import sys
+import time
+
+from rda5807m.rda5807m import RDA5807M
+from rda5807m.bandscan import BandScanner
+from rda5807m.instrumentation import BusMetrics, instrumentRadio
+
+WORKLOADS = ( "cold_start", "tune", "seek", "scan", "poll" )
+REPEAT_DEFAULT = 10
+POLL_SEC_DEFAULT = 5.0
+FREQUENCY_DEFAULT = 80000   # cold_startで設定する周波数[kHz]
+POLL_RATES_HZ = ( 1, 10 )   # 見積もりを表示する、ポーリングの頻度[Hz]
+
+# --- 関数定義 ---
+
+# ワークロードの実行
+# 1回分の処理の関数を実行し、1回あたりの所要時間と、I2Cトランザクションの計測結果を返す。
+def runWorkload( strName, radio, metrics, func, iRepeat = None, fDurationSec = None ):
+    metrics.reset()
+    afSec = []
+    fStartSec = time.perf_counter()
+    while( True ):
+        fOpStartSec = time.perf_counter()
+        func()
+        afSec.append( time.perf_counter() - fOpStartSec )
+        if( (iRepeat is not None) and (iRepeat <= len( afSec )) ):
+            break
+        if( (fDurationSec is not None) and (fDurationSec <= time.perf_counter() - fStartSec) ):
+            break
+    fElapsedSec = time.perf_counter() - fStartSec
+
+    dictMetrics = metrics.toDict()
+    iTransactions = sum( dictEntry["count"] for dictEntry in dictMetrics["transactions"] )
+    fBusSec = sum( dictEntry["latency"]["sum_sec"] for dictEntry in dictMetrics["transactions"] )
+    afSorted = sorted( afSec )
+    return { "workload" : strName,
+             "operations" : len( afSec ),
+             "elapsed_sec" : fElapsedSec,
+             "latency" : { "mean_sec" : sum( afSec ) / len( afSec ),
+                           "p50_sec" : _percentile( afSorted, 0.5 ),
+                           "p99_sec" : _percentile( afSorted, 0.99 ),
+                           "max_sec" : afSorted[-1] },
+             "transactions_per_op" : iTransactions / len( afSec ),
+             "bus_sec_per_op" : fBusSec / len( afSec ),
+             "bus_utilization" : (fBusSec / fElapsedSec) if (0 < fElapsedSec) else 0.0,
+             "metrics" : dictMetrics,
+             "prometheus" : metrics.toPrometheus( "rda5807m_%s" % strName ) }
+
+# 並べ替え済みの値の、割合 fQuantile（0～1）の値
+def _percentile( afSorted, fQuantile ):
+    return afSorted[min( len( afSorted ) - 1, int( fQuantile * len( afSorted ) ) )]
+
+# 結果の表示
+def printResults( aResult ):
+    print( "%-10s %6s %10s %10s %10s %8s %12s %6s" % ("workload", "ops", "mean[ms]", "p50[ms]", "p99[ms]", "i2c/op", "bus[ms]/op", "bus%") )
+    for dictResult in aResult:
+        dictLatency = dictResult["latency"]
+        print( "%-10s %6d %10.2f %10.2f %10.2f %8.1f %12.3f %5.1f%%" % (dictResult["workload"], dictResult["operations"],
+                                                                       dictLatency["mean_sec"] * 1000, dictLatency["p50_sec"] * 1000, dictLatency["p99_sec"] * 1000,
+                                                                       dictResult["transactions_per_op"], dictResult["bus_sec_per_op"] * 1000,
+                                                                       dictResult["bus_utilization"] * 100) )
+
+    # 1つのI2Cバスでの処理能力の見積もり（I2Cバスは、バスごとに1つのスレッドで順に使用する。tuner_pool.py 参照）
+    for dictResult in aResult:
+        if( "poll" == dictResult["workload"] ):
+            fBusSec = dictResult["bus_sec_per_op"]
+            for iRateHz in POLL_RATES_HZ:
+                print( "Status polling at %2d[Hz] : up to %d pollers per I2C bus" % (iRateHz, int( 1.0 / (fBusSec * iRateHz) ) if (0 < fBusSec) else 0) )
+        elif( "tune" == dictResult["workload"] ):
+            print( "Tuning : up to %.1f tunes per second per I2C bus" % (1.0 / dictResult["latency"]["mean_sec"]) )
+
+def main():
+    # 引数の処理
+    parser = argparse.ArgumentParser()
+    parser.add_argument( "--simulator", nargs = "?", const = "", default = None )
+    parser.add_argument( "--i2c-clock", type = int, default = None )
+    parser.add_argument( "--bus", type = int, default = 1 )
+    parser.add_argument( "--workloads", default = ",".join( WORKLOADS ) )
+    parser.add_argument( "--repeat", type = int, default = REPEAT_DEFAULT )
+    parser.add_argument( "--poll-sec", type = float, default = POLL_SEC_DEFAULT )
+    parser.add_argument( "--json" )
+    parser.add_argument( "--prometheus" )
+    args = parser.parse_args()
+
+    astrWorkload = [ strName.strip() for strName in args.workloads.split( "," ) if strName.strip() ]
+    for strName in astrWorkload:
+        if( strName not in WORKLOADS ):
+            print( "Error : Unknown workload : %s" % strName )
+            return 254
+
+    # ラジオの作成
+    if( args.simulator is not None ):
+        from rda5807m.simulator import SimulatedBus, loadBandProfile     # 実機では不要なので、ここでimportする。
+        dictOption = {} if (args.i2c_clock is None) else { "iI2CClockHz" : args.i2c_clock }
+        radio = RDA5807M( args.bus, bus = SimulatedBus( loadBandProfile( args.simulator ) if args.simulator else None, **dictOption ) )
+    else:
+        radio = RDA5807M( args.bus )
+    metrics = BusMetrics()
+    instrumentRadio( radio, metrics )
+
+    radio.begin()
+    radio.setFrequency( FREQUENCY_DEFAULT )
+    ulFrequencyMin = radio.getFrequencyMin()
+    iChannelCount = (radio.getFrequencyMax() - ulFrequencyMin) // radio.getChannelSpacing() + 1
+    rand = random.Random( 0 )   # 実行ごとに同じ周波数の列とする
+
+    def coldStart():
+        radio.end()
+        radio.begin()
+        radio.setFrequency( FREQUENCY_DEFAULT )
+
+    dictWorkload = {
+        "cold_start" : lambda: runWorkload( "cold_start", radio, metrics, coldStart, iRepeat = args.repeat ),
+        "tune"       : lambda: runWorkload( "tune", radio, metrics,
+                                            lambda: radio.setFrequency( ulFrequencyMin + rand.randrange( iChannelCount ) * radio.getChannelSpacing() ),
+                                            iRepeat = args.repeat ),
+        "seek"       : lambda: runWorkload( "seek", radio, metrics, lambda: radio.seek( True ), iRepeat = args.repeat ),
+        "scan"       : lambda: runWorkload( "scan", radio, metrics, lambda: BandScanner( radio ).scan(), iRepeat = 1 ),
+        "poll"       : lambda: runWorkload( "poll", radio, metrics, radio.readStatusRegisters, fDurationSec = args.poll_sec ),
+    }
+    try:
+        aResult = [ dictWorkload[strName]() for strName in astrWorkload ]
+    finally:
+        radio.end()
+
+    printResults( aResult )
+    if( args.json ):
+        with open( args.json, "w", encoding = "utf-8" ) as file:
+            json.dump( [ { strKey : value for (strKey, value) in dictResult.items() if "prometheus" != strKey } for dictResult in aResult ], file, indent = 2 )
+    if( args.prometheus ):
+        with open( args.prometheus, "w", encoding = "utf-8" ) as file:
+            for dictResult in aResult:
+                file.write( dictResult["prometheus"] )
+    return 0
+
+if( "__main__" == __name__ ):
+    sys.exit( main() )
@@ -0,0 +1,138 @@
+# benchmark_startup.py
+# radio_*.py スクリプトの起動から終了までの時間を計測する
+# cronやシェルスクリプトから1回ずつ起動されるスクリプトは、処理そのものより、Pythonの起動とimportの時間が長い。
+# 各ケースを別のプロセスとして繰り返し実行し、所要時間の中央値と最小値を表示する。
+# また、radio_service.py のimportの所要時間の内訳（python -X importtime）から、時間の長いモジュールを表示する。
+# 計測の前に、このディレクトリの .py をコンパイルしておく。（PYTHONDONTWRITEBYTECODE の環境等で、毎回コンパイルされる時間を含めないため）
+# ケース
+#   python        : Pythonの起動のみ（比較の基準）
+#   import_client : radio_client.py のimport
+#   import_service: radio_service.py のimport
+#   on_cold       : 電源の切れたチューナーでの radio_on.py
+#   on_warm       : 同じ周波数で電源の入ったチューナーでの radio_on.py（初期化とチューニングを省略する）
+#   tune_same     : 同じ周波数への radio_tune.py（チューニングを省略する）
+#   tune          : 別の周波数への radio_tune.py
+#   client_status : radio_client.py status（radio_server.py が起動していない場合の、プロセス内での直接操作）
+#   off           : radio_off.py
+# Arguments
+#   --hardware : 実機で計測する。省略時は、シミュレーター（RDA5807M_BUS=sim）で計測する。 : Optional.
+#   --repeat   : 各ケースの実行回数 : Optional. Default is 10.
+#   --top      : 表示する、importの時間の長いモジュールの数 : Optional. Default is 10.
+#   --json     : 計測結果をJSON形式で出力するファイルパス : Optional.
+
+import argparse
+import compileall
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+REPEAT_DEFAULT = 10
+TOP_DEFAULT = 10
+FREQUENCY = "80.0"          # 計測に使用する周波数[MHz]
+FREQUENCY_OTHER = "81.3"    # tuneで交互に設定する周波数[MHz]
+SOCKET_PATH_NONE = "/nonexistent/radio_server.sock"  # radio_server.py を使用せず、プロセス内で直接操作させる
+
+# --- 関数定義 ---
+
+# ケースの一覧
+# ( ケース名, 準備のコマンド（Noneは準備なし）, 計測するコマンド（の関数。実行回数を受け取る） ) のリストを返す。
+def getCases():
+    def script( *astrArg ):
+        return lambda i: [ sys.executable ] + list( astrArg )
+    return [
+        ( "python",         None,                                   script( "-c", "pass" ) ),
+        ( "import_client",  None,                                   script( "-c", "import radio_client" ) ),
+        ( "import_service", None,                                   script( "-c", "import radio_service" ) ),
+        ( "on_cold",        [ "radio_off.py", "1" ],                script( "radio_on.py", FREQUENCY, "1" ) ),
+        ( "on_warm",        [ "radio_on.py", FREQUENCY, "1" ],      script( "radio_on.py", FREQUENCY, "1" ) ),
+        ( "tune_same",      [ "radio_on.py", FREQUENCY, "1" ],      script( "radio_tune.py", FREQUENCY, "1" ) ),
+        ( "tune",           [ "radio_on.py", FREQUENCY, "1" ],
+                            lambda i: [ sys.executable, "radio_tune.py", FREQUENCY_OTHER if (0 == i % 2) else FREQUENCY, "1" ] ),
+        ( "client_status",  [ "radio_on.py", FREQUENCY, "1" ],      script( "radio_client.py", "status", "1" ) ),
+        ( "off",            [ "radio_on.py", FREQUENCY, "1" ],      script( "radio_off.py", "1" ) ),
+    ]
+
+# ケースの実行
+# 計測するコマンドを iRepeat 回実行し、1回ごとの所要時間[秒]のリストを返す。
+# on_cold、off は、毎回、準備のコマンドを実行してから計測する。
+def runCase( strName, astrPrepare, command, iRepeat, dictEnv ):
+    def run( astrCommand ):
+        subprocess.run( astrCommand, env = dictEnv, check = True, stdout = subprocess.DEVNULL, stderr = subprocess.DEVNULL )
+
+    afSec = []
+    for i in range( iRepeat ):
+        if( (astrPrepare is not None) and ((0 == i) or (strName in ("on_cold", "off"))) ):
+            run( [ sys.executable ] + astrPrepare )
+        fStartSec = time.perf_counter()
+        run( command( i ) )
+        afSec.append( time.perf_counter() - fStartSec )
+    return afSec
+
+# importの所要時間の内訳
+# python -X importtime の出力から、自身の所要時間（self）の長いモジュールを返す。[ ( モジュール名, self[秒], cumulative[秒] ), ... ]
+def getImportTimes( strModule, iTop, dictEnv ):
+    completed = subprocess.run( [ sys.executable, "-X", "importtime", "-c", "import %s" % strModule ],
+                                env = dictEnv, check = True, stdout = subprocess.DEVNULL, stderr = subprocess.PIPE, text = True )
+    aImport = []
+    for strLine in completed.stderr.splitlines():
+        # "import time:      self [us] | cumulative | imported package"
+        astrField = strLine.split( "|" )
+        if( (3 != len( astrField )) or (not astrField[0].startswith( "import time:" )) ):
+            continue
+        try:
+            aImport.append( ( astrField[2].strip(), int( astrField[0].split( ":" )[1] ) / 1e6, int( astrField[1] ) / 1e6 ) )
+        except ValueError:
+            continue    # 見出しの行
+    return sorted( aImport, key = lambda tupleImport: -tupleImport[1] )[:iTop]
+
+def main():
+    # 引数の処理
+    parser = argparse.ArgumentParser()
+    parser.add_argument( "--hardware", action = "store_true" )
+    parser.add_argument( "--repeat", type = int, default = REPEAT_DEFAULT )
+    parser.add_argument( "--top", type = int, default = TOP_DEFAULT )
+    parser.add_argument( "--json" )
+    args = parser.parse_args()
+
+    # スクリプトのディレクトリで実行する（radio_*.py と、rda5807m パッケージを参照するため）
+    os.chdir( os.path.dirname( os.path.abspath( __file__ ) ) )
+    compileall.compile_dir( ".", quiet = 1 )
+    dictEnv = dict( os.environ, RADIO_SERVER_SOCKET = SOCKET_PATH_NONE )
+    with tempfile.TemporaryDirectory() as strTempDir:
+        if( not args.hardware ):
+            # シミュレーターの状態をファイルに保存し、プロセスをまたいで引き継ぐ。
+            dictEnv.update( RDA5807M_BUS = "sim", RDA5807M_SIM_STATE = os.path.join( strTempDir, "sim_state.json" ) )
+
+        aResult = []
+        for (strName, astrPrepare, command) in getCases():
+            afSorted = sorted( runCase( strName, astrPrepare, command, args.repeat, dictEnv ) )
+            aResult.append( { "case" : strName,
+                              "runs" : len( afSorted ),
+                              "median_sec" : afSorted[len( afSorted ) // 2],
+                              "min_sec" : afSorted[0],
+                              "max_sec" : afSorted[-1] } )
+        aImport = getImportTimes( "radio_service", args.top, dictEnv )
+
+    # 結果の表示
+    print( "%-15s %6s %12s %10s %10s" % ("case", "runs", "median[ms]", "min[ms]", "max[ms]") )
+    for dictResult in aResult:
+        print( "%-15s %6d %12.1f %10.1f %10.1f" % (dictResult["case"], dictResult["runs"],
+                                                   dictResult["median_sec"] * 1000, dictResult["min_sec"] * 1000, dictResult["max_sec"] * 1000) )
+    print()
+    print( "Slowest imports of radio_service (self / cumulative [ms])" )
+    for (strModule, fSelfSec, fCumulativeSec) in aImport:
+        print( "  %-40s %8.1f %8.1f" % (strModule, fSelfSec * 1000, fCumulativeSec * 1000) )
+
+    if( args.json ):
+        with open( args.json, "w", encoding = "utf-8" ) as file:
+            json.dump( { "cases" : aResult,
+                         "imports" : [ { "module" : strModule, "self_sec" : fSelfSec, "cumulative_sec" : fCumulativeSec }
+                                       for (strModule, fSelfSec, fCumulativeSec) in aImport ] },
+                       file, indent = 2 )
+    return 0
+
+if( "__main__" == __name__ ):
+    sys.exit( main() )
@@ -0,0 +1,59 @@
+# capture_client.py
+# capture_server.py（常駐プロセス）への要求
+# Arguments
+#   argv[1] : Command.
+#             "status"   : 購読者ごとの状態と、レベルを表示する。
+#             "loopback" : ループバック再生（聴取）の開始・終了。
+#             "has"      : 名前が argv[2] で始まる購読者がある場合、終了コード0、ない場合は1。（"record" : 録音中か、"listen" : 聴取中か）
+#             "device"   : キャプチャデバイス名を表示する。
+#   argv[2] : "on" or "off" : "loopback" only.
+#             Subscriber name prefix : "has" only.
+#   argv[3] : Playback device : "loopback" only. Optional. Default is "default".
+# capture_server.pyが起動していない場合の終了コードは、2。
+
+import json
+import sys
+
+from recording.capture_hub import sendHubRequest, getHubSocketPath
+
+def main():
+    # 引数の処理
+    argc = len( sys.argv )
+    if( 1 == argc ):
+        # コマンドの指定がない場合はエラー
+        print( "Error : Command is not specified." )
+        return 254
+    strCommand = sys.argv[1]
+
+    if( "loopback" == strCommand ):
+        dictRequest = { "command" : "loopback", "enable" : (3 > argc) or ("off" != sys.argv[2]),
+                        "device" : sys.argv[3] if (4 <= argc) else "default" }
+    elif( strCommand in ("status", "has", "device") ):
+        dictRequest = { "command" : "status" }
+    else:
+        print( "Error : Unknown command : %s" % strCommand )
+        return 254
+
+    dictResponse = sendHubRequest( getHubSocketPath(), dictRequest )
+    if( dictResponse is None ):
+        print( "Error : Capture server is not running." )
+        return 2
+    if( "ok" != dictResponse["result"] ):
+        print( "Error : %s" % dictResponse["message"] )
+        return 254
+
+    if( "has" == strCommand ):
+        strPrefix = sys.argv[2] if (3 <= argc) else ""
+        return 0 if any( dictSubscriber["name"].startswith( strPrefix ) for dictSubscriber in dictResponse["subscribers"] ) else 1
+    elif( "device" == strCommand ):
+        if( dictResponse["device"] is None ):
+            return 1
+        print( dictResponse["device"] )
+    elif( "status" == strCommand ):
+        print( json.dumps( { key : value for (key, value) in dictResponse.items() if key not in ("result", "message") }, indent = 2 ) )
+    else:
+        print( dictResponse["message"] )
+    return 0
+
+if( "__main__" == __name__ ):
+    sys.exit( main() )
@@ -0,0 +1,47 @@
+# capture_server.py
+# キャプチャデバイスのPCMを1か所で読み込み、録音、聴取（ループバック再生）、レベルメーター等に配る常駐プロセス
+# 録音（record.py --source hub）や配信（radio_stream.py）は、キャプチャデバイスを開く代わりに、このプロセスからPCMを購読する。
+# キャプチャデバイスを開くのは、このプロセスのみになり、録音と聴取を同時に行える。
+# 処理の遅い購読者は、遅れた分のPCMを捨てる。（キャプチャと、他の購読者は止まらない。recording/capture_hub.py 参照）
+# 聴取中か、録音中かは、capture_client.py で、このプロセスの購読者を問い合わせて判定する。（record.pyのプロセスや、module-loopbackの有無で判定しない）
+# Arguments
+#   argv[1]  : Capture source. "alsa[:device]", "wav:path" or "tone[:frequency]" : Optional. Default is "alsa".
+#   --socket : Socket path : Optional. Default is /tmp/capture_hub.sock (or $CAPTURE_HUB_SOCKET).
+
+import argparse
+import os
+import signal
+import threading
+
+from recording.source import openSource
+from recording.capture_hub import CaptureHub, CaptureHubServer, getHubSocketPath
+
+def main():
+    # 引数の処理
+    parser = argparse.ArgumentParser()
+    parser.add_argument( "source", nargs = "?", default = "alsa" )
+    parser.add_argument( "--socket" )
+    args = parser.parse_args()
+    strSocketPath = args.socket if args.socket else getHubSocketPath()
+
+    # キャプチャの開始
+    (strType, _, strDevice) = args.source.partition( ":" )
+    hub = CaptureHub( openSource( args.source ) )
+    server = CaptureHubServer( strSocketPath, hub, (strDevice if strDevice else "default") if ("alsa" == strType) else None )
+    hub.start()
+
+    # SIGTERM、SIGINTで終了する（serve_forever()と別のスレッドから、shutdown()を呼ぶ）
+    def stop( iSignal, frame ):
+        threading.Thread( target = server.shutdown ).start()
+    signal.signal( signal.SIGTERM, stop )
+    signal.signal( signal.SIGINT, stop )
+
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        hub.stop()
+        os.unlink( strSocketPath )
+
+if( "__main__" == __name__ ):
+    main()
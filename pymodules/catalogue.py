@@ -0,0 +1,157 @@
+# catalogue.py
+# 録音の目録（sqlite）の更新、検索と、保持期間を過ぎた録音の削除
+# record.py、transcoder.py が、録音・変換の終了時に録音を追加する。（recording/catalogue.py 参照）
+# Arguments
+#   argv[1] : Command.
+#             "add"        : 録音ファイル（argv[2]以降）を追加・更新する。（ファイルがない場合は、目録から削除する）
+#             "scan"       : ディレクトリ（argv[2]以降。サブディレクトリを含む）の録音ファイルと、目録を一致させる。
+#             "list"       : 録音を、開始時刻の新しい順に表示する。
+#             "programmes" : 予約録音ごとの録音数、合計サイズ、合計録音時間を表示する。
+#             "retain"     : 保持期間を過ぎた録音を、目録とファイルから削除する。
+#   --name      : Scheduled recording name : "list", "retain" only. Optional.
+#   --frequency : Frequency [MHz] : "list" only. Optional.
+#   --since     : Start date "YYYY-MM-DD" : "list" only. Optional.
+#   --limit     : Maximum number of recordings : "list" only. Optional.
+#   --json      : Output in JSON : "list", "programmes" only. Optional.
+#   --dir       : Target directory : "list", "retain" only. Optional. Default is all recordings.
+#   --keep      : Keep the latest N recordings of each scheduled recording : "retain" only. Optional.
+#   --quota     : Maximum total size (e.g. "500M", "20G") : "retain" only. Optional.
+#   --max-days  : Maximum age [day] : "retain" only. Optional.
+#   --dry-run   : Show recordings to delete without deleting : "retain" only. Optional.
+#   --db        : Catalogue file path : Optional. Default is recordings.db in the repository root (or $RECORDING_CATALOGUE).
+
+import argparse
+import datetime
+import json
+import os
+import sys
+
+from recording.catalogue import RecordingCatalogue
+
+# 目録のファイルのパス（リポジトリのルート。環境変数 RECORDING_CATALOGUE で変更可能）
+CATALOGUE_PATH_DEFAULT = os.path.join( os.path.dirname( os.path.abspath( __file__ ) ), "..", "recordings.db" )
+
+SIZE_UNITS = { "K" : 1024, "M" : 1024 ** 2, "G" : 1024 ** 3, "T" : 1024 ** 4 }
+
+# 目録のファイルのパスの取得
+def getCataloguePath():
+    return os.environ.get( "RECORDING_CATALOGUE", CATALOGUE_PATH_DEFAULT )
+
+# 録音ファイルの追加（録音・変換の終了時に使用する）
+# 目録に書き込めない場合も、録音は成功しているので、例外は送出せず、エラーメッセージを返す。正常時はNoneを返す。
+def addRecordings( astrPath, strCataloguePath = None ):
+    try:
+        catalogue = RecordingCatalogue( strCataloguePath if strCataloguePath else getCataloguePath() )
+        try:
+            for strPath in astrPath:
+                catalogue.add( strPath )
+        finally:
+            catalogue.close()
+    except Exception as e:
+        return "Recording could not be catalogued. %s" % e
+    return None
+
+# サイズの指定（"500M"、"20G"等）の解析
+def parseSize( strSize ):
+    strSize = strSize.strip().upper().rstrip( "B" )
+    if( strSize[-1:] in SIZE_UNITS ):
+        return int( float( strSize[:-1] ) * SIZE_UNITS[strSize[-1]] )
+    return int( strSize )
+
+# 録音の表示
+def printEntries( aEntry ):
+    for entry in aEntry:
+        print( "%s %5s %7s %8s %4s %8s  %s" % (datetime.datetime.fromtimestamp( entry.start ).strftime( "%Y/%m/%d %H:%M" ),
+                                               "" if (entry.frequency is None) else "%.1f" % (entry.frequency / 1000.0),
+                                               "" if (entry.duration is None) else "%dm%02ds" % divmod( int( entry.duration ), 60 ),
+                                               _formatSize( entry.size ),
+                                               "" if (entry.rssi_min is None) else str( entry.rssi_min ),
+                                               "" if (entry.dropouts is None) else "%d drop" % entry.dropouts,
+                                               entry.path) )
+
+def _formatSize( iBytes ):
+    for strUnit in ( "", "K", "M", "G" ):
+        if( (iBytes < 1024) or ("G" == strUnit) ):
+            return ("%d%s" % (iBytes, strUnit)) if ("" == strUnit) else ("%.1f%s" % (iBytes, strUnit))
+        iBytes /= 1024.0
+
+def main():
+    # 引数の処理
+    parser = argparse.ArgumentParser()
+    parser.add_argument( "command", choices = ( "add", "scan", "list", "programmes", "retain" ) )
+    parser.add_argument( "paths", nargs = "*" )
+    parser.add_argument( "--name" )
+    parser.add_argument( "--frequency", type = float )
+    parser.add_argument( "--since" )
+    parser.add_argument( "--limit", type = int )
+    parser.add_argument( "--json", action = "store_true" )
+    parser.add_argument( "--dir" )
+    parser.add_argument( "--keep", type = int )
+    parser.add_argument( "--quota", type = parseSize )
+    parser.add_argument( "--max-days", type = float )
+    parser.add_argument( "--dry-run", action = "store_true" )
+    parser.add_argument( "--db", default = None )
+    args = parser.parse_args()
+
+    catalogue = RecordingCatalogue( args.db if args.db else getCataloguePath() )
+    try:
+        if( "add" == args.command ):
+            for strPath in args.paths:
+                if( catalogue.add( strPath ) is None ):
+                    print( "Not found : %s" % strPath )
+
+        elif( "scan" == args.command ):
+            for strDir in (args.paths if args.paths else [ "." ]):
+                (iAdded, iUpdated, iRemoved) = catalogue.scan( strDir )
+                print( "%s : %d added, %d updated, %d removed." % (strDir, iAdded, iUpdated, iRemoved) )
+
+        elif( "list" == args.command ):
+            fFrom = None if (args.since is None) else datetime.datetime.strptime( args.since, "%Y-%m-%d" ).timestamp()
+            aEntry = catalogue.find( args.name, None if (args.frequency is None) else int( round( args.frequency * 1000 ) ),
+                                     fFrom = fFrom, strDir = args.dir, iLimit = args.limit )
+            if( args.json ):
+                print( json.dumps( [ entry._asdict() for entry in aEntry ], indent = 2, ensure_ascii = False ) )
+            else:
+                printEntries( aEntry )
+
+        elif( "programmes" == args.command ):
+            aProgramme = catalogue.getProgrammes()
+            if( args.json ):
+                print( json.dumps( [ { "name" : strName, "recordings" : iCount, "size" : iSize, "duration" : fDuration, "latest" : fLatest }
+                                     for (strName, iCount, iSize, fDuration, fLatest) in aProgramme ], indent = 2, ensure_ascii = False ) )
+            else:
+                for (strName, iCount, iSize, fDuration, fLatest) in aProgramme:
+                    print( "%4d %8s %7.1fh  %s  %s" % (iCount, _formatSize( iSize ), (fDuration or 0) / 3600,
+                                                       datetime.datetime.fromtimestamp( fLatest ).strftime( "%Y/%m/%d %H:%M" ), strName) )
+                print( "Total : %s" % _formatSize( catalogue.getTotalSize() ) )
+
+        elif( "retain" == args.command ):
+            if( (args.keep is None) and (args.quota is None) and (args.max_days is None) ):
+                parser.error( "retain requires --keep, --quota or --max-days" )
+            # 予約録音ごとの件数、経過日数で削除してから、残った録音で合計サイズの上限を判定する。
+            dictExpired = {}
+            if( args.keep is not None ):
+                dictExpired.update( (entry.path, entry) for entry in catalogue.selectBeyondCount( args.keep, args.name, args.dir ) )
+            if( args.max_days is not None ):
+                dictExpired.update( (entry.path, entry) for entry in catalogue.selectOlderThan( args.max_days * 86400, args.name, args.dir ) )
+            if( not args.dry_run ):
+                catalogue.remove( list( dictExpired.values() ) )
+            if( args.quota is not None ):
+                aEntry = catalogue.selectBeyondQuota( args.quota, args.dir )
+                if( args.dry_run ):
+                    # 件数、経過日数の分を削除せずに判定するので、実際の削除より多く表示される場合がある。
+                    aEntry = [ entry for entry in aEntry if entry.path not in dictExpired ]
+                dictExpired.update( (entry.path, entry) for entry in aEntry )
+                if( not args.dry_run ):
+                    catalogue.remove( aEntry )
+
+            aExpired = sorted( dictExpired.values(), key = lambda entry: entry.start )
+            printEntries( aExpired )
+            print( "%s %d recordings (%s)." % ("Would delete" if args.dry_run else "Deleted", len( aExpired ),
+                                               _formatSize( sum( entry.size for entry in aExpired ) )) )
+    finally:
+        catalogue.close()
+    return 0
+
+if( "__main__" == __name__ ):
+    sys.exit( main() )
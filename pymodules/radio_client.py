@@ -0,0 +1,164 @@
+# radio_client.py
+# ラジオの操作を、常駐プロセス（radio_server.py）に要求する
+# radio_server.pyが起動していない場合は、このプロセス内でラジオを直接操作する。
+# Arguments
+#   argv[1] : Command. "on", "tune", "off", "status", "scan", "seek", "station", "acquire", "release", "tuners", "rds", "signal", "metrics" or "server".
+#             "server" : radio_server.pyが応答する場合、終了コード0、応答しない場合は2。（このプロセス内では操作しない）
+#   argv[2] : Frequency [MHz] : "on" and "tune". Optional for "station".
+#             Minimum RSSI of stations : "scan" only. Optional.
+#             Direction. "up" or "down" : "seek" only. Optional. Default is "up".
+#             Job name : "acquire", "release" and "signal".
+#   argv[3] : Quiet mode. Suppress messages. Not radio mute. "0" is not Quiet mode. ("off" : argv[2])
+#             Frequency [MHz] : "acquire" only.
+#   argv[4] : Quiet mode : "acquire" only. Quiet modeでは、割り当てられたチューナーのキャプチャデバイスのみを出力する。
+#             Quiet mode : "release" : argv[3]
+#   argv[5] : Signal series file path : "acquire" only. Optional. 指定すると、録音中の受信状態を監視し、ファイルに書き出す。
+
+import json
+import os
+import socket
+import sys
+import time
+
+# 常駐プロセスのソケットファイルのパス（環境変数 RADIO_SERVER_SOCKET で変更可能）
+SOCKET_PATH_DEFAULT = "/tmp/radio_server.sock"
+
+# ソケットファイルのパスの取得
+def getSocketPath():
+    return os.environ.get( "RADIO_SERVER_SOCKET", SOCKET_PATH_DEFAULT )
+
+# 要求の送信と、応答の受信
+# 常駐プロセスに接続できない場合は、Noneを返す。
+def sendRequest( dictRequest, strSocketPath = None ):
+    sock = socket.socket( socket.AF_UNIX, socket.SOCK_STREAM )
+    try:
+        sock.connect( strSocketPath if strSocketPath else getSocketPath() )
+    except OSError:
+        sock.close()
+        return None
+
+    with sock, sock.makefile( "rwb" ) as file:
+        file.write( (json.dumps( dictRequest ) + "\n").encode() )
+        file.flush()
+        byLine = file.readline()
+    # 常駐プロセスが応答せずに切断した場合は、エラーとする。（常駐プロセスに接続できない場合と区別するため、Noneは返さない）
+    if( not byLine ):
+        return { "result" : "error", "message" : "No response from radio server." }
+    return json.loads( byLine )
+
+# 要求の処理
+# 常駐プロセスに接続できない場合は、このプロセス内でラジオを直接操作する。
+def request( dictRequest ):
+    dictResponse = sendRequest( dictRequest )
+    if( dictResponse is None ):
+        from radio_service import RadioService     # 常駐プロセス使用時は、smbus等のimportを省略するため、ここでimportする。
+        dictResponse = RadioService( bThreaded = False ).handleRequest( dictRequest )     # 1回の要求のみなので、I2Cバスの専用スレッドは使わない。
+    return dictResponse
+
+# ラジオ操作の要求先の作成（常駐するプロセスから、繰り返し要求する場合に使用する）
+# radio_server.py が起動している場合は常駐プロセスに、起動していない場合はこのプロセス内のRadioServiceに要求する。
+def createRequester():
+    if( sendRequest( { "command" : "tuners" } ) is not None ):
+        return lambda dictRequest: sendRequest( dictRequest ) or { "result" : "error", "message" : "Radio server is not running." }
+    from radio_service import RadioService
+    service = RadioService()
+    return service.handleRequest
+
+def main():
+    # 引数の処理
+    argc = len( sys.argv )
+    if( 1 == argc ):
+        # コマンドの指定がない場合はエラー
+        print( "Error : Command is not specified." )
+        sys.exit(254)
+    strCommand = sys.argv[1]
+
+    if( "server" == strCommand ):
+        # 常駐プロセスの生存確認（異常終了で残ったソケットファイルには接続できないので、応答しない扱いになる）
+        sys.exit( 0 if (sendRequest( { "command" : "tuners" } ) is not None) else 2 )
+
+    dictRequest = { "command" : strCommand }
+    iQuietArg = 2
+    if( strCommand in ("on", "tune") ):
+        if( 2 == argc ):
+            # 周波数の指定がない場合はエラー
+            print( "Error : Frequency is not specified." )
+            sys.exit(254)
+        dictRequest["frequency"] = sys.argv[2]
+        iQuietArg = 3
+    elif( ("scan" == strCommand) and (3 <= argc) ):
+        dictRequest["rssi_min"] = sys.argv[2]
+        iQuietArg = 3
+    elif( ("seek" == strCommand) and (3 <= argc) ):
+        dictRequest["direction"] = sys.argv[2]
+        iQuietArg = 3
+    elif( ("station" == strCommand) and (3 <= argc) ):
+        dictRequest["frequency"] = sys.argv[2]
+        iQuietArg = 3
+    elif( strCommand in ("acquire", "release", "signal") ):
+        if( 2 == argc ):
+            # ジョブ名の指定がない場合はエラー
+            print( "Error : Job name is not specified." )
+            sys.exit(254)
+        dictRequest["job"] = sys.argv[2]
+        iQuietArg = 3
+        if( "acquire" == strCommand ):
+            if( 3 == argc ):
+                # 周波数の指定がない場合はエラー
+                print( "Error : Frequency is not specified." )
+                sys.exit(254)
+            dictRequest["frequency"] = sys.argv[3]
+            iQuietArg = 4
+            if( 6 <= argc ):
+                dictRequest["signal_path"] = sys.argv[5]
+    bQuiet = True if ((iQuietArg + 1 <= argc) and ("0" != sys.argv[iQuietArg])) else False  # "0"以外は、Quiet mode
+    dictRequest["wait"] = not bQuiet    # サイレントモード時は、チューニング完了を待たない
+
+    # ラジオの処理
+    dictResponse = request( dictRequest )
+
+    if( "ok" != dictResponse["result"] ):
+        print( "Error : %s" % dictResponse["message"] )
+        sys.exit(254)
+
+    if( bQuiet and ("capture_device" in dictResponse) ):
+        # acquireのQuiet modeでは、キャプチャデバイスのみを出力する（record.shで使用する）
+        print( dictResponse["capture_device"] )
+
+    if( not bQuiet ):
+        print( dictResponse["message"] )
+        if( "tuner" in dictResponse ):
+            print( "  tuner     : %s" % dictResponse["tuner"] )
+        if( "capture_device" in dictResponse ):
+            print( "  capture   : %s" % dictResponse["capture_device"] )
+        if( "frequency" in dictResponse ):
+            print( "  frequency : %4.1f[MHz]" % (dictResponse["frequency"] / 1000.0) )   # 周波数はKHzで得られるので、MHzに変換して表示する。
+        if( "rssi" in dictResponse ):
+            print( "  rssi      : %d" % dictResponse["rssi"] )
+        if( "volume" in dictResponse ):
+            print( "  volume    : %d" % dictResponse["volume"] )
+            print( "  muted     : %s" % dictResponse["muted"] )
+        if( "stereo" in dictResponse ):
+            print( "  stereo    : %s" % dictResponse["stereo"] )
+            print( "  last seen : %s" % time.strftime( "%Y/%m/%d %H:%M:%S", time.localtime( dictResponse["last_seen"] ) ) )
+        for dictStation in dictResponse.get( "stations", [] ):
+            print( "  %5.1f[MHz] rssi : %2d %s" % (dictStation["frequency"] / 1000.0, dictStation["rssi"], "stereo" if dictStation["stereo"] else "mono") )
+        for strKey in ("pi", "ps", "rt", "ct"):
+            if( dictResponse.get( strKey ) is not None ):
+                print( "  %-9s : %s" % (strKey, dictResponse[strKey]) )
+        if( "signal" in dictResponse ):
+            dictSignal = dictResponse["signal"]
+            if( dictSignal["samples"] ):
+                print( "  rssi      : min %d / mean %.1f / max %d" % (dictSignal["rssi_min"], dictSignal["rssi_mean"], dictSignal["rssi_max"]) )
+                print( "  stereo    : %.0f%%" % (dictSignal["stereo_ratio"] * 100) )
+            print( "  dropouts  : %d (%.0f[sec])" % (dictSignal["dropouts"], dictSignal["dropout_sec"]) )
+        if( "prometheus" in dictResponse ):
+            # 計測結果は、Prometheusのテキスト形式で出力する
+            sys.stdout.write( dictResponse["prometheus"] )
+        for dictTuner in dictResponse.get( "tuners", [] ):
+            print( "  %-8s %-12s %s %s" % (dictTuner["tuner"], dictTuner["capture_device"],
+                                          ("%5.1f[MHz]" % (dictTuner["frequency"] / 1000.0)) if dictTuner["powered"] else "off       ",
+                                          ",".join( dictTuner["jobs"] )) )
+
+if( "__main__" == __name__ ):
+    main()
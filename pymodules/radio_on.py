@@ -20,11 +20,10 @@ bQuiet = True if ((3 <= argc) and ("0" != sys.argv[2])) else False  # "0"以外
 radio = RDA5807M()
 
 # ラジオの電源を入れる
+# 既に同じ設定で電源が入っていて、同じ周波数に合っている場合は、初期化とチューニングを省略する。（音声が途切れない）
 if( bQuiet ):
-    radio.begin()
-    radio.setFrequency( int(float(strFrequencyMHz) * 1000), False ) # 周波数はMHzをKHzに変換して渡す。サイレントモード時は、チューニング完了を待たない
+    radio.ensureTuned( int(float(strFrequencyMHz) * 1000), False )  # 周波数はMHzをKHzに変換して渡す。サイレントモード時は、チューニング完了を待たない
 else:
-    radio.begin()
-    radio.setFrequency( int(float(strFrequencyMHz) * 1000) )        # 周波数はMHzをKHzに変換して渡す。
+    radio.ensureTuned( int(float(strFrequencyMHz) * 1000) )         # 周波数はMHzをKHzに変換して渡す。
     print( "Radio turned on.")
     print( "  frequency : %4.1f[MHz]" % (radio.getFrequency() / 1000.0) )   # 周波数はKHzで得られるので、MHzに変換して表示する。
@@ -0,0 +1,302 @@
+# radio_scheduler.py
+# 番組表（timetable.json）に従って、予約録音を行う常駐プロセス
+# 録音ごとのcron設定の代わりに使用する。
+# - 起動時と番組表の変更時に、チューナーの割り当てを計画し、チューナーが足りない（時間が重なる）録音を、事前に検出して表示する。
+# - 録音開始の PREROLL_SEC 秒前に、チューナーを確保して周波数を設定する。（チューナーの起動で、録音の先頭が欠けない）
+# - 連続する録音は、同じチューナーで、電源を切らずに周波数の変更のみで録音する。
+# - ラジオの操作は、radio_server.py（常駐プロセス）が起動している場合は常駐プロセス経由で、起動していない場合はこのプロセス内で行う。
+# Arguments
+#   argv[1]  : Timetable file path : Optional. Default is timetable.json in the repository root.
+#   --check  : Check mode. 割り当ての計画と競合を表示して終了する。競合がある場合の終了コードは1。 : Optional.
+#   --days   : Days to show in check mode : Optional. Default is 7.
+#
+# 番組表の形式は、recording/timetable.py 参照。
+
+import argparse
+import datetime
+import os
+import queue
+import signal
+import subprocess
+import sys
+import threading
+
+from radio_client import createRequester
+from catalogue import addRecordings
+from recording.timetable import loadTimetable, expandSlots, planSlots, getOutputPath
+from rda5807m.tuner_pool import loadTunerConfigs
+from rda5807m.signal_monitor import getSeriesPath
+
+# 番組表ファイルのパス（リポジトリのルート）
+TIMETABLE_PATH_DEFAULT = os.path.join( os.path.dirname( os.path.abspath( __file__ ) ), "..", "timetable.json" )
+# チューナー構成のファイルのパス（radio_service.py と同じ）
+TUNER_CONFIG_PATH_DEFAULT = os.path.join( os.path.dirname( os.path.abspath( __file__ ) ), "..", "tuners.json" )
+# 録音のスクリプトのパス
+RECORD_SCRIPT_PATH = os.path.join( os.path.dirname( os.path.abspath( __file__ ) ), "record.py" )
+
+PREROLL_SEC = 10            # 録音開始の何秒前に、チューナーを確保するか
+KEEP_WARM_SEC = 180         # 次の録音までの間隔がこの秒数以下の場合は、チューナーの電源を切らない
+DISPATCH_AHEAD_SEC = 60     # チューナーの確保の何秒前に、録音枠をチューナーごとのスレッドに渡すか
+PLAN_INTERVAL_SEC = 30      # 計画の更新間隔[秒]
+PLAN_HORIZON_DAYS = 1       # 計画する期間[日]
+
+# --- クラス定義 ---
+
+# チューナーごとの録音スレッド
+# 割り当てられた録音枠を、順に録音する。
+class TunerWorker( threading.Thread ):
+    strTuner = None
+    dtBusyUntil = None          # 受け取った録音枠の、最後の終了時刻
+    _queue = None
+    _requester = None
+    _eventStop = None
+    _strJobHeld = None          # 確保中のジョブ名（録音後、次の録音のためにチューナーを確保し続けている場合を含む）
+    _strRecordedPath = None     # 確保中のジョブで録音したファイルのパス
+
+    def __init__( self, strTuner, requester, eventStop ):
+        threading.Thread.__init__( self, name = "tuner-%s" % strTuner, daemon = True )
+        self.strTuner = strTuner
+        self._queue = queue.Queue()
+        self._requester = requester
+        self._eventStop = eventStop
+
+    # 録音枠を渡す
+    def dispatch( self, slot ):
+        self.dtBusyUntil = slot.end
+        self._queue.put( slot )
+
+    # 終了要求
+    def shutdown( self ):
+        self._queue.put( None )
+
+    def run( self ):
+        while( True ):
+            try:
+                slot = self._queue.get( timeout = KEEP_WARM_SEC if (self._strJobHeld is not None) else None )
+            except queue.Empty:
+                # 次の録音がないので、チューナーを解放する。
+                self._release()
+                continue
+            if( slot is None ):
+                break
+
+            # 録音枠ごとのエラー（チューニングのタイムアウト、I2Cバス、ファイルのエラー等）で、スレッドを終了しない。（以降の録音枠を録音する）
+            try:
+                if( self._runSlot( slot ) ):
+                    break
+            except Exception as e:
+                _log( "Error : %s failed. %s" % (_getJobName( slot ), e) )
+                self._release()
+
+        self._release()
+
+    # 録音枠の録音（終了要求があった場合は、Trueを返す）
+    def _runSlot( self, slot ):
+        dtAcquire = slot.start - datetime.timedelta( seconds = PREROLL_SEC )
+        if( KEEP_WARM_SEC < _secondsUntil( dtAcquire ) ):
+            # 次の録音まで間隔があるので、チューナーを解放する。
+            self._release()
+        if( self._eventStop.wait( max( 0, _secondsUntil( dtAcquire ) ) ) ):
+            return True
+
+        # 次の録音のジョブでチューナーを確保してから、前の録音のジョブを解放する。（チューナーの電源は切れずに、周波数のみ変更される）
+        strJob = _getJobName( slot )
+        # 録音中の受信状態は、録音ファイルと同じディレクトリの時系列ファイルに書き出す。
+        strSignalPath = getSeriesPath( getOutputPath( slot ) )
+        os.makedirs( os.path.dirname( strSignalPath ), exist_ok = True )
+        dictResponse = self._requester( { "command" : "acquire", "job" : strJob, "frequency" : slot.entry.frequency, "tuner" : self.strTuner,
+                                          "signal_path" : strSignalPath } )
+        if( "ok" != dictResponse["result"] ):
+            _log( "Error : %s could not start. %s" % (strJob, dictResponse["message"]) )
+            return False
+        self._release()
+        self._strJobHeld = strJob
+
+        if( self._eventStop.wait( max( 0, _secondsUntil( slot.start ) ) ) ):
+            return True
+        self._record( slot, dictResponse["capture_device"] )
+        return False
+
+    # 録音
+    def _record( self, slot, strCaptureDevice ):
+        fLengthSec = _secondsUntil( slot.end )
+        if( 0 >= fLengthSec ):
+            return
+        strOutputPath = getOutputPath( slot )
+        os.makedirs( os.path.dirname( strOutputPath ), exist_ok = True )
+
+        astrCommand = [ sys.executable, RECORD_SCRIPT_PATH, "%.1f" % fLengthSec, strOutputPath,
+                        "--bitrate", str( slot.entry.bitrate ),
+                        "--source", "alsa:%s" % strCaptureDevice,
+                        "--dropout", "--job", self._strJobHeld, "--tuner", self.strTuner,
+                        "--quiet" ]
+        if( slot.entry.wav2mp3 ):
+            astrCommand.append( "--deferred" )
+        if( slot.entry.segment_sec is not None ):
+            astrCommand += [ "--segment-sec", str( slot.entry.segment_sec ), "--concat" ]
+        if( slot.entry.transcode is not None ):
+            astrCommand += [ "--transcode", ",".join( ( "mp3_%d" % slot.entry.bitrate, ) + slot.entry.transcode ) ]
+
+        self._strRecordedPath = strOutputPath
+        _log( "Recording started. %s (%s)" % (strOutputPath, self.strTuner) )
+        process = subprocess.Popen( astrCommand )
+        while( True ):
+            try:
+                process.wait( timeout = 1 )
+                break
+            except subprocess.TimeoutExpired:
+                if( self._eventStop.is_set() ):
+                    # 終了要求時は、録音済みの分を保存して終了させる。
+                    process.terminate()
+        _log( "Recording finished. %s (exit code %d)" % (strOutputPath, process.returncode) )
+
+    # 確保中のチューナーの解放
+    # 受信状態の集計は解放時に書き出されるので、録音の目録の、録音したファイルの項目を更新する。（record.py が録音の終了時に追加済み）
+    def _release( self ):
+        if( self._strJobHeld is not None ):
+            strJob = self._strJobHeld
+            self._strJobHeld = None
+            try:
+                self._requester( { "command" : "release", "job" : strJob } )
+            except Exception as e:
+                _log( "Error : %s could not be released. %s" % (strJob, e) )
+        if( self._strRecordedPath is not None ):
+            if( os.path.exists( self._strRecordedPath ) ):
+                strError = addRecordings( [ self._strRecordedPath ] )
+                if( strError is not None ):
+                    _log( "Warning : %s" % strError )
+            self._strRecordedPath = None
+
+# スケジューラー
+class Scheduler:
+    _strTimetablePath = None
+    _fTimetableMTime = None
+    _aEntry = None
+    _aWorker = None
+    _setDispatched = None       # 録音スレッドに渡した録音枠（予約録音名、開始時刻）
+    _setReported = None         # 競合を表示した録音枠
+    _eventStop = None
+
+    def __init__( self, strTimetablePath, astrTuner, requester ):
+        self._strTimetablePath = strTimetablePath
+        self._eventStop = threading.Event()
+        self._aWorker = [ TunerWorker( strTuner, requester, self._eventStop ) for strTuner in astrTuner ]
+        self._setDispatched = set()
+        self._setReported = set()
+
+    # 実行（stop()が呼ばれるまで戻らない）
+    def run( self ):
+        for worker in self._aWorker:
+            worker.start()
+        try:
+            while( not self._eventStop.is_set() ):
+                self._update()
+                self._eventStop.wait( PLAN_INTERVAL_SEC )
+        finally:
+            for worker in self._aWorker:
+                worker.shutdown()
+            for worker in self._aWorker:
+                worker.join()
+
+    # 終了要求（シグナルハンドラーから呼び出す）
+    def stop( self ):
+        self._eventStop.set()
+
+    # 計画の更新と、開始が近い録音枠の、録音スレッドへの受け渡し
+    def _update( self ):
+        self._reloadTimetable()
+
+        dtNow = datetime.datetime.now()
+        iLengthMax = max( [ entry.length_minute for entry in self._aEntry ], default = 0 )
+        aSlot = [ slot for slot in expandSlots( self._aEntry, dtNow - datetime.timedelta( minutes = iLengthMax ), dtNow + datetime.timedelta( days = PLAN_HORIZON_DAYS ) )
+                  if (dtNow < slot.end) and (_slotKey( slot ) not in self._setDispatched) ]
+        aBusyUntil = [ worker.dtBusyUntil for worker in self._aWorker ]
+
+        for planned in planSlots( aSlot, len( self._aWorker ), aBusyUntil ):
+            if( planned.tuner is None ):
+                if( _slotKey( planned.slot ) not in self._setReported ):
+                    self._setReported.add( _slotKey( planned.slot ) )
+                    _log( "Conflict : %s" % _formatConflict( planned ) )
+                continue
+            if( DISPATCH_AHEAD_SEC + PREROLL_SEC < _secondsUntil( planned.slot.start ) ):
+                continue
+            self._setDispatched.add( _slotKey( planned.slot ) )
+            self._aWorker[planned.tuner].dispatch( planned.slot )
+
+    # 番組表ファイルが変更されていれば、読み込み直す
+    # 番組表ファイルが削除された、置き換え中の場合は、前回の番組表のまま、次回に再確認する。（警告は1回のみ出力する）
+    def _reloadTimetable( self ):
+        try:
+            fMTime = os.path.getmtime( self._strTimetablePath )
+            if( fMTime == self._fTimetableMTime ):
+                return
+            self._aEntry = loadTimetable( self._strTimetablePath )
+        except OSError as e:
+            if( self._aEntry is None ):
+                raise
+            if( self._fTimetableMTime is not None ):
+                _log( "Warning : Timetable could not be read. %s (keep the previous timetable)" % e )
+            self._fTimetableMTime = None
+            return
+        except ValueError as e:
+            if( self._aEntry is None ):
+                raise
+            _log( "Error : %s (keep the previous timetable)" % e )
+        self._fTimetableMTime = fMTime
+        self._setReported.clear()
+        _log( "Timetable loaded. %d entries." % len( self._aEntry ) )
+
+# --- 関数定義 ---
+
+# 録音枠のジョブ名
+def _getJobName( slot ):
+    return "schedule_%s_%s" % (slot.entry.name, slot.start.strftime( "%Y%m%d%H%M" ))
+
+# 割り当ての計画と競合の表示（--check）
+def checkTimetable( strTimetablePath, iTunerCount, iDays ):
+    dtNow = datetime.datetime.now()
+    aPlanned = planSlots( expandSlots( loadTimetable( strTimetablePath ), dtNow, dtNow + datetime.timedelta( days = iDays ) ), iTunerCount )
+    for planned in aPlanned:
+        strTuner = ("tuner %d" % planned.tuner) if (planned.tuner is not None) else "CONFLICT"
+        print( "%s - %s  %-8s %5.1f[MHz] %s" % (planned.slot.start.strftime( "%m/%d %H:%M" ), planned.slot.end.strftime( "%H:%M" ),
+                                               strTuner, planned.slot.entry.frequency, planned.slot.entry.name) )
+    aConflict = [ planned for planned in aPlanned if planned.tuner is None ]
+    for planned in aConflict:
+        print( "Conflict : %s" % _formatConflict( planned ) )
+    return 1 if aConflict else 0
+
+def _slotKey( slot ):
+    return (slot.entry.name, slot.start)
+
+def _secondsUntil( dt ):
+    return (dt - datetime.datetime.now()).total_seconds()
+
+def _formatConflict( planned ):
+    return "%s %s overlaps %s" % (planned.slot.entry.name, planned.slot.start.strftime( "%Y/%m/%d %H:%M" ),
+                                  ", ".join( slot.entry.name for slot in planned.conflicts ))
+
+def _log( strMessage ):
+    print( "%s %s" % (datetime.datetime.now().strftime( "%Y/%m/%d %H:%M:%S" ), strMessage), flush = True )
+
+def main():
+    # 引数の処理
+    parser = argparse.ArgumentParser()
+    parser.add_argument( "timetable_path", nargs = "?", default = TIMETABLE_PATH_DEFAULT )
+    parser.add_argument( "--check", action = "store_true" )
+    parser.add_argument( "--days", type = int, default = 7 )
+    args = parser.parse_args()
+
+    astrTuner = [ config.name for config in loadTunerConfigs( TUNER_CONFIG_PATH_DEFAULT ) ]
+    if( args.check ):
+        return checkTimetable( args.timetable_path, len( astrTuner ), args.days )
+
+    scheduler = Scheduler( args.timetable_path, astrTuner, createRequester() )
+
+    # SIGTERM、SIGINTで終了する（録音中の分は、出力ファイルに書き込む）
+    signal.signal( signal.SIGTERM, lambda iSignal, frame: scheduler.stop() )
+    signal.signal( signal.SIGINT, lambda iSignal, frame: scheduler.stop() )
+
+    scheduler.run()
+
+if( "__main__" == __name__ ):
+    sys.exit( main() )
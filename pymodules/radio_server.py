@@ -0,0 +1,64 @@
+# radio_server.py
+# ラジオを操作する常駐プロセス
+# I2Cバスとラジオ（RDA5807M）を保持し続け、Unixドメインソケット経由で on/tune/off/status の要求を受け付ける。
+# 要求ごとに、Pythonの起動、smbusのimport、I2Cバスのオープン、レジスタの読み込みを行う必要がなくなる。
+# Arguments
+#   argv[1] : Socket path : Optional. Default is radio_client.SOCKET_PATH_DEFAULT (or $RADIO_SERVER_SOCKET).
+#
+# 要求・応答は、1行1件のJSON。（radio_service.py 参照）
+
+import json
+import os
+import signal
+import socketserver
+import sys
+import threading
+
+from radio_client import getSocketPath
+from radio_service import RadioService
+
+# 要求の処理
+class RadioRequestHandler( socketserver.StreamRequestHandler ):
+    def handle( self ):
+        for byLine in self.rfile:
+            try:
+                dictResponse = self.server.service.handleRequest( json.loads( byLine ) )
+            except ValueError as e:
+                dictResponse = { "result" : "error", "message" : "Invalid request : %s" % e }
+            except Exception as e:
+                # I2Cバスのエラー（OSError）、チューニングのタイムアウト（TimeoutError）等も、応答を返して接続を続ける。
+                dictResponse = { "result" : "error", "message" : "%s : %s" % (type( e ).__name__, e) }
+            self.wfile.write( (json.dumps( dictResponse ) + "\n").encode() )
+
+class RadioServer( socketserver.ThreadingMixIn, socketserver.UnixStreamServer ):
+    daemon_threads = True
+
+    def __init__( self, strSocketPath, service ):
+        self.service = service
+
+        # 前回の異常終了等で残っているソケットファイルは削除する。
+        if( os.path.exists( strSocketPath ) ):
+            os.unlink( strSocketPath )
+        socketserver.UnixStreamServer.__init__( self, strSocketPath, RadioRequestHandler )
+
+def main():
+    strSocketPath = sys.argv[1] if (2 <= len( sys.argv )) else getSocketPath()
+
+    server = RadioServer( strSocketPath, RadioService() )
+
+    # SIGTERM（systemctl stop 等）でも、serve_foreverを抜けて、ソケットファイルを削除する。
+    # shutdownは、serve_foreverの終了を待つので、シグナルハンドラ（serve_foreverと同じスレッド）からは、別スレッドで呼ぶ。
+    def stop( iSignal, frame ):
+        threading.Thread( target = server.shutdown ).start()
+    signal.signal( signal.SIGTERM, stop )
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        os.unlink( strSocketPath )
+
+if( "__main__" == __name__ ):
+    main()
@@ -0,0 +1,428 @@
+# radio_service.py
+# ラジオの操作（on/tune/off/status/scan/seek/station/acquire/release/tuners/rds/signal/recover/metrics）を、要求（dict）に対して処理するクラス
+# radio_server.py（常駐プロセス）から使用する。radio_server.pyが起動していない場合は、radio_client.pyからも直接使用する。
+#
+# 要求と応答
+#   要求 : { "command" : "on" | "tune" | "off" | "status" | "scan" | "seek" | "station" | "acquire" | "release" | "tuners" | "rds" | "signal" | "recover" | "metrics",
+#            "frequency" : 周波数[MHz], "wait" : チューニング完了を待つか,
+#            "rssi_min" : 局とみなすRSSIの最小値（scanのみ）, "direction" : "up" | "down"（seekのみ）,
+#            "job" : ジョブ名（acquire、release、signal、recoverのみ。recoverでは省略可）, "signal_path" : 受信状態の時系列ファイルのパス（acquireのみ。省略可）,
+#            "preemptible" : 他の録音と共用できる（聴取と同じ扱いの）ジョブか（acquireのみ。省略時はFalse）,
+#            "action" : "rssi" | "retune" | "restart"（recoverのみ）,
+#            "job" : 横取り可能なジョブ名（tune、seekのみ。省略可。指定すると、そのジョブのチューナーを操作し、
+#                    横取り不可能なジョブ（録音）と共用中の場合は、操作せずに "busy" : True のエラーを返す）,
+#            "tuner" : チューナー名（省略時は、聴取中のチューナー。acquireでは、空いているチューナー） }
+#   応答 : { "result" : "ok" | "error", "message" : メッセージ, ... }
+#
+# チューナー（tuners.json で複数のチューナーを構成できる。rda5807m/tuner_pool.py 参照）
+#   録音は、acquireでチューナーを確保し、releaseで解放する。録音ごとに、空いているチューナーが割り当てられる。
+#   聴取（on/off）は、"listen"ジョブとしてチューナーを確保する。
+#   空いているチューナーがない場合、録音は、聴取中のチューナーを共用する。
+#   ジョブが割り当てられていないチューナーのみ、電源を切る。
+#
+# RDS
+#   rdsの初回の要求で、チューナーのRDSの受信を開始する。以降は、受信済みの局名、ラジオテキスト、時刻を返す。
+#   受信は、チューナーの電源を切るまで続ける。
+#
+# 受信状態の監視
+#   acquireで "signal_path" を指定すると、録音中の受信状態（RSSI、ステレオ等）を監視し、時系列ファイルに書き出す。（rda5807m/signal_monitor.py 参照）
+#   releaseで監視を終了し、録音全体の集計を返す。signalの要求で、録音中の集計を返す。
+#
+# 録音中のチューナーの復旧
+#   recoverの要求で、ジョブのチューナーのRSSIを読み込む（"rssi"）か、同じ周波数に設定し直す（"retune"）か、
+#   電源を入れ直して、同じ周波数に設定する（"restart"）。録音中の無音の検出時に使用する。（recording/dropout.py 参照）
+#
+# 計測
+#   環境変数 RDA5807M_METRICS を設定して起動すると、全チューナーのI2Cトランザクションの回数と所要時間を計測する。
+#   metricsの要求で、計測結果（JSON形式とPrometheusのテキスト形式）を返す。（rda5807m/instrumentation.py 参照）
+#
+# 起動時間
+#   radio_client.py の直接操作では、1回の要求ごとにプロセスを起動するので、起動を速くする。
+#   - スキャン、局インデックス（sqlite3）、RDS、受信状態の監視のモジュールは、その要求の処理時にimportする。
+#   - 局インデックスは、初めて使用する要求の処理時に開く。
+#   - bThreaded = False で、I2Cバスの専用スレッドを使わない。（rda5807m/tuner_pool.py 参照）
+#   - on、acquireでは、チューナーが既に同じ設定、同じ周波数の場合は、初期化とチューニングを省略する。（RDA5807M.ensureTuned()）
+
+import os
+import threading
+from rda5807m.tuner_pool import TunerPool, loadTunerConfigs
+from rda5807m.instrumentation import METRICS_ENV_NAME, BusMetrics, instrumentRadio
+
+# 局インデックスのファイルのパス（リポジトリのルート）
+STATION_INDEX_PATH_DEFAULT = os.path.join( os.path.dirname( os.path.abspath( __file__ ) ), "..", "stations.db" )
+
+# チューナー構成のファイルのパス（リポジトリのルート）。ファイルがない場合は、チューナー1つの構成とする。
+TUNER_CONFIG_PATH_DEFAULT = os.path.join( os.path.dirname( os.path.abspath( __file__ ) ), "..", "tuners.json" )
+
+# 聴取のジョブ名
+LISTEN_JOB = "listen"
+
+class RadioService:
+    _pool = None
+    _index = None
+    _lockIndex = None
+    _dictRDSReader = None       # チューナー名 → RDSの受信
+    _dictSignalMonitor = None   # ジョブ名 → 受信状態の監視
+    _metrics = None             # I2Cトランザクションの計測結果（計測しない場合はNone）
+
+    # コンストラクタ
+    # index     : 局インデックス。Noneの場合は、初めて使用する時に STATION_INDEX_PATH_DEFAULT を開く。
+    # bThreaded : I2Cアクセスを、I2Cバスの専用スレッドで実行するか（poolを指定しない場合のみ有効）
+    def __init__( self, pool = None, index = None, bThreaded = True ):
+        self._pool = pool if pool is not None else TunerPool( loadTunerConfigs( TUNER_CONFIG_PATH_DEFAULT ), bThreaded = bThreaded )
+        self._index = index
+        self._lockIndex = threading.Lock()  # 局インデックスは、複数のI2Cバスのスレッドから使用されるので、排他する。
+        self._dictRDSReader = {}
+        self._dictSignalMonitor = {}
+        if( os.environ.get( METRICS_ENV_NAME ) ):
+            self._metrics = BusMetrics()
+            for tuner in self._pool.getTuners():
+                instrumentRadio( tuner.radio, self._metrics )
+
+    # 要求の処理
+    def handleRequest( self, dictRequest ):
+        if( not isinstance( dictRequest, dict ) ):
+            return _error( "Invalid request : not an object" )
+        strCommand = dictRequest.get( "command" )
+        handler = {
+            "on"     : self._on,
+            "tune"   : self._tune,
+            "off"    : self._off,
+            "status" : self._status,
+            "scan"   : self._scan,
+            "seek"   : self._seek,
+            "station": self._station,
+            "acquire": self._acquire,
+            "release": self._release,
+            "tuners" : self._tuners,
+            "rds"    : self._rds,
+            "signal" : self._signal,
+            "recover": self._recover,
+            "metrics": self._getMetrics,
+        }.get( strCommand )
+        if( handler is None ):
+            return _error( "Unknown command : %s" % strCommand )
+
+        try:
+            return handler( dictRequest )
+        except (KeyError, ValueError, TypeError) as e:
+            return _error( "Invalid request : %s" % e )
+
+    # ラジオの電源を入れ、周波数を設定する
+    def _on( self, dictRequest ):
+        ulFrequency = _frequencyKHz( dictRequest )
+        if( "tuner" in dictRequest ):
+            tuner = self._resolveTuner( dictRequest )
+        else:
+            tuner = self._pool.acquire( LISTEN_JOB, True, ulFrequency = ulFrequency )
+        self._stopRDS( tuner )     # begin()でRDSは無効になるので、受信を止める。
+
+        def run( radio ):
+            radio.ensureTuned( ulFrequency, dictRequest.get( "wait", True ) )
+            return _ok( "Radio turned on.", frequency = radio.getFrequency(), tuner = tuner.strName )
+        return self._run( tuner, run )
+
+    # 周波数を変更する
+    def _tune( self, dictRequest ):
+        ulFrequency = _frequencyKHz( dictRequest )
+        tuner = self._resolveJobTuner( dictRequest )
+
+        def run( radio ):
+            if( not radio.isPoweredUp() ):
+                # ラジオの電源が入っていない場合はエラー
+                return _error( "Radio is not turned on." )
+            dictBusy = _checkRecording( tuner, dictRequest )
+            if( dictBusy is not None ):
+                return dictBusy
+            radio.setFrequency( ulFrequency, dictRequest.get( "wait", True ) )
+            if( "job" in dictRequest ):
+                self._pool.setJobFrequency( dictRequest["job"], ulFrequency )
+            return _ok( "Radio frequency tuned.", frequency = radio.getFrequency(), tuner = tuner.strName )
+        return self._run( tuner, run )
+
+    # ラジオの電源を切る
+    # 聴取のジョブを解放し、チューナーが録音に使用されていない場合のみ、電源を切る。
+    def _off( self, dictRequest ):
+        tuner = self._resolveTuner( dictRequest )
+        if( tuner is self._pool.findJob( LISTEN_JOB ) ):
+            self._pool.release( LISTEN_JOB )
+        if( tuner.isIdle() ):
+            self._stopRDS( tuner )
+
+        def run( radio ):
+            if( not tuner.isIdle() ):
+                # 録音中
+                return _ok( "Now Recording! Skipped Radio-Off." )
+            if( not radio.isPoweredUp() ):
+                # ラジオが電源が既に切れている
+                return _ok( "Radio is already turned off." )
+            radio.end()
+            return _ok( "Radio turned off." )
+        return self._run( tuner, run )
+
+    # ラジオの状態を取得する
+    def _status( self, dictRequest ):
+        tuner = self._resolveTuner( dictRequest )
+
+        def run( radio ):
+            bPoweredUp = radio.isPoweredUp()
+            return _ok( "Radio is turned %s." % ("on" if bPoweredUp else "off"),
+                        tuner = tuner.strName,
+                        powered = bPoweredUp,
+                        frequency = radio.getFrequency(),
+                        rssi = radio.getRSSI(),
+                        volume = radio.getVolume(),
+                        muted = radio.isMuted() )
+        return self._run( tuner, run )
+
+    # バンド全体をスキャンし、局を検出する
+    def _scan( self, dictRequest ):
+        from rda5807m.bandscan import BandScanner, STATION_RSSI_MIN
+
+        def run( radio ):
+            if( not radio.isPoweredUp() ):
+                # ラジオの電源が入っていない場合はエラー
+                return _error( "Radio is not turned on." )
+            result = BandScanner( radio ).scan()
+            aStation = result.findStations( int( dictRequest.get( "rssi_min", STATION_RSSI_MIN ) ) )
+            with self._lockIndex:
+                self._getIndex().updateFromScan( result, aStation )
+            return _ok( "%d stations found in %.1f[sec]." % (len( aStation ), result.fElapsedSec),
+                        stations = [ station._asdict() for station in aStation ] )
+        return self._run( self._resolveTuner( dictRequest ), run )
+
+    # 次の局に移動する（登録済みの局がある場合は、Seekせずに移動する）
+    def _seek( self, dictRequest ):
+        from rda5807m.station_index import seekStation
+
+        def run( radio ):
+            if( not radio.isPoweredUp() ):
+                # ラジオの電源が入っていない場合はエラー
+                return _error( "Radio is not turned on." )
+            dictBusy = _checkRecording( tuner, dictRequest )
+            if( dictBusy is not None ):
+                return dictBusy
+            with self._lockIndex:
+                entry = seekStation( radio, self._getIndex(), "down" != dictRequest.get( "direction", "up" ) )
+            if( entry is None ):
+                return _error( "No station found." )
+            if( "job" in dictRequest ):
+                self._pool.setJobFrequency( dictRequest["job"], entry.frequency )
+            if( entry.last_seen is None ):
+                # Seekで移動したが、局であることを確認できなかった（局インデックスには登録していない）
+                return _ok( "Radio frequency tuned. (Station not confirmed.)", frequency = entry.frequency, confirmed = False )
+            return _ok( "Radio frequency tuned.", frequency = entry.frequency, confirmed = True )
+        tuner = self._resolveJobTuner( dictRequest )
+        return self._run( tuner, run )
+
+    # 局インデックスの参照
+    # 周波数の指定がある場合はその周波数の、ない場合は現在の周波数の局の情報を返す。
+    def _station( self, dictRequest ):
+        from rda5807m.station_index import recordCurrentStation
+
+        def run( radio ):
+            with self._lockIndex:
+                if( "frequency" in dictRequest ):
+                    entry = self._getIndex().get( _frequencyKHz( dictRequest ) )
+                elif( radio.isPoweredUp() ):
+                    entry = recordCurrentStation( radio, self._getIndex() )
+                else:
+                    return _error( "Radio is not turned on." )
+            if( entry is None ):
+                return _error( "Unknown station." )
+            return _ok( "Station found.", frequency = entry.frequency, rssi = entry.rssi, stereo = entry.stereo, last_seen = entry.last_seen )
+        return self._run( self._resolveTuner( dictRequest ), run )
+
+    # 録音用のチューナーを確保し、周波数を設定する
+    # チューナーの電源が既に入っている場合（聴取中のチューナーの共用等）は、初期化せずに周波数のみ設定する。
+    # 既に同じ周波数に合っている場合は、周波数の設定も省略する。（聴取中の音声が途切れない）
+    def _acquire( self, dictRequest ):
+        strJob = dictRequest["job"]
+        ulFrequency = _frequencyKHz( dictRequest )
+        tuner = self._pool.acquire( strJob, bool( dictRequest.get( "preemptible", False ) ), dictRequest.get( "tuner" ), ulFrequency )
+
+        def run( radio ):
+            if( not radio.isPoweredUp() ):
+                radio.ensureTuned( ulFrequency, dictRequest.get( "wait", True ) )
+            elif( not radio.isTunedTo( ulFrequency ) ):
+                radio.setFrequency( ulFrequency, dictRequest.get( "wait", True ) )
+            return _ok( "Tuner acquired.", frequency = radio.getFrequency(), tuner = tuner.strName, capture_device = tuner.strCaptureDevice )
+        try:
+            dictResponse = self._run( tuner, run )
+        except Exception:
+            self._pool.release( strJob )
+            raise
+
+        if( ("ok" == dictResponse["result"]) and dictRequest.get( "signal_path" ) and (strJob not in self._dictSignalMonitor) ):
+            from rda5807m.signal_monitor import SignalMonitor
+            monitor = SignalMonitor( tuner.radio, tuner.call, strSeriesPath = dictRequest["signal_path"] )
+            monitor.start()
+            self._dictSignalMonitor[strJob] = monitor
+        return dictResponse
+
+    # 録音用のチューナーを解放する
+    # チューナーを使用するジョブがなくなった場合は、電源を切る。
+    def _release( self, dictRequest ):
+        monitor = self._dictSignalMonitor.pop( dictRequest["job"], None )
+        dictSignal = {} if (monitor is None) else { "signal" : monitor.stop() }
+        tuner = self._pool.release( dictRequest["job"] )
+        if( tuner is None ):
+            return _ok( "Job is not running.", **dictSignal )
+        if( tuner.isIdle() ):
+            self._stopRDS( tuner )
+
+        def run( radio ):
+            if( (not tuner.isIdle()) or (not radio.isPoweredUp()) ):
+                return _ok( "Tuner released.", tuner = tuner.strName, **dictSignal )
+            radio.end()
+            return _ok( "Tuner released. Radio turned off.", tuner = tuner.strName, **dictSignal )
+        return self._run( tuner, run )
+
+    # 全チューナーの状態を取得する（別々のI2Cバスのチューナーは、並行に読み込む）
+    def _tuners( self, dictRequest ):
+        aTuner = self._pool.getTuners()
+        aState = self._pool.callMany( [ (tuner, _readTunerState) for tuner in aTuner ] )
+        return _ok( "%d tuners." % len( aTuner ),
+                    tuners = [ dict( state, tuner = tuner.strName, capture_device = tuner.strCaptureDevice, jobs = sorted( tuner.dictJob ) )
+                               for (tuner, state) in zip( aTuner, aState ) ] )
+
+    # RDSの受信結果を取得する（受信していない場合は、受信を開始する）
+    def _rds( self, dictRequest ):
+        tuner = self._resolveTuner( dictRequest )
+        if( not self._run( tuner, lambda radio: radio.isPoweredUp() ) ):
+            # ラジオの電源が入っていない場合はエラー
+            return _error( "Radio is not turned on." )
+
+        reader = self._dictRDSReader.get( tuner.strName )
+        if( reader is None ):
+            from rda5807m.rds import RDSReader
+            reader = RDSReader( tuner.radio, tuner.call )
+            reader.start()
+            self._dictRDSReader[tuner.strName] = reader
+            return _ok( "RDS started.", tuner = tuner.strName )
+
+        decoder = reader.decoder
+        return _ok( "RDS %d groups received." % decoder.iGroups,
+                    tuner = tuner.strName,
+                    pi = None if (decoder.iPI is None) else ("%04X" % decoder.iPI),
+                    ps = decoder.strPS,
+                    rt = decoder.strRT,
+                    ct = None if (decoder.dtClockTime is None) else decoder.dtClockTime.isoformat() )
+
+    # 録音中の受信状態の集計を取得する
+    def _signal( self, dictRequest ):
+        monitor = self._dictSignalMonitor.get( dictRequest["job"] )
+        if( monitor is None ):
+            return _error( "Signal is not monitored : %s" % dictRequest["job"] )
+        return _ok( "Signal monitored.", signal = monitor.getSummary() )
+
+    # 録音中のチューナーを復旧する（ジョブの指定がない場合は、_resolveTuner のチューナー）
+    def _recover( self, dictRequest ):
+        strAction = dictRequest.get( "action", "rssi" )
+        if( strAction not in ("rssi", "retune", "restart") ):
+            return _error( "Unknown action : %s" % strAction )
+        ulJobFrequency = None
+        if( "job" in dictRequest ):
+            tuner = self._pool.findJob( dictRequest["job"] )
+            if( tuner is None ):
+                return _error( "Job is not running : %s" % dictRequest["job"] )
+            ulJobFrequency = self._pool.getJobFrequency( dictRequest["job"] )
+        else:
+            tuner = self._resolveTuner( dictRequest )
+        if( "restart" == strAction ):
+            self._stopRDS( tuner )     # begin()でRDSは無効になるので、受信を止める。
+
+        def run( radio ):
+            # restartは、チップがリセットされた（電源が切れた）場合にも行うので、電源の状態（シャドウコピーの値）で中止しない。
+            if( ("restart" != strAction) and (not radio.isPoweredUp()) ):
+                return _error( "Radio is not turned on." )
+            # 設定し直す周波数は、ジョブが要求した周波数。ない場合は、設定済みのCHAN（シャドウコピーの値）。
+            # チップがリセットされると、READCHAN（getFrequency()）は下限の周波数になるので、使用しない。
+            ulFrequency = ulJobFrequency if (ulJobFrequency is not None) else radio.getCHANFrequency()
+            if( "restart" == strAction ):
+                radio.invalidateShadowRegisters()   # チップがリセットされている場合に備えて、シャドウコピーを読み直す。
+                radio.end()
+                radio.begin()
+            if( "rssi" != strAction ):
+                radio.setFrequency( ulFrequency, True )
+            return _ok( "Tuner checked." if ("rssi" == strAction) else "Tuner recovered.",
+                        tuner = tuner.strName, frequency = radio.getFrequency(), rssi = radio.getRSSI() )
+        return self._run( tuner, run )
+
+    # I2Cトランザクションの計測結果を取得する
+    def _getMetrics( self, dictRequest ):
+        if( self._metrics is None ):
+            return _error( "Metrics are disabled. Set %s to enable." % METRICS_ENV_NAME )
+        return _ok( "Metrics collected.", metrics = self._metrics.toDict(), prometheus = self._metrics.toPrometheus() )
+
+    # 局インデックスの取得（初回のみ開く）
+    def _getIndex( self ):
+        if( self._index is None ):
+            from rda5807m.station_index import StationIndex
+            self._index = StationIndex( STATION_INDEX_PATH_DEFAULT )
+        return self._index
+
+    # RDSの受信の停止（I2Cバスの専用スレッドの外から呼び出す）
+    def _stopRDS( self, tuner ):
+        if( tuner is None ):
+            return
+        reader = self._dictRDSReader.pop( tuner.strName, None )
+        if( reader is not None ):
+            reader.stop( False )
+
+    # 要求の対象のチューナーの決定
+    # チューナー名の指定がある場合はそのチューナー、ない場合は聴取中のチューナー、聴取中でない場合は先頭のチューナー。
+    def _resolveTuner( self, dictRequest ):
+        if( "tuner" in dictRequest ):
+            tuner = self._pool.getTuner( dictRequest["tuner"] )
+            if( tuner is None ):
+                raise ValueError( "Unknown tuner : %s" % dictRequest["tuner"] )
+            return tuner
+        tuner = self._pool.findJob( LISTEN_JOB )
+        return tuner if (tuner is not None) else self._pool.getTuners()[0]
+
+    # ジョブ（"job" の指定がない場合は、_resolveTuner()と同じ）のチューナーの取得
+    def _resolveJobTuner( self, dictRequest ):
+        if( "job" not in dictRequest ):
+            return self._resolveTuner( dictRequest )
+        tuner = self._pool.findJob( dictRequest["job"] )
+        if( tuner is None ):
+            raise ValueError( "Job is not running : %s" % dictRequest["job"] )
+        return tuner
+
+    # チューナーでの処理の実行
+    # 複数の要求が同時に同じチューナーを操作しないよう排他し、I2Cバスの専用スレッドで実行する。
+    def _run( self, tuner, func ):
+        if( tuner is None ):
+            return _error( "No tuner available." )
+        with tuner.lock:
+            return tuner.call( func, tuner.radio )
+
+# チューナーの状態の読み込み
+def _readTunerState( radio ):
+    bPoweredUp = radio.isPoweredUp()
+    return { "powered" : bPoweredUp, "frequency" : radio.getFrequency() if bPoweredUp else None }
+
+# 横取り可能なジョブ（"job"）からの操作で、チューナーを録音（横取り不可能なジョブ）と共用中か
+# 共用中の場合はエラー応答を、そうでない場合はNoneを返す。
+def _checkRecording( tuner, dictRequest ):
+    if( "job" not in dictRequest ):
+        return None
+    astrJob = sorted( strJob for (strJob, bPreemptible) in list( tuner.dictJob.items() ) if (not bPreemptible) and (strJob != dictRequest["job"]) )
+    if( not astrJob ):
+        return None
+    return dict( _error( "Tuner is used for recording. (%s)" % ", ".join( astrJob ) ), busy = True )
+
+# 要求の周波数[MHz]を、KHzに変換して返す
+def _frequencyKHz( dictRequest ):
+    return int( float( dictRequest["frequency"] ) * 1000 )
+
+# 正常応答の作成
+def _ok( strMessage, **kwargs ):
+    dictResponse = { "result" : "ok", "message" : strMessage }
+    dictResponse.update( kwargs )
+    return dictResponse
+
+# エラー応答の作成
+def _error( strMessage ):
+    return { "result" : "error", "message" : strMessage }
@@ -0,0 +1,157 @@
+# radio_stream.py
+# ラジオの音声を、HTTPでライブ配信する常駐プロセス
+# チューナーを確保し、キャプチャデバイスのPCMを1回だけエンコードして、全ての聴取者に同じデータを送る。（recording/stream.py 参照）
+# 聴取者の数が増えても、キャプチャとエンコードは1つのまま。読み込みの遅い聴取者は、遅れた分のデータを飛ばす。
+# チューナーは、聴取と同じく、録音と共用できるジョブ（"stream_プロセスID"）として確保する。（予約録音に、空いているチューナーが優先して割り当てられる）
+# ラジオの操作は、radio_server.py（常駐プロセス）が起動している場合は常駐プロセス経由で、起動していない場合はこのプロセス内で行う。
+#
+# URL
+#   /stream.mp3                  : 音声（MP3）
+#   /status                      : ラジオと配信の状態（JSON）
+#   /tune?frequency=周波数[MHz]  : 周波数の変更（JSON）
+#   /seek?direction=up|down      : 次の局に移動（JSON）
+#   チューナーを予約録音と共用中は、/tune、/seek は、周波数を変更せずに 409 を返す。（録音中の周波数を変えない）
+# Arguments
+#   argv[1]    : Frequency [MHz]
+#   --port     : HTTP port : Optional. Default is 8000.
+#   --bind     : Bind address : Optional. Default is 127.0.0.1 (this host only). "0.0.0.0" for all interfaces.
+#   --bitrate  : Bit rate for mp3 stream [kbps] : Optional. Default is 128[kbps].
+#   --source   : Capture source. "alsa[:device]", "hub[:socket path]", "wav:path" or "tone[:frequency]" : Optional.
+#                Default is the capture device of the acquired tuner.
+#                （capture_server.py がそのキャプチャデバイスを読み込んでいる場合は、capture_server.py から購読する）
+#   --tuner    : Tuner name : Optional. Default is a free tuner.
+
+import argparse
+import http.server
+import json
+import math
+import os
+import signal
+import sys
+import threading
+import urllib.parse
+
+from radio_client import createRequester
+from recording.source import openSource
+from recording.encoder import createEncoder
+from recording.stream import StreamBroadcaster
+from recording.capture_hub import HubSource, sendHubRequest, getHubSocketPath
+
+STREAM_CONTENT_TYPE = "audio/mpeg"
+BIND_ADDRESS_DEFAULT = "127.0.0.1"  # 他のPCやスマートフォンから聴取する場合は、--bind 0.0.0.0 を指定する
+
+# HTTPの要求の処理
+class StreamRequestHandler( http.server.BaseHTTPRequestHandler ):
+    # server には、broadcaster、requester、strTuner、strJob を設定しておく。
+
+    def do_GET( self ):
+        url = urllib.parse.urlparse( self.path )
+        dictQuery = dict( urllib.parse.parse_qsl( url.query ) )
+        if( "/stream.mp3" == url.path ):
+            self._sendStream()
+        elif( "/status" == url.path ):
+            dictResponse = self.server.requester( { "command" : "status", "tuner" : self.server.strTuner } )
+            dictResponse["stream"] = self.server.broadcaster.getStatistics()
+            self._sendJson( dictResponse )
+        elif( ("/tune" == url.path) and ("frequency" in dictQuery) ):
+            try:
+                fFrequency = float( dictQuery["frequency"] )
+            except ValueError:
+                fFrequency = math.nan
+            if( not math.isfinite( fFrequency ) ):
+                self.send_error( 400, "Invalid frequency : %s" % dictQuery["frequency"] )
+                return
+            self._sendJson( self.server.requester( { "command" : "tune", "job" : self.server.strJob, "frequency" : fFrequency } ) )
+        elif( ("/seek" == url.path) and (dictQuery.get( "direction", "up" ) not in ("up", "down")) ):
+            self.send_error( 400, "Invalid direction : %s" % dictQuery["direction"] )
+        elif( "/seek" == url.path ):
+            self._sendJson( self.server.requester( { "command" : "seek", "job" : self.server.strJob,
+                                                     "direction" : dictQuery.get( "direction", "up" ) } ) )
+        else:
+            self.send_error( 404 )
+
+    def _sendStream( self ):
+        self.send_response( 200 )
+        self.send_header( "Content-Type", STREAM_CONTENT_TYPE )
+        self.send_header( "Cache-Control", "no-cache" )
+        self.end_headers()
+        self.server.broadcaster.serve( self.wfile.write )
+
+    def _sendJson( self, dictResponse ):
+        byBody = json.dumps( dictResponse ).encode()
+        # 録音と共用中のチューナーの操作は、409（Conflict）
+        if( "ok" == dictResponse.get( "result" ) ):
+            iStatus = 200
+        elif( dictResponse.get( "busy" ) ):
+            iStatus = 409
+        else:
+            iStatus = 500
+        self.send_response( iStatus )
+        self.send_header( "Content-Type", "application/json" )
+        self.send_header( "Content-Length", str( len( byBody ) ) )
+        self.end_headers()
+        self.wfile.write( byBody )
+
+    def log_message( self, format, *args ):
+        pass
+
+def main():
+    # 引数の処理
+    parser = argparse.ArgumentParser()
+    parser.add_argument( "frequency", type = float )
+    parser.add_argument( "--port", type = int, default = 8000 )
+    parser.add_argument( "--bind", default = BIND_ADDRESS_DEFAULT )
+    parser.add_argument( "--bitrate", type = int, default = 128 )
+    parser.add_argument( "--source" )
+    parser.add_argument( "--tuner" )
+    args = parser.parse_args()
+
+    # チューナーの確保
+    requester = createRequester()
+    strJob = "stream_%d" % os.getpid()
+    dictResponse = requester( { "command" : "acquire", "job" : strJob, "frequency" : args.frequency,
+                                "preemptible" : True, "tuner" : args.tuner } )
+    print( dictResponse["message"] )
+    if( "ok" != dictResponse["result"] ):
+        return 1
+
+    try:
+        # エンコードの開始
+        if( args.source ):
+            source = openSource( args.source )
+        else:
+            dictHub = sendHubRequest( getHubSocketPath(), { "command" : "status" } )
+            if( (dictHub is not None) and (dictResponse["capture_device"] == dictHub.get( "device" )) ):
+                source = HubSource( strName = "stream" )
+            else:
+                source = openSource( "alsa:" + dictResponse["capture_device"] )
+        broadcaster = StreamBroadcaster( source, createEncoder( "mp3", args.bitrate, source.iSampleRate, source.iChannels ) )
+        broadcaster.start()
+
+        # HTTPサーバーの開始（聴取者ごとのスレッドで処理する）
+        server = http.server.ThreadingHTTPServer( ( args.bind, args.port ), StreamRequestHandler )
+        server.daemon_threads = True
+        server.broadcaster = broadcaster
+        server.requester = requester
+        server.strTuner = dictResponse["tuner"]
+        server.strJob = strJob
+
+        # SIGTERM、SIGINTで終了する（serve_forever()と別のスレッドから、shutdown()を呼ぶ）
+        def stop( iSignal, frame ):
+            threading.Thread( target = server.shutdown ).start()
+        signal.signal( signal.SIGTERM, stop )
+        signal.signal( signal.SIGINT, stop )
+
+        print( "Streaming. http://%s:%d/stream.mp3" % (os.uname().nodename, args.port), flush = True )
+        try:
+            server.serve_forever()
+        finally:
+            server.server_close()
+            broadcaster.stop()
+    finally:
+        # チューナーの解放
+        print( requester( { "command" : "release", "job" : strJob } )["message"] )
+    return 0
+
+if( "__main__" == __name__ ):
+    sys.exit( main() )
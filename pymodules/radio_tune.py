@@ -5,7 +5,7 @@
 #   argv[2] : Quiet mode. Suppress messages. Not radio mute. "0" is not Quiet mode.
 
 import sys
-from rda5807m.rda5807m import RDA5807M
+from rda5807m.rda5807m import RDA5807M, REG_02H_ENABLE
 
 # 引数の処理
 argc = len( sys.argv )
@@ -19,15 +19,20 @@ bQuiet = True if ((3 <= argc) and ("0" != sys.argv[2])) else False  # "0"以外
 # ラジオの処理
 radio = RDA5807M()
 
-if( not radio.isPoweredUp() ):
+# 一度の連続読み込みで、チップの全レジスタを読み込み、電源と周波数の確認は、読み込んだ値で行う。
+auiRegister = radio.readRegisters()
+if( not (auiRegister[0x02] & REG_02H_ENABLE) ):
     # ラジオの電源が入っていない場合はエラー
     print( "Error : Radio is not turned on." )
     sys.exit(254)
 
-# 周波数の設定
-if( bQuiet ):
-    radio.setFrequency( int(float(strFrequencyMHz) * 1000), False ) # 周波数はMHzをKHzに変換して渡す。サイレントモード時は、チューニング完了を待たない
-else:
-    radio.setFrequency( int(float(strFrequencyMHz) * 1000) )        # 周波数はMHzをKHzに変換して渡す。
+# 周波数の設定（既に同じ周波数に合っている場合は、省略する）
+ulFrequency = int(float(strFrequencyMHz) * 1000)    # 周波数はMHzをKHzに変換して渡す。
+if( not radio.isTunedTo( ulFrequency, auiRegister ) ):
+    if( bQuiet ):
+        radio.setFrequency( ulFrequency, False )    # サイレントモード時は、チューニング完了を待たない
+    else:
+        radio.setFrequency( ulFrequency )
+if( not bQuiet ):
     print( "Radio frequency tuned.")
     print( "  frequency : %4.1f[MHz]" % (radio.getFrequency() / 1000.0) )   # 周波数はKHzで得られるので、MHzに変換して表示する。
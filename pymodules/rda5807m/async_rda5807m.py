@@ -0,0 +1,153 @@
+# async_rda5807m.py
+#
+# Class to control RDA5807M with asyncio
+#
+# RDA5807Mクラスをラップし、各メソッドをコルーチンとして提供する。
+# - I2Cバスへのアクセスは、専用の1スレッドのエグゼキュータで実行し、イベントループをブロックしない。
+#   （1スレッドなので、I2Cトランザクションは、呼び出し元が複数あっても直列に実行される。）
+# - Seek/Tuneの完了は、asyncio.sleep()を挟みながらSTCビットを確認して待つ。
+#   完了待ちの間も、他の呼び出し元は、RSSI等の取得を行うことができる。
+# - 状態を変更する操作（begin/end/setFrequency/seek等）は、内部のロックで排他する。
+#   Seek中に別の呼び出し元がTuneする、といった操作の割り込みは起こらない。
+
+# Copyright 2023 Nobuki HIRAMINE
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import asyncio
+import concurrent.futures
+import functools
+import time
+
+from .rda5807m import RDA5807M, STC_POLL_INTERVALS_SEC, TUNE_TIMEOUT_SEC, SEEK_TIMEOUT_SEC, REG_0AH_STC, REG_0AH_SF
+
+# --- クラス定義 ---
+
+class AsyncRDA5807M:
+    _radio = None
+    _executor = None
+    _lock = None
+
+    # コンストラクタ
+    # radio : ラップするRDA5807Mインスタンス。省略時は生成する。
+    def __init__( self, radio = None ):
+        self._radio = radio if radio is not None else RDA5807M()
+        self._executor = concurrent.futures.ThreadPoolExecutor( max_workers = 1, thread_name_prefix = "rda5807m" )
+        self._lock = asyncio.Lock()
+
+    # 終了（エグゼキュータの停止）
+    async def close( self ):
+        self._executor.shutdown( wait = True )
+
+    # ラップしているRDA5807Mインスタンスの取得
+    def getRadio( self ):
+        return self._radio
+
+    # - 開始・終了 -
+
+    async def getChipID( self ):
+        return await self._call( self._radio.getChipID )
+
+    async def isPoweredUp( self ):
+        return await self._call( self._radio.isPoweredUp )
+
+    async def begin( self ):
+        async with self._lock:
+            await self._call( self._radio.begin )
+
+    async def end( self ):
+        async with self._lock:
+            await self._call( self._radio.end )
+
+    # - 周波数関連 -
+
+    async def getFrequency( self ):
+        return await self._call( self._radio.getFrequency )
+
+    async def setFrequency( self, ulFrequency, bWaitTuningComplete = True, fTimeoutSec = TUNE_TIMEOUT_SEC ):
+        async with self._lock:
+            await self._call( self._radio.setFrequency, ulFrequency, False )
+            if bWaitTuningComplete:
+                await self._waitSeekTuneComplete( fTimeoutSec )
+
+    async def getRSSI( self ):
+        return await self._call( self._radio.getRSSI )
+
+    # - シーク関連 -
+
+    # Seek操作。局が見つかったかどうかを返す。
+    async def seek( self, bUp, bWrap = True, fTimeoutSec = SEEK_TIMEOUT_SEC ):
+        async with self._lock:
+            await self._call( self._radio.seek, bUp, bWrap, False )
+            try:
+                uiRegister0A = await self._waitSeekTuneComplete( fTimeoutSec )
+            except (TimeoutError, asyncio.CancelledError):
+                # タイムアウト時、キャンセル時は、Seekを中止する。
+                await self._call( self._radio.stopSeek )
+                raise
+            return False if ( uiRegister0A & REG_0AH_SF ) else True
+
+    async def getSeekTh( self ):
+        return await self._call( self._radio.getSeekTh )
+
+    async def setSeekTh( self, bySeekTh ):
+        async with self._lock:
+            await self._call( self._radio.setSeekTh, bySeekTh )
+
+    # - サウンド関連 -
+
+    async def getVolume( self ):
+        return await self._call( self._radio.getVolume )
+
+    async def setVolume( self, byVolume ):
+        async with self._lock:
+            await self._call( self._radio.setVolume, byVolume )
+
+    async def isMuted( self ):
+        return await self._call( self._radio.isMuted )
+
+    async def setMute( self, bMute ):
+        async with self._lock:
+            await self._call( self._radio.setMute, bMute )
+
+    # - デバッグ関連 -
+
+    async def readRegisters( self ):
+        return await self._call( self._radio.readRegisters )
+
+    async def readStatusRegisters( self, *args ):
+        return await self._call( self._radio.readStatusRegisters, *args )
+
+    # - 内部処理 -
+
+    # RDA5807Mのメソッドを、I2Cアクセス用のエグゼキュータで実行する
+    async def _call( self, func, *args ):
+        return await asyncio.get_running_loop().run_in_executor( self._executor, functools.partial( func, *args ) )
+
+    # Seek/Tune完了待ち
+    # 間隔を徐々に延ばしながらSTCビットを確認する。待機中は、イベントループを他の処理に明け渡す。
+    # 完了時のRegister 0AH の値を返す。fTimeoutSec 以内に完了しない場合は、TimeoutError例外を送出する。
+    async def _waitSeekTuneComplete( self, fTimeoutSec ):
+        fDeadline = time.monotonic() + fTimeoutSec
+        iPoll = 0
+        while( True ):
+            fRemainingSec = fDeadline - time.monotonic()
+            await asyncio.sleep( max( min( STC_POLL_INTERVALS_SEC[min( iPoll, len(STC_POLL_INTERVALS_SEC) - 1 )], fRemainingSec ), 0 ) )
+            iPoll += 1
+
+            uiRegister0A = ( await self._call( self._radio.readStatusRegisters, 1 ) )[0]
+            if( uiRegister0A & REG_0AH_STC ):
+                return uiRegister0A
+
+            if( time.monotonic() >= fDeadline ):
+                raise TimeoutError( "Seek/Tune did not complete within %.3f[sec]." % fTimeoutSec )
@@ -0,0 +1,199 @@
+# bandscan.py
+#
+# Classes to scan the whole band with RDA5807M and find stations
+#
+# 全チャンネルを順にTuneし、チャンネルごとのRSSI、ステレオ表示、FM_TRUEを記録する。
+# - Tuneは完了を待たずに開始し、完了（STCビット）の確認とRSSI等の取得を、0AH～0BHの一度の連続読み込みで同時に行う。
+#   チャンネルごとのI2Cトランザクションは、書き込み1回と、読み込み数回（通常1～2回）となる。
+# - 次のチャンネルのTune開始と、現在のチャンネルのRSSIの読み込みは、重ねない（パイプライン化しない）。
+#   チップは1チャンネルずつしかTuneできず、Tune中にCHANを書き込むとTuneがやり直しになり、0BHのRSSIはTune中のチャンネルの値になるため。
+#   代わりに、Tune開始から最初の確認までの待ち時間を、直前のチャンネルのTuneの所要時間から調整し、
+#   1チャンネルあたりの時間を、Tuneの所要時間に近づける。（無駄な確認の読み込みと、確認間隔による遅れを減らす）
+#   スキャン全体の時間の下限は、チャンネル数×Tuneの所要時間となる。
+# - 結果は、チャンネル番号をインデックスとする array に保持する。
+# - 記録したRSSIのピークを、局として検出する。
+
+# Copyright 2023 Nobuki HIRAMINE
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import collections
+import time
+from array import array
+
+from .rda5807m import CHAN_MAX, TUNE_TIMEOUT_SEC, \
+                      REG_0AH_STC, REG_0AH_ST, REG_0BH_RSSI_MASK, REG_0BH_RSSI_SHIFT, REG_0BH_FM_TRUE
+
+# --- 定数定義 ---
+
+# チャンネルごとのフラグ
+FLAG_SCANNED = 0b001    # スキャン済み（Tuneがタイムアウトしたチャンネルは倒れたまま）
+FLAG_STEREO  = 0b010    # ステレオ表示（REG 0AH の STビット）
+FLAG_FM_TRUE = 0b100    # 局である（REG 0BH の FM_TRUEビット）
+
+# スキャン時のSTCビットの確認間隔[秒]。（最後の値を繰り返す）
+# Tune開始から最初の確認までは、Tuneにかかる時間程度待ち、以降は短い間隔で確認する。
+# 最初の確認までの待ち時間は、最初のチャンネルのみこの値で、以降はTuneの所要時間に合わせて調整する。
+SCAN_POLL_INTERVALS_SEC = ( 0.005, 0.002 )
+
+# 局の検出条件のデフォルト値
+STATION_RSSI_MIN = 20           # RSSIの最小値
+STATION_SEPARATION_CHANNEL = 2  # 局と局の最小間隔[チャンネル]。これより近いピークは、RSSIが大きい方のみを局とする。
+
+# 検出した局
+Station = collections.namedtuple( "Station", [ "frequency", "rssi", "stereo" ] )
+
+# --- クラス定義 ---
+
+# スキャン結果
+class BandScanResult:
+    ulFrequencyMin = 0      # チャンネル0の周波数[kHz]
+    uiChannelSpacing = 0    # チャンネルスペーシング[kHz]
+    abyRSSI = None          # チャンネルごとのRSSI
+    abyFlags = None         # チャンネルごとのフラグ（FLAG_～）
+    fElapsedSec = 0.0       # スキャンにかかった時間[秒]
+
+    # コンストラクタ
+    def __init__( self, ulFrequencyMin, uiChannelSpacing, iChannelCount ):
+        self.ulFrequencyMin = ulFrequencyMin
+        self.uiChannelSpacing = uiChannelSpacing
+        self.abyRSSI = array( "B", bytes( iChannelCount ) )
+        self.abyFlags = array( "B", bytes( iChannelCount ) )
+
+    def getChannelCount( self ):
+        return len( self.abyRSSI )
+
+    # チャンネルの周波数[kHz]の取得
+    def getFrequency( self, iChannel ):
+        return self.ulFrequencyMin + self.uiChannelSpacing * iChannel
+
+    # 局の検出
+    # RSSIが極大となるチャンネルのうち、RSSIが byRSSIMin 以上のものを局とする。
+    # bRequireFMTrue が True の場合は、FM_TRUEビットが立っているチャンネルのみを対象とする。
+    # 周波数順の Station のリストを返す。
+    def findStations( self, byRSSIMin = STATION_RSSI_MIN, iSeparationChannel = STATION_SEPARATION_CHANNEL, bRequireFMTrue = True ):
+        abyRSSI = self.abyRSSI
+        abyFlags = self.abyFlags
+        iCount = len( abyRSSI )
+
+        # 極大点の抽出（平坦なピークは、最も低い周波数のチャンネルを採用する）
+        aiPeak = []
+        for i in range( iCount ):
+            if( not (abyFlags[i] & FLAG_SCANNED) ):
+                continue
+            if( abyRSSI[i] < byRSSIMin ):
+                continue
+            if( bRequireFMTrue and not (abyFlags[i] & FLAG_FM_TRUE) ):
+                continue
+            if( (0 < i) and (abyRSSI[i - 1] >= abyRSSI[i]) ):
+                continue
+            if( (i + 1 < iCount) and (abyRSSI[i + 1] > abyRSSI[i]) ):
+                continue
+            aiPeak.append( i )
+
+        # 近接するピークは、RSSIが大きい方のみを残す。
+        aiStation = []
+        for i in sorted( aiPeak, key = lambda i: abyRSSI[i], reverse = True ):
+            if( all( iSeparationChannel <= abs( i - j ) for j in aiStation ) ):
+                aiStation.append( i )
+
+        return [ Station( self.getFrequency( i ), abyRSSI[i], True if (abyFlags[i] & FLAG_STEREO) else False )
+                 for i in sorted( aiStation ) ]
+
+# バンドスキャン
+class BandScanner:
+    _radio = None
+
+    # コンストラクタ
+    # radio : 電源が入っている RDA5807M インスタンス
+    def __init__( self, radio ):
+        self._radio = radio
+
+    # スキャン
+    # ulFrequencyMin～ulFrequencyMax[kHz] の全チャンネルをスキャンする。省略時はバンド全体。
+    # スキャン中はMuteし、スキャン後は元の周波数とMute状態に戻す。
+    def scan( self, ulFrequencyMin = None, ulFrequencyMax = None, fChannelTimeoutSec = TUNE_TIMEOUT_SEC ):
+        radio = self._radio
+
+        # チャンネル範囲の決定（バンドの下限、チャンネルスペーシングはシャドウコピーから取得するので、I2Cアクセスは発生しない）
+        ulBandMin = radio.getFrequencyMin()
+        uiChannelSpacing = radio.getChannelSpacing()
+        ulFrequencyMin = ulBandMin if (ulFrequencyMin is None) else max( ulFrequencyMin, ulBandMin )
+        ulFrequencyMax = radio.getFrequencyMax() if (ulFrequencyMax is None) else min( ulFrequencyMax, radio.getFrequencyMax() )
+        iChannelFirst = (ulFrequencyMin - ulBandMin) // uiChannelSpacing
+        iChannelLast = min( (ulFrequencyMax - ulBandMin) // uiChannelSpacing, CHAN_MAX )
+
+        result = BandScanResult( ulBandMin + uiChannelSpacing * iChannelFirst, uiChannelSpacing, max( iChannelLast - iChannelFirst + 1, 0 ) )
+
+        # 元の状態の保存と、Mute
+        ulFrequencyOrg = radio.getFrequency()
+        bMutedOrg = radio.isMuted()
+        radio.setMute( True )
+
+        fStartSec = time.monotonic()
+        fFirstWaitSec = SCAN_POLL_INTERVALS_SEC[0]
+        try:
+            for i in range( result.getChannelCount() ):
+                # Tune開始（完了は待たない）
+                radio.setFrequency( result.getFrequency( i ), False )
+
+                # Tune完了待ちと、RSSI等の取得
+                (auiStatus, fPendingSec) = self._waitStatus( fChannelTimeoutSec, fFirstWaitSec )
+                if( auiStatus is None ):
+                    continue    # タイムアウトしたチャンネルは、スキャン済みにしない。（待ち時間も調整しない）
+
+                # 次のチャンネルの、最初の確認までの待ち時間の調整
+                # 最初の確認で完了していた場合は、短くして、より早く確認できるかを試す。
+                # 完了していなかった場合は、最後に未完了だった時点まで延ばす。（Tuneには、少なくともその時間がかかる）
+                if( fPendingSec is None ):
+                    fFirstWaitSec = max( fFirstWaitSec - SCAN_POLL_INTERVALS_SEC[-1], 0.0 )
+                else:
+                    fFirstWaitSec = fPendingSec
+                (uiRegister0A, uiRegister0B) = auiStatus
+
+                result.abyRSSI[i] = (uiRegister0B & REG_0BH_RSSI_MASK) >> REG_0BH_RSSI_SHIFT
+                byFlags = FLAG_SCANNED
+                byFlags |= FLAG_STEREO if (uiRegister0A & REG_0AH_ST) else 0
+                byFlags |= FLAG_FM_TRUE if (uiRegister0B & REG_0BH_FM_TRUE) else 0
+                result.abyFlags[i] = byFlags
+        finally:
+            result.fElapsedSec = time.monotonic() - fStartSec
+
+            # 元の状態に戻す
+            radio.setFrequency( ulFrequencyOrg )
+            radio.setMute( bMutedOrg )
+
+        return result
+
+    # Tune完了待ち
+    # STCビットの確認と同時に、RSSI等を取得する。（0AH～0BHの一度の連続読み込み）
+    # 最初の確認は fFirstWaitSec[秒]後、以降は SCAN_POLL_INTERVALS_SEC の2番目以降の間隔で確認する。
+    # (完了時の [Register 0AH, Register 0BH], 最後にTuneが未完了だった確認の時刻[秒]（呼び出しからの経過時間）) を返す。
+    # タイムアウトした場合は、[Register 0AH, Register 0BH] の代わりに、Noneを返す。最初の確認で完了していた場合は、時刻の代わりに、Noneを返す。
+    def _waitStatus( self, fTimeoutSec, fFirstWaitSec ):
+        fStartSec = time.monotonic()
+        fDeadline = fStartSec + fTimeoutSec
+        fPendingSec = None
+        iPoll = 0
+        while( True ):
+            time.sleep( fFirstWaitSec if (0 == iPoll) else SCAN_POLL_INTERVALS_SEC[min( iPoll, len(SCAN_POLL_INTERVALS_SEC) - 1 )] )
+            iPoll += 1
+
+            fReadSec = time.monotonic()
+            auiStatus = self._radio.readStatusRegisters( 2 )
+            if( auiStatus[0] & REG_0AH_STC ):
+                return (auiStatus, fPendingSec)
+            fPendingSec = fReadSec - fStartSec
+
+            if( time.monotonic() >= fDeadline ):
+                return (None, fPendingSec)
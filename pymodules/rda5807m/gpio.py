@@ -0,0 +1,85 @@
+# gpio.py
+#
+# Classes to wait for the interrupt from RDA5807M GPIO2
+#
+# RDA5807Mは、Register 04H の STCIEN ビットを立て、GPIO2 を割り込み出力に設定すると、
+# Seek/Tune完了時に GPIO2 に Low パルスを出力する。
+# このパルスの立ち下がりエッジを、Raspberry Pi のGPIOで待つ。
+#
+# バックエンドのインターフェース
+#   setup( iPin )                      : GPIOピンを入力に設定し、立ち下がりエッジの検出を開始する。
+#   clearEdge( iPin )                  : 検出済みのエッジを破棄する。（Seek/Tune開始前に呼び出す）
+#   waitForEdge( iPin, fTimeoutSec )   : エッジを検出するまで待つ。タイムアウトした場合はFalseを返す。
+#   cleanup( iPin )                    : エッジの検出を終了する。
+
+# Copyright 2023 Nobuki HIRAMINE
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import threading
+
+# --- クラス定義 ---
+
+# RPi.GPIO を使用するバックエンド
+class RPiGPIOBackend:
+    _GPIO = None
+    _dictEvent = None   # ピン番号ごとの、エッジ検出イベント
+
+    # コンストラクタ
+    def __init__( self ):
+        import RPi.GPIO as GPIO     # 割り込みモードを使用しない場合は不要なので、ここでimportする。
+        self._GPIO = GPIO
+        self._GPIO.setmode( GPIO.BCM )
+        self._dictEvent = {}
+
+    def setup( self, iPin ):
+        self._dictEvent[iPin] = threading.Event()
+        self._GPIO.setup( iPin, self._GPIO.IN, pull_up_down = self._GPIO.PUD_UP )   # GPIO2の割り込み出力は、Lowパルスなのでプルアップする。
+        self._GPIO.add_event_detect( iPin, self._GPIO.FALLING, callback = lambda iChannel: self._dictEvent[iChannel].set() )
+
+    def clearEdge( self, iPin ):
+        self._dictEvent[iPin].clear()
+
+    def waitForEdge( self, iPin, fTimeoutSec ):
+        return self._dictEvent[iPin].wait( fTimeoutSec )
+
+    def cleanup( self, iPin ):
+        self._GPIO.remove_event_detect( iPin )
+        self._GPIO.cleanup( iPin )
+        del self._dictEvent[iPin]
+
+# ハードウェアを使用しないバックエンド（テスト用）
+# trigger()の呼び出しで、エッジを発生させる。
+class FakeGPIOBackend:
+    _dictEvent = None
+
+    # コンストラクタ
+    def __init__( self ):
+        self._dictEvent = {}
+
+    def setup( self, iPin ):
+        self._dictEvent[iPin] = threading.Event()
+
+    def clearEdge( self, iPin ):
+        self._dictEvent[iPin].clear()
+
+    def waitForEdge( self, iPin, fTimeoutSec ):
+        return self._dictEvent[iPin].wait( fTimeoutSec )
+
+    def cleanup( self, iPin ):
+        del self._dictEvent[iPin]
+
+    # エッジの発生
+    def trigger( self, iPin ):
+        if( iPin in self._dictEvent ):
+            self._dictEvent[iPin].set()
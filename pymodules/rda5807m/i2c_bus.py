@@ -0,0 +1,106 @@
+# i2c_bus.py
+#
+# Class to access I2C bus
+#
+# smbusによるレジスタアドレス指定の読み書きに加えて、
+# /dev/i2c-N を直接読み書きすることで、レジスタアドレスを伴わない読み書き（RAW読み書き）を行う。
+# RDA5807MのSequential access mode（レジスタ02Hからの連続書き込み、レジスタ0AHからの連続読み込み）は、RAW読み書きで行う。
+#
+# I2Cバスのインターフェース（RDA5807Mクラスが使用する。I2CBus、simulator.SimulatedBus が実装する）
+#   read_i2c_block_data( byAddr, byRegAddr, iLength ) : レジスタアドレスを指定して読み込む。
+#   write_i2c_block_data( byAddr, byRegAddr, abyData ) : レジスタアドレスを指定して書き込む。
+#   readRaw( byAddr, iLength )                         : RAW読み込み
+#   writeRaw( byAddr, abyData )                        : RAW書き込み
+#   close()                                            : 終了する。
+#
+# 環境変数 RDA5807M_BUS に "sim" を指定すると、openBus() は、実機の代わりに、シミュレーター（simulator.SimulatedBus）を返す。
+#   "sim"                 : 局のないバンド
+#   "sim:プロファイルのパス" : バンドプロファイル（JSON）の局を受信する。
+#   環境変数 RDA5807M_SIM_STATE にファイルパスを指定すると、レジスタの値を保存し、プロセスをまたいで引き継ぐ。
+
+# Copyright 2023 Nobuki HIRAMINE
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import fcntl
+import os
+
+# --- 定数定義 ---
+
+I2C_SLAVE = 0x0703  # スレーブアドレス設定のioctlリクエスト番号（linux/i2c-dev.h）
+
+BUS_ENV_NAME = "RDA5807M_BUS"               # I2Cバスの種類の指定の環境変数名
+SIM_STATE_ENV_NAME = "RDA5807M_SIM_STATE"   # シミュレーターの状態の保存先の環境変数名
+
+# --- クラス定義 ---
+
+class I2CBus:
+    _smbus = None
+    _fd = None
+    _byRawAddr = None   # RAW読み書きの対象として、ioctlで設定済みのスレーブアドレス
+
+    # コンストラクタ
+    def __init__( self, iBusNumber ):
+        import smbus    # シミュレーター使用時に不要なので、ここでimportする。
+        self._smbus = smbus.SMBus( iBusNumber )
+        self._fd = os.open( "/dev/i2c-%d" % iBusNumber, os.O_RDWR )
+
+    # I2C接続のクローズ
+    def close( self ):
+        if( self._smbus is not None ):
+            self._smbus.close()
+            self._smbus = None
+        if( self._fd is not None ):
+            os.close( self._fd )
+            self._fd = None
+
+    # - レジスタアドレス指定の読み書き（smbus互換） -
+
+    def read_i2c_block_data( self, byAddr, byRegAddr, iLength ):
+        return self._smbus.read_i2c_block_data( byAddr, byRegAddr, iLength )
+
+    def write_i2c_block_data( self, byAddr, byRegAddr, abyData ):
+        self._smbus.write_i2c_block_data( byAddr, byRegAddr, abyData )
+
+    # - RAW読み書き -
+    # START → アドレス → データ列 → STOP の、一度のトランザクションで読み書きする。
+
+    # RAW読み込み
+    def readRaw( self, byAddr, iLength ):
+        self._setRawAddr( byAddr )
+        return list( os.read( self._fd, iLength ) )
+
+    # RAW書き込み
+    def writeRaw( self, byAddr, abyData ):
+        self._setRawAddr( byAddr )
+        os.write( self._fd, bytes( abyData ) )
+
+    # RAW読み書きの対象スレーブアドレスの設定（変更がある場合のみioctlを発行する）
+    def _setRawAddr( self, byAddr ):
+        if( self._byRawAddr != byAddr ):
+            fcntl.ioctl( self._fd, I2C_SLAVE, byAddr )
+            self._byRawAddr = byAddr
+
+# --- 関数定義 ---
+
+# I2Cバスのオープン
+# 環境変数 RDA5807M_BUS の指定に従い、実機のI2Cバス、またはシミュレーターを返す。
+def openBus( iBusNumber ):
+    strBus = os.environ.get( BUS_ENV_NAME, "" )
+    if( not strBus.startswith( "sim" ) ):
+        return I2CBus( iBusNumber )
+
+    from .simulator import SimulatedBus, loadBandProfile
+    strProfilePath = strBus.partition( ":" )[2]
+    return SimulatedBus( loadBandProfile( strProfilePath ) if strProfilePath else None,
+                         strStatePath = os.environ.get( SIM_STATE_ENV_NAME ) )
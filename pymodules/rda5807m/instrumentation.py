@@ -0,0 +1,233 @@
+# instrumentation.py
+#
+# Classes to count and time I2C transactions of RDA5807M
+#
+# InstrumentedBus : I2Cバス（I2CBus互換）を包み、トランザクションごとに、回数、バイト数、所要時間を記録する。
+#                   記録は、レジスタごと（Sequential access modeは "seq_read" / "seq_write"）と、
+#                   実行中のRDA5807Mの公開メソッドごとに集計する。
+# instrumentRadio : RDA5807Mのインスタンスのバスと公開メソッドを計測対象にする。
+#                   メソッドの中から呼ばれたメソッド（setFrequency → waitSeekTuneComplete 等）のトランザクションは、外側のメソッドに集計する。
+# BusMetrics      : 集計結果。JSON（dict）、Prometheusのテキスト形式で出力できる。
+
+# Copyright 2023 Nobuki HIRAMINE
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import bisect
+import functools
+import threading
+import time
+
+from .rda5807m import SEQUENTIAL_READ_FIRST, SEQUENTIAL_WRITE_FIRST
+
+# --- 定数定義 ---
+
+# ヒストグラムの区間の上限[秒]（最後の区間は +Inf）
+HISTOGRAM_BUCKETS_SEC = ( 0.0001, 0.0002, 0.0005, 0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1.0, 2.0, 5.0, 10.0 )
+
+METHOD_NONE = "-"           # 公開メソッドの外からのトランザクション
+
+METRICS_ENV_NAME = "RDA5807M_METRICS"   # radio_service.py で計測を有効にする環境変数
+
+# --- クラス定義 ---
+
+# 所要時間のヒストグラム
+class LatencyHistogram:
+    iCount = 0
+    fSumSec = 0.0
+    fMaxSec = 0.0
+    aiBucket = None         # 区間ごとの回数（累積ではない）
+
+    def __init__( self ):
+        self.aiBucket = [0] * (len( HISTOGRAM_BUCKETS_SEC ) + 1)
+
+    def observe( self, fSec ):
+        self.iCount += 1
+        self.fSumSec += fSec
+        self.fMaxSec = max( self.fMaxSec, fSec )
+        self.aiBucket[bisect.bisect_left( HISTOGRAM_BUCKETS_SEC, fSec )] += 1
+
+    # 割合 fQuantile（0～1）の所要時間の上限（区間の上限値）
+    def getQuantile( self, fQuantile ):
+        iTarget = fQuantile * self.iCount
+        iCumulative = 0
+        for (i, iBucket) in enumerate( self.aiBucket ):
+            iCumulative += iBucket
+            if( (0 < iCumulative) and (iTarget <= iCumulative) ):
+                return HISTOGRAM_BUCKETS_SEC[i] if (i < len( HISTOGRAM_BUCKETS_SEC )) else self.fMaxSec
+        return 0.0
+
+    def toDict( self ):
+        return { "count" : self.iCount, "sum_sec" : self.fSumSec, "max_sec" : self.fMaxSec,
+                 "mean_sec" : (self.fSumSec / self.iCount) if self.iCount else 0.0,
+                 "p50_sec" : self.getQuantile( 0.5 ), "p99_sec" : self.getQuantile( 0.99 ),
+                 "buckets" : list( self.aiBucket ) }
+
+# 集計結果
+class BusMetrics:
+    dictTransaction = None      # (メソッド名, 種類, レジスタ) → [回数, バイト数, LatencyHistogram]
+    dictMethod = None           # メソッド名 → LatencyHistogram（メソッド全体の所要時間）
+    _lock = None
+
+    def __init__( self ):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset( self ):
+        with self._lock:
+            self.dictTransaction = {}
+            self.dictMethod = {}
+
+    # トランザクションの記録
+    def recordTransaction( self, strMethod, strKind, strRegister, iBytes, fSec ):
+        with self._lock:
+            aEntry = self.dictTransaction.get( (strMethod, strKind, strRegister) )
+            if( aEntry is None ):
+                aEntry = [ 0, 0, LatencyHistogram() ]
+                self.dictTransaction[(strMethod, strKind, strRegister)] = aEntry
+            aEntry[0] += 1
+            aEntry[1] += iBytes
+            aEntry[2].observe( fSec )
+
+    # メソッドの所要時間の記録
+    def recordMethod( self, strMethod, fSec ):
+        with self._lock:
+            histogram = self.dictMethod.get( strMethod )
+            if( histogram is None ):
+                histogram = LatencyHistogram()
+                self.dictMethod[strMethod] = histogram
+            histogram.observe( fSec )
+
+    # メソッドごとの合計（トランザクション数、バイト数、バスの占有時間[秒]）
+    def getMethodTotals( self, strMethod ):
+        with self._lock:
+            aEntry = [ aEntry for (key, aEntry) in self.dictTransaction.items() if strMethod == key[0] ]
+            return { "transactions" : sum( a[0] for a in aEntry ),
+                     "bytes" : sum( a[1] for a in aEntry ),
+                     "bus_sec" : sum( a[2].fSumSec for a in aEntry ) }
+
+    # JSON形式（dict）での出力
+    def toDict( self ):
+        with self._lock:
+            return { "transactions" : [ dict( { "method" : key[0], "kind" : key[1], "register" : key[2], "count" : aEntry[0], "bytes" : aEntry[1] },
+                                              latency = aEntry[2].toDict() )
+                                        for (key, aEntry) in sorted( self.dictTransaction.items() ) ],
+                     "methods" : { strMethod : histogram.toDict() for (strMethod, histogram) in sorted( self.dictMethod.items() ) } }
+
+    # Prometheusのテキスト形式での出力
+    def toPrometheus( self, strPrefix = "rda5807m" ):
+        astrLine = []
+        with self._lock:
+            astrLine.append( "# TYPE %s_i2c_transactions_total counter" % strPrefix )
+            for (key, aEntry) in sorted( self.dictTransaction.items() ):
+                astrLine.append( '%s_i2c_transactions_total{%s} %d' % (strPrefix, _labels( key ), aEntry[0]) )
+            astrLine.append( "# TYPE %s_i2c_bytes_total counter" % strPrefix )
+            for (key, aEntry) in sorted( self.dictTransaction.items() ):
+                astrLine.append( '%s_i2c_bytes_total{%s} %d' % (strPrefix, _labels( key ), aEntry[1]) )
+            astrLine.append( "# TYPE %s_i2c_transaction_seconds histogram" % strPrefix )
+            for (key, aEntry) in sorted( self.dictTransaction.items() ):
+                astrLine += _histogramLines( "%s_i2c_transaction_seconds" % strPrefix, _labels( key ), aEntry[2] )
+            astrLine.append( "# TYPE %s_method_seconds histogram" % strPrefix )
+            for (strMethod, histogram) in sorted( self.dictMethod.items() ):
+                astrLine += _histogramLines( "%s_method_seconds" % strPrefix, 'method="%s"' % strMethod, histogram )
+        return "\n".join( astrLine ) + "\n"
+
+# 計測するI2Cバス
+class InstrumentedBus:
+    metrics = None
+    _bus = None
+    _local = None               # スレッドごとの、実行中の公開メソッド名
+
+    def __init__( self, bus, metrics = None ):
+        self._bus = bus
+        self.metrics = metrics if (metrics is not None) else BusMetrics()
+        self._local = threading.local()
+
+    def close( self ):
+        self._bus.close()
+
+    def read_i2c_block_data( self, byAddr, byRegAddr, iLength ):
+        return self._measure( "read", "%02XH" % byRegAddr, iLength, self._bus.read_i2c_block_data, byAddr, byRegAddr, iLength )
+
+    def write_i2c_block_data( self, byAddr, byRegAddr, abyData ):
+        return self._measure( "write", "%02XH" % byRegAddr, len( abyData ), self._bus.write_i2c_block_data, byAddr, byRegAddr, abyData )
+
+    def readRaw( self, byAddr, iLength ):
+        return self._measure( "seq_read", "%02XH" % SEQUENTIAL_READ_FIRST, iLength, self._bus.readRaw, byAddr, iLength )
+
+    def writeRaw( self, byAddr, abyData ):
+        return self._measure( "seq_write", "%02XH" % SEQUENTIAL_WRITE_FIRST, len( abyData ), self._bus.writeRaw, byAddr, abyData )
+
+    # 包んでいるバス固有の機能（シミュレーターの setInterruptCallback 等）は、そのまま使えるようにする。
+    def __getattr__( self, strName ):
+        return getattr( self._bus, strName )
+
+    # 実行中の公開メソッドの設定（instrumentRadioから呼ばれる）。外側のメソッドが設定済みの場合はFalseを返す。
+    def enterMethod( self, strMethod ):
+        if( getattr( self._local, "strMethod", None ) is not None ):
+            return False
+        self._local.strMethod = strMethod
+        return True
+
+    def exitMethod( self ):
+        self._local.strMethod = None
+
+    def _measure( self, strKind, strRegister, iBytes, func, *args ):
+        fStartSec = time.perf_counter()
+        try:
+            return func( *args )
+        finally:
+            self.metrics.recordTransaction( getattr( self._local, "strMethod", None ) or METHOD_NONE, strKind, strRegister, iBytes,
+                                            time.perf_counter() - fStartSec )
+
+# --- 関数定義 ---
+
+# RDA5807Mのインスタンスを計測対象にする
+# バスを InstrumentedBus で包み、公開メソッド（"_"で始まらないメソッド）を、所要時間を記録するメソッドに置き換える。
+# 計測に使用している InstrumentedBus を返す。
+def instrumentRadio( radio, metrics = None ):
+    bus = InstrumentedBus( radio._i2c, metrics )
+    radio._i2c = bus
+
+    for strName in dir( type( radio ) ):
+        if( strName.startswith( "_" ) or (not callable( getattr( type( radio ), strName ) )) ):
+            continue
+        setattr( radio, strName, _wrapMethod( bus, strName, getattr( radio, strName ) ) )
+    return bus
+
+def _wrapMethod( bus, strName, method ):
+    @functools.wraps( method )
+    def wrapper( *args, **kwargs ):
+        if( not bus.enterMethod( strName ) ):
+            return method( *args, **kwargs )
+        fStartSec = time.perf_counter()
+        try:
+            return method( *args, **kwargs )
+        finally:
+            bus.exitMethod()
+            bus.metrics.recordMethod( strName, time.perf_counter() - fStartSec )
+    return wrapper
+
+def _labels( key ):
+    return 'method="%s",kind="%s",register="%s"' % key
+
+def _histogramLines( strName, strLabels, histogram ):
+    astrLine = []
+    iCumulative = 0
+    for (i, iBucket) in enumerate( histogram.aiBucket ):
+        iCumulative += iBucket
+        strLe = ("%g" % HISTOGRAM_BUCKETS_SEC[i]) if (i < len( HISTOGRAM_BUCKETS_SEC )) else "+Inf"
+        astrLine.append( '%s_bucket{%s,le="%s"} %d' % (strName, strLabels, strLe, iCumulative) )
+    astrLine.append( "%s_sum{%s} %.6f" % (strName, strLabels, histogram.fSumSec) )
+    astrLine.append( "%s_count{%s} %d" % (strName, strLabels, histogram.iCount) )
+    return astrLine
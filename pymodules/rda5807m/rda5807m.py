@@ -21,9 +21,10 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-import smbus
 import time
 
+from .i2c_bus import openBus
+
 # --- 定数定義 ---
 
 # RDA5807Mのレジスタ定義に基づく定数
@@ -79,6 +80,8 @@ REG_03H_SPACE_MASK              = 0b0000000000000011    # Channel Spacing
 REG_03H_SPACE_SHIFT             = 0                     # 00 = 100kHz, 01 = 200kHz, 10 = 50kHz, 11 = 25kHz
 
 # REG 04H
+REG_04H_STCIEN                  = 0b0100000000000000    # Seek/Tune Complete Interrupt Enable. 0 = Disable. 1 = Enable.
+                                                        # 立てると、Seek/Tune完了時に、GPIO2にLowパルスが出力される。（GPIO2は割り込み出力(=0b01)に設定する必要がある）
 REG_04H_DE                      = 0b0000100000000000    # De-emphasis. 0 = 75 μs. 1 = 50 μs.
                                                         # 日本の放送の場合、FM放送は50μs。
                                                         # （ＦＭ変復調の過程において、高い周波数でのノイズレベルが高くなる性質がある。
@@ -95,6 +98,8 @@ REG_04H_AFCD                    = 0b0000000100000000    # 0 = AFC work. 1 = AFC
                                                         # （アナログチューニング方式の受信機でよくみられたもので、
                                                         # 　受信周波数と放送周波数のずれをフィードバックして、自動的に放送周波数に合わせる回路である。
                                                         # 　出典 : https:#ja.wikipedia.org/wiki/自動周波数制御）
+REG_04H_GPIO2_MASK              = 0b0000000000001100    # General Purpose I/O 2.
+REG_04H_GPIO2_SHIFT             = 2                     # 00 = High impedance, 01 = Interrupt (INT), 10 = Low, 11 = High
 
 # REG 05H
 REG_05H_SEEKTH_MASK             = 0b0000111100000000    # Seek SNR threshold value. Seek SNR 閾値.
@@ -110,6 +115,14 @@ REG_07H_65M_50M_MODE            = 0b0000001000000000    # 65M_50M_MODE値の設
 REG_07H_SOFTBLEND_EN            = 0b0000000000000010    # 1, Softblend enable
 
 # REG 0AH
+REG_0AH_STC                     = 0b0100000000000000    # Seek/Tune Complete. 0 = Not complete. 1 = Complete.
+                                                        # Seek/Tuneオペレーション完了時に立つ。Seek/Tuneオペレーション開始時に倒れる。
+REG_0AH_RDSR                    = 0b1000000000000000    # RDS ready. 0 = No RDS/RBDS group ready. 1 = New RDS/RBDS group ready.
+                                                        # RDSのグループ（ブロックA～D）を受信し、0CH～0FHで読み込める状態になった場合に立つ。
+REG_0AH_SF                      = 0b0010000000000000    # Seek Fail. 0 = Seek successful. 1 = Seek failure.
+                                                        # Seekで局が見つからなかった場合に立つ。
+REG_0AH_RDSS                    = 0b0001000000000000    # RDS Synchronization. 0 = RDS decoder not synchronized. 1 = RDS decoder synchronized.
+REG_0AH_ST                      = 0b0000010000000000    # Stereo Indicator. 0 = Mono. 1 = Stereo.
 REG_0AH_READCHAN_MASK           = 0b0000001111111111    # Read Channel.
 REG_0AH_READCHAN_SHIFT          = 0                     # BAND = 0.      Frequency = Channel Spacing (kHz) x READCHAN[9:0]+ 87.0 MHz
                                                         # BAND = 1 or 2. Frequency = Channel Spacing (kHz) x READCHAN[9:0]+ 76.0 MHz
@@ -121,6 +134,19 @@ REG_0BH_RSSI_MASK               = 0b1111111000000000    # RSSI.(Received Signal
 REG_0BH_RSSI_SHIFT              = 9                     # 000000 = min
                                                         # 111111 = max
                                                         # RSSI scale is logarithmic.
+REG_0BH_FM_TRUE                 = 0b0000000100000000    # 1 = the current channel is a station. 0 = the current channel is not a station.
+REG_0BH_FM_READY                = 0b0000000010000000    # 1 = ready. 0 = not ready.
+REG_0BH_ABCD_E                  = 0b0000000000010000    # 1 = the block id of register 0cH,0dH,0eH,0fH is E. 0 = the block id of register 0cH, 0dH, 0eH,0fH is A, B, C, D.
+REG_0BH_BLERA_MASK              = 0b0000000000001100    # Block Errors Level of RDS_DATA_0 (ブロックA)
+REG_0BH_BLERA_SHIFT             = 2                     # 00 = 0 errors requiring correction. 01 = 1～2 errors requiring correction.
+                                                        # 10 = 3～5 errors requiring correction. 11 = 6+ errors or error in checkword, correction not possible.
+REG_0BH_BLERB_MASK              = 0b0000000000000011    # Block Errors Level of RDS_DATA_1 (ブロックB)
+REG_0BH_BLERB_SHIFT             = 0                     # BLERAと同じ
+
+# REG 0CH～0FH
+# RDSのブロックA～D（各16ビット）。REG_0AH_RDSR が立っている場合に有効。
+RDS_BLOCK_FIRST = 0x0C
+RDS_BLOCK_COUNT = 4
 
 # レジスタ定義から求まる最大値
 CHAN_MAX   = REG_03H_CHAN_MASK >> REG_03H_CHAN_SHIFT        # CHAN最大値は、CHANビットを全部立てた値を、シフト量シフトした値。0b1111111111 = 1023。
@@ -129,12 +155,42 @@ SEEKTH_MAX = REG_05H_SEEKTH_MASK >> REG_05H_SEEKTH_SHIFT    # SEEKTH最大値は
 SOFTBLENDTH_MAX = REG_07H_TH_SOFTBLEND_MASK >> REG_07H_TH_SOFTBLEND_SHIFT   # SOFTBLENDTH最大値は、SOFTBLENDTHビットを全部立てた値を、シフト量シフトした値。0b111111 = 31。
 
 # デバイスのI2Cアドレス
-I2C_ADDR_RDA5807M = 0x11    # RDA5807MのI2Cアドレス
+I2C_ADDR_RDA5807M = 0x11    # RDA5807MのI2Cアドレス（Random access mode）
+I2C_ADDR_RDA5807M_SEQUENTIAL = 0x10 # RDA5807MのI2Cアドレス（Sequential access mode）
+                                    # 書き込みは、レジスタ02Hから連続して行われる。
+                                    # 読み込みは、レジスタ0AHから連続して行われる。（0FHの次は00Hに戻る）
+
+# Sequential access modeでの読み書きの開始レジスタ
+SEQUENTIAL_WRITE_FIRST = 0x02
+SEQUENTIAL_READ_FIRST  = 0x0A
 
 # 読み書き可能なレジスタのサイズ
 READABLE_REGISTER_SIZE = 16
 WRITABLE_REGISTER_SIZE =  8
 
+# ステータスレジスタ（0AH～0FH）の数
+STATUS_REGISTER_SIZE = READABLE_REGISTER_SIZE - SEQUENTIAL_READ_FIRST
+
+# シャドウコピー（チップに書き込んだ値のメモリ上の控え）を保持するレジスタの範囲
+SHADOW_REGISTER_FIRST = 0x02
+SHADOW_REGISTER_LAST  = 0x07
+
+# 操作完了後にチップ側で自動的に倒れるビット。シャドウコピーには倒した状態で保持する。
+# （立てたまま保持すると、同じレジスタの別のビットを更新した際に、Seek/Tune/Soft resetが再度開始されてしまう。）
+SELF_CLEARING_BITS = { 0x02 : REG_02H_SEEK | REG_02H_SOFT_RESET,
+                       0x03 : REG_03H_TUNE }
+
+# ensureTuned() で、現在の値と begin() の設定を比較する際に、無視するビット
+# 周波数（CHAN）、自動的に倒れるビット、Seek開始時に指定するビットは、受信の設定ではないので比較しない。
+BEGIN_COMPARE_IGNORE_BITS = { 0x02 : REG_02H_SEEK | REG_02H_SOFT_RESET | REG_02H_SEEKUP | REG_02H_SKMODE,
+                              0x03 : REG_03H_CHAN_MASK | REG_03H_TUNE }
+
+# Seek/Tune完了待ち
+# STCビットの確認間隔[秒]。Tuneは数十msで完了するので、最初は短い間隔で確認し、徐々に間隔を延ばす。（最後の値を繰り返す）
+STC_POLL_INTERVALS_SEC = ( 0.005, 0.005, 0.01, 0.01, 0.02, 0.05 )
+TUNE_TIMEOUT_SEC = 1.0      # Tune完了待ちのタイムアウト[秒]
+SEEK_TIMEOUT_SEC = 10.0     # Seek完了待ちのタイムアウト[秒]（バンド全体を探索する場合があるので長め）
+
 # MUTE処理の実現方法
 MUTE_METHOD = 2 # MUTEの実現方法は３種類ある（「Volumeを0にする」は除く。実際、Volumeをゼロにしても無音にはならない）
                 # ① SOFT_MUTEビット（REG 04H の BITS 9）を立てることでMuteする。
@@ -146,17 +202,34 @@ MUTE_METHOD = 2 # MUTEの実現方法は３種類ある（「Volumeを0にする
 class RDA5807M:
     _i2c = None
     _i2c_addr = None
+    _i2c_addr_seq = None
+    _bOwnBus = False            # I2Cバスをこのインスタンスで開いたか（開いた場合のみ、デストラクタで閉じる）
+    _auiShadowRegister = None   # 書き込み可能レジスタ(02H～07H)のシャドウコピー。Noneの要素は未読み込み。
+    _gpio = None                # 割り込みモード時の、GPIOバックエンド（rda5807m.gpio 参照）。Noneの場合はポーリングモード。
+    _iInterruptPin = None       # 割り込みモード時の、GPIO2を接続したGPIOピン番号（BCM）
 
     # コンストラクタ
-    def __init__( self ):
+    # iBusNumber   : I2Cバス番号（/dev/i2c-N の N）
+    # byI2CAddr    : I2Cアドレス（Random access mode）
+    # byI2CAddrSeq : I2Cアドレス（Sequential access mode）
+    # bus          : 使用するI2Cバス（I2CBus互換のオブジェクト。i2c_bus.py 参照）。指定した場合は、iBusNumberは無視し、このバスを使用する。
+    #                （複数のチップで1つのバスを共有する場合や、テスト用のバスを使用する場合に指定する）
+    def __init__( self, iBusNumber = 1, byI2CAddr = I2C_ADDR_RDA5807M, byI2CAddrSeq = I2C_ADDR_RDA5807M_SEQUENTIAL, bus = None ):
         # クラスメンバーへのセット
-        self._i2c_addr = I2C_ADDR_RDA5807M
-        self._i2c = smbus.SMBus(1)
+        self._i2c_addr = byI2CAddr
+        self._i2c_addr_seq = byI2CAddrSeq
+        if( bus is None ):
+            self._i2c = openBus( iBusNumber )
+            self._bOwnBus = True
+        else:
+            self._i2c = bus
+        self._auiShadowRegister = [None] * WRITABLE_REGISTER_SIZE
 
     # デストラクタ
     def __del__( self ):
         # I2C接続のクローズ
-        self._i2c.close()
+        if( self._bOwnBus ):
+            self._i2c.close()
 
     # チップIDの取得
     def getChipID( self ):
@@ -169,11 +242,45 @@ class RDA5807M:
         return True if self._decodeRegister( 0x02, REG_02H_ENABLE, 0 ) else False
     
     def begin( self ):
-        # Power-On : 電源ビットを立てる
-        self._updateRegister( 0x02, REG_02H_ENABLE, 0, REG_02H_ENABLE )
+        # 現在のレジスタ値の取得
+        # シャドウコピーが未読み込みの場合は、一度の連続読み込みで、全レジスタを読み込む。
+        self._loadShadowRegisters()
+        auiRegister = [ self._getRegister( i ) for i in range(SEQUENTIAL_WRITE_FIRST, SHADOW_REGISTER_LAST + 1) ]
+
+        # Register 02H～07H を、一度の連続書き込みで書き込む。（Register 06H は、読み込んだ値をそのまま書き戻す）
+        self._writeRegistersSequential( self._getBeginRegisters( auiRegister ) )
+
+    # 開始と周波数の設定（既に同じ状態の場合は省略する）
+    # 一度の連続読み込みで、チップの全レジスタを読み込み、
+    #   電源が入っていて、周波数以外のレジスタがbegin()の設定と同じ場合は、begin()を省略する。
+    #   さらに、同じ周波数へのチューニングが完了している場合は、周波数の設定も省略する。
+    # 別のプロセス（cronから起動したスクリプト等）が設定済みのチップでは、I2Cアクセスは読み込みの1回のみとなり、
+    # 初期化とチューニングし直しによる、音声の途切れがなくなる。
+    # ( begin()を実行したか, 周波数を設定したか ) を返す。
+    def ensureTuned( self, ulFrequency, bWaitTuningComplete = True, fTimeoutSec = TUNE_TIMEOUT_SEC ):
+        auiRegister = self.readRegisters()
+        auiCurrent = auiRegister[SEQUENTIAL_WRITE_FIRST:SHADOW_REGISTER_LAST + 1]
+        auiBegin = self._getBeginRegisters( auiCurrent )
+
+        # 電源が入っていない場合も、ENABLEビットが異なるので、begin()を実行する。
+        bBegin = any( (uiCurrent ^ uiBegin) & ~BEGIN_COMPARE_IGNORE_BITS.get( SEQUENTIAL_WRITE_FIRST + i, 0 )
+                      for (i, (uiCurrent, uiBegin)) in enumerate( zip( auiCurrent, auiBegin ) ) )
+        if( bBegin ):
+            self._writeRegistersSequential( auiBegin )
+        elif( self.isTunedTo( ulFrequency, auiRegister ) ):
+            return (False, False)
+
+        self.setFrequency( ulFrequency, bWaitTuningComplete, fTimeoutSec )
+        return (bBegin, True)
+
+    # begin()で書き込むレジスタの値（02H～07H）
+    # auiRegister : 現在の 02H～07H の値
+    def _getBeginRegisters( self, auiRegister ):
+        auiRegister = list( auiRegister )
 
         # Register 02H の初期化
-        uiRegister = self._readRegister( 0x02 )
+        uiRegister = auiRegister[0x02 - SEQUENTIAL_WRITE_FIRST]
+        uiRegister |= REG_02H_ENABLE    # Power-On : 電源ビットを立てる
         uiRegister |= REG_02H_DHIZ      # 立てて、Audioオン。(デフォルト値は0)
         uiRegister |= REG_02H_DMUTE     # 立てて、Audioオン。(デフォルト値は0)
         uiRegister &= ~REG_02H_MONO     # モノラルではなくステレオとするので、倒す。(デフォルト値は0)
@@ -184,41 +291,42 @@ class RDA5807M:
         uiRegister &= ~REG_02H_SEEK     # Seek開始時に立てるので、初期化時は倒す。(デフォルト値は0)
         uiRegister &= ~REG_02H_SKMODE   # バンド境界でSeekを継続するかは、Seek開始時に指定するので、どちらでもよく倒す。(デフォルト値は0)
         uiRegister &= ~REG_02H_CLK_MODE_MASK    # 32.768kHz(=0b000)に設定する。(デフォルト値は0)
-        uiRegister &= ~REG_02H_RDS_EN   # RDS/RBDS機能は使用しないので倒す。(デフォルト値は0)
+        uiRegister &= ~REG_02H_RDS_EN   # RDS/RBDS機能は、使用する場合にenableRDS()で立てるので、倒す。(デフォルト値は0)
         uiRegister &= ~REG_02H_NEW_METHOD    # New Demodulate Methodは使用しないので倒す。(デフォルト値は0)
-        self._writeRegister( 0x02, uiRegister )
+        auiRegister[0x02 - SEQUENTIAL_WRITE_FIRST] = uiRegister
 
         # Register 03H の初期化
-        uiRegister = self._readRegister( 0x03 )
+        uiRegister = auiRegister[0x03 - SEQUENTIAL_WRITE_FIRST]
         uiRegister &= ~REG_03H_CHAN_MASK    # 周波数を下限値にする(=0000000000)。(デフォルト値は0x13f)
         uiRegister &= ~REG_03H_TUNE         # Tune開始時に立てるので、初期化時は倒す。(デフォルト値は0)
         uiRegister &= ~REG_03H_BAND_MASK    # AMも聞くためにワイドFMが聴けるWorld Wide(=0b10)(76～108MHz)に設定する。(デフォルト値は0)
         uiRegister |= ( (0b10 << REG_03H_BAND_SHIFT) & REG_03H_BAND_MASK )
         uiRegister &= ~REG_03H_SPACE_MASK   # 0.1MHz単位で指定できるように、100kHz(=0b00)に設定する。(デフォルト値は0)
-        self._writeRegister( 0x03, uiRegister )
+        auiRegister[0x03 - SEQUENTIAL_WRITE_FIRST] = uiRegister
         
         # Register 04H の初期化
-        uiRegister = self._readRegister( 0x04 )
+        uiRegister = auiRegister[0x04 - SEQUENTIAL_WRITE_FIRST]
         uiRegister |= REG_04H_DE            # 日本のFM放送のDe-emphasisは、50μsなので、立てる。(デフォルト値は0)
         uiRegister &= ~REG_04H_SOFTMUTE_EN  # 倒して、Audioオン。(デフォルト値は0)
         uiRegister &= ~REG_04H_AFCD         # 自動周波数制御機能を使用するので倒す。(デフォルト値は0)
-        self._writeRegister( 0x04, uiRegister )
+        auiRegister[0x04 - SEQUENTIAL_WRITE_FIRST] = uiRegister
 
         # Register 05H の初期化
-        uiRegister = self._readRegister( 0x05 )
+        uiRegister = auiRegister[0x05 - SEQUENTIAL_WRITE_FIRST]
         uiRegister &= ~REG_05H_SEEKTH_MASK  # シーク閾値として、8(=0b1000)に設定する。(デフォルト値は0b1000)
         uiRegister |= ( (0b1000 << REG_05H_SEEKTH_SHIFT) & REG_05H_SEEKTH_MASK )
         uiRegister &= ~REG_05H_VOLUME_MASK  # ボリューム値を、11(=0b1011)に設定する。(デフォルト値は0b1011)
         uiRegister |= ( (0b1011 << REG_05H_VOLUME_SHIFT) & REG_05H_VOLUME_MASK )
-        self._writeRegister( 0x05, uiRegister )
+        auiRegister[0x05 - SEQUENTIAL_WRITE_FIRST] = uiRegister
 
         # Register 07H の初期化
-        uiRegister = self._readRegister( 0x07 )
+        uiRegister = auiRegister[0x07 - SEQUENTIAL_WRITE_FIRST]
         uiRegister &= ~REG_07H_TH_SOFTBLEND_MASK    # ソフトブレンド閾値として、16(=0b10000)に設定する。(デフォルト値は0b10000)
         uiRegister |= ( (0b10000 << REG_07H_TH_SOFTBLEND_SHIFT) & REG_07H_TH_SOFTBLEND_MASK )
         uiRegister |= REG_07H_65M_50M_MODE  # BANDが0b11のときにのみ意味がある。デフォルト値として立てる。(デフォルト値は1)
         uiRegister |= REG_07H_SOFTBLEND_EN  # ソフトブレンド機能を使用するので立てる。(デフォルト値は1)
-        self._writeRegister( 0x07, uiRegister )
+        auiRegister[0x07 - SEQUENTIAL_WRITE_FIRST] = uiRegister
+        return auiRegister
 
     # 終了
     def end( self ):
@@ -269,7 +377,7 @@ class RDA5807M:
         elif( 2 == byBand ):
             return 76000
         elif( 3 == byBand ):
-            if( self._readRegister( 0x07 ) & REG_07H_65M_50M_MODE ):
+            if( self._getRegister( 0x07 ) & REG_07H_65M_50M_MODE ):
                 # 「バンド値が3(=0b11)」かつ「65M_50M_MODEビットが立っている」場合は、65～76MHz(East Europe)
                 return 65000
             return 50000
@@ -277,6 +385,28 @@ class RDA5807M:
         # BAND値が仕様範囲外の場合は、ゼロを返す。
         return 0
 
+    # 周波数の最大値の取得
+    def getFrequencyMax( self ):
+        # BAND値の取得
+        byBand = self.getBand()
+
+        # BAND値から周波数の最大値が決まる
+        # 00 = 87～108MHz(US/Europe), 01 = 76～91MHz(Japan), 10 = 76～108MHz(World Wide), 11 = 65～76MHz(East Europe) or 50～65MHz
+        if(   0 == byBand ):
+            return 108000
+        elif( 1 == byBand ):
+            return 91000
+        elif( 2 == byBand ):
+            return 108000
+        elif( 3 == byBand ):
+            if( self._getRegister( 0x07 ) & REG_07H_65M_50M_MODE ):
+                # 「バンド値が3(=0b11)」かつ「65M_50M_MODEビットが立っている」場合は、65～76MHz(East Europe)
+                return 76000
+            return 65000
+
+        # BAND値が仕様範囲外の場合は、ゼロを返す。
+        return 0
+
     # 現在の周波数の取得
     def getFrequency( self ):
         #ulFrequencyMin = self.getFrequencyMin()
@@ -287,8 +417,44 @@ class RDA5807M:
         # Frequency[kHz] = ChannelSpacing[kHz] x CHAN + FrequencyMin[kHz]
         return byChannelSpacing * self.getREADCHAN() + ulFrequencyMin
 
+    # 設定したCHANの周波数の取得（03H。チップでチューニング中、チップがリセットされた場合も、最後に設定した周波数を返す）
+    def getCHANFrequency( self ):
+        # Frequency[kHz] = ChannelSpacing[kHz] x CHAN + FrequencyMin[kHz]（getFrequency()と同じく、76MHz～、100kHz間隔とする）
+        return 100 * self._decodeRegister( 0x03, REG_03H_CHAN_MASK, REG_03H_CHAN_SHIFT ) + 76000
+
     # 周波数の設定
-    def setFrequency( self, ulFrequency, bWaitTuningComplete = True ):
+    # bWaitTuningComplete が True の場合は、チューニング完了を待つ。fTimeoutSec 以内に完了しない場合は、TimeoutError例外を送出する。
+    def setFrequency( self, ulFrequency, bWaitTuningComplete = True, fTimeoutSec = TUNE_TIMEOUT_SEC ):
+        uiCHAN = self._getCHAN( ulFrequency )
+
+        # チューニングする周波数の設定と、Tune開始
+        # 補足）CHANの書き込みは、TUNEビットを立てないと無視される。
+        #       TUNEビットは、Tuneオペレーション完了後に倒れる。
+        self._clearInterrupt()
+        self._updateRegister( 0x03, REG_03H_CHAN_MASK | REG_03H_TUNE, 0, (uiCHAN << REG_03H_CHAN_SHIFT) | REG_03H_TUNE )
+
+        # チューニング完了を待つ
+        if bWaitTuningComplete:
+            self.waitSeekTuneComplete( fTimeoutSec )
+
+    # 指定の周波数へのチューニングが完了しているか
+    # 設定済みのCHAN（03H）と、チップのREADCHAN（0AH）が、指定の周波数と同じで、STCビットが立っている場合にTrue。
+    # auiRegister : readRegisters() で読み込み済みの全レジスタ。Noneの場合は、0AHのみ読み込む。
+    def isTunedTo( self, ulFrequency, auiRegister = None ):
+        uiCHAN = self._getCHAN( ulFrequency )
+        if( auiRegister is None ):
+            uiRegister03 = self._getRegister( 0x03 )
+            uiRegister0A = self._readRegistersSequential( 1 )[0]
+        else:
+            uiRegister03 = auiRegister[0x03]
+            uiRegister0A = auiRegister[0x0A]
+        return True if ( (uiCHAN == (uiRegister03 & REG_03H_CHAN_MASK) >> REG_03H_CHAN_SHIFT)
+                         and (not (uiRegister03 & REG_03H_TUNE))
+                         and (uiCHAN == (uiRegister0A & REG_0AH_READCHAN_MASK) >> REG_0AH_READCHAN_SHIFT)
+                         and (uiRegister0A & REG_0AH_STC) ) else False
+
+    # 周波数[kHz]から、CHANの値への変換
+    def _getCHAN( self, ulFrequency ):
         #ulFrequencyMin = self.getFrequencyMin()
         ulFrequencyMin = 76000  # 処理効率化（レジスタの値の読み込みを省略）
         #byChannelSpacing = self.getChannelSpacing()
@@ -305,18 +471,7 @@ class RDA5807M:
         # 上限値を超える場合は、上限値に。
         if( CHAN_MAX < uiCHAN ):
             uiCHAN = CHAN_MAX
-
-        # チューニングする周波数の設定と、Tune開始
-        # 補足）CHANの書き込みは、TUNEビットを立てないと無視される。
-        #       TUNEビットは、Tuneオペレーション完了後に倒れる。
-        self._updateRegister( 0x03, REG_03H_CHAN_MASK | REG_03H_TUNE, 0, (uiCHAN << REG_03H_CHAN_SHIFT) | REG_03H_TUNE )
-
-        # チューニング完了を待つ
-        if bWaitTuningComplete:
-            # TUNEビットが立っている場合は、Tune中なので、ビットが倒れるまで待つ。
-            while( self._readRegister( 0x03 ) & REG_03H_TUNE ):
-                # TUNEビットが倒れるまで待つ。
-                time.sleep(0.001) # 1msec
+        return uiCHAN
 
     # RSSI値の取得
     # Received Signal Strength Indicator : 受信強度
@@ -326,26 +481,112 @@ class RDA5807M:
     def getRssiMax( self ):
         return (REG_0BH_RSSI_MASK >> REG_0BH_RSSI_SHIFT)
 
+    # 受信状態の読み込み
+    # 一度の連続読み込み（0AH、0BHの4バイト）で、受信状態を読み込む。（信号品質の定期的な監視用）
+    # ( RSSI, ステレオか, 局か(FM_TRUE), FM_READY, READCHAN ) を返す。
+    def readSignalStatus( self ):
+        auiRegister = self._readRegistersSequential( 2 )
+        return ( (auiRegister[1] & REG_0BH_RSSI_MASK) >> REG_0BH_RSSI_SHIFT,
+                 True if (auiRegister[0] & REG_0AH_ST) else False,
+                 True if (auiRegister[1] & REG_0BH_FM_TRUE) else False,
+                 True if (auiRegister[1] & REG_0BH_FM_READY) else False,
+                 (auiRegister[0] & REG_0AH_READCHAN_MASK) >> REG_0AH_READCHAN_SHIFT )
+
     # - シーク関連 -
 
     # Seek操作
-    def seek( self, bUp, bWrap = True ):
-        # シーク方向。REG_02H_SEEKUPのビットの更新
-        self._updateRegister( 0x02, REG_02H_SEEKUP, 0, REG_02H_SEEKUP if bUp else 0 )
+    # bWaitSeekComplete が True の場合は、Seek完了を待ち、局が見つかったかどうかを返す。
+    # fTimeoutSec 以内に完了しない場合は、Seekを中止し、TimeoutError例外を送出する。
+    def seek( self, bUp, bWrap = True, bWaitSeekComplete = True, fTimeoutSec = SEEK_TIMEOUT_SEC ):
+        # シーク方向（REG_02H_SEEKUPビット）、周波数終端での挙動（REG_02H_SKMODEビット）の設定と、Seek開始（REG_02H_SEEKビット）を、一度の書き込みで行う。
+        # REG_02H_SKMODE
+        #   0 = wrap at the upper or lower band limit and continue seeking.
+        #   1 = stop seeking at the upper or lower band limit.
+        # 補足）SEEKビットは、Seekオペレーション完了後に倒れる
+        uiValue = REG_02H_SEEK
+        uiValue |= REG_02H_SEEKUP if bUp else 0
+        uiValue |= 0 if bWrap else REG_02H_SKMODE
+        self._clearInterrupt()
+        self._updateRegister( 0x02, REG_02H_SEEKUP | REG_02H_SKMODE | REG_02H_SEEK, 0, uiValue )
+
+        # Seekによりチップ側でCHANが更新されるので、Register 03H のシャドウコピーは無効にする。
+        self._invalidateShadowRegister( 0x03 )
+
+        if( not bWaitSeekComplete ):
+            return None
+
+        # Seek完了を待つ
+        try:
+            uiRegister0A = self.waitSeekTuneComplete( fTimeoutSec )
+        except TimeoutError:
+            self.stopSeek()
+            raise
+
+        # SFビットが倒れていれば、局が見つかった。
+        return False if ( uiRegister0A & REG_0AH_SF ) else True
+
+    # Seekの中止
+    def stopSeek( self ):
+        # SEEKビットを倒して書き込む。（シャドウコピーのSEEKビットは倒れている）
+        self._writeRegister( 0x02, self._getRegister( 0x02 ) )
+
+    # Seek/Tuneが完了しているかどうか（STCビット）
+    def isSeekTuneComplete( self ):
+        return True if ( self._readRegister( 0x0A ) & REG_0AH_STC ) else False
+
+    # Seek/Tune完了待ち
+    # 割り込みモードの場合は、GPIO2の割り込みを待つ。ポーリングモードの場合は、間隔を徐々に延ばしながらSTCビットを確認する。
+    # 完了時のRegister 0AH の値を返す。fTimeoutSec 以内に完了しない場合は、TimeoutError例外を送出する。
+    def waitSeekTuneComplete( self, fTimeoutSec ):
+        fDeadline = time.monotonic() + fTimeoutSec
+        iPoll = 0
+        while( True ):
+            fRemainingSec = fDeadline - time.monotonic()
+            if( self._gpio is not None ):
+                # 割り込みを待つ。割り込みが来なくても、タイムアウト時に一度だけSTCビットを確認する。
+                if( self._gpio.waitForEdge( self._iInterruptPin, max( fRemainingSec, 0 ) ) ):
+                    self._gpio.clearEdge( self._iInterruptPin )
+            else:
+                time.sleep( max( min( STC_POLL_INTERVALS_SEC[min( iPoll, len(STC_POLL_INTERVALS_SEC) - 1 )], fRemainingSec ), 0 ) )
+                iPoll += 1
+
+            uiRegister0A = self._readRegister( 0x0A )
+            if( uiRegister0A & REG_0AH_STC ):
+                return uiRegister0A
+
+            if( time.monotonic() >= fDeadline ):
+                raise TimeoutError( "Seek/Tune did not complete within %.3f[sec]." % fTimeoutSec )
+
+    # - 割り込み関連 -
+
+    # Seek/Tune完了割り込みの有効化
+    # gpio : GPIOバックエンド（rda5807m.gpio 参照）。iPin : GPIO2を接続したGPIOピン番号（BCM）
+    def enableSTCInterrupt( self, gpio, iPin ):
+        self.disableSTCInterrupt()
+
+        gpio.setup( iPin )
+        self._gpio = gpio
+        self._iInterruptPin = iPin
+
+        # STCIENビットを立て、GPIO2を割り込み出力(=0b01)に設定する。
+        self._updateRegister( 0x04, REG_04H_STCIEN | REG_04H_GPIO2_MASK, 0, REG_04H_STCIEN | (0b01 << REG_04H_GPIO2_SHIFT) )
+
+    # Seek/Tune完了割り込みの無効化
+    def disableSTCInterrupt( self ):
+        if( self._gpio is None ):
+            return
 
-        # 周波数終端での挙動。REG_02H_SKMODEビットの更新
-        # 0 = wrap at the upper or lower band limit and continue seeking.
-        # 1 = stop seeking at the upper or lower band limit.
-        self._updateRegister( 0x02, REG_02H_SKMODE, 0, 0 if bWrap else REG_02H_SKMODE )
+        # STCIENビットを倒し、GPIO2をHigh impedance(=0b00)に戻す。
+        self._updateRegister( 0x04, REG_04H_STCIEN | REG_04H_GPIO2_MASK, 0, 0 )
 
-        # Seek開始
-        # 補足）SEEKビットは、Seekオペレーション完了後に倒れる
-        self._updateRegister( 0x02, REG_02H_SEEK, 0, REG_02H_SEEK )
+        self._gpio.cleanup( self._iInterruptPin )
+        self._gpio = None
+        self._iInterruptPin = None
 
-        # SEEKビットが立っている場合は、Seek中なので、ビットが倒れるまで待つ。
-        while( self._readRegister( 0x02 ) & REG_02H_SEEK ):
-            # SEEKビットが倒れるまで待つ。
-            time.sleep(0.001) # 1msec
+    # 検出済みの割り込みの破棄（Seek/Tune開始前に呼び出す）
+    def _clearInterrupt( self ):
+        if( self._gpio is not None ):
+            self._gpio.clearEdge( self._iInterruptPin )
 
     # SeekTh値の取得
     # SeekThreshold : シーク閾値。値を大きくするとよりクリアな局のみシークし、値を小さくするとよりノイジーな局もシークするようになる。
@@ -401,7 +642,7 @@ class RDA5807M:
 
     # ソフトブレンド（によるノイズ軽減機能）が有効化どうか
     def isSoftBlendEnabled( self ):
-        return True if ( self._readRegister( 0x07 ) & REG_07H_SOFTBLEND_EN ) else False
+        return True if ( self._getRegister( 0x07 ) & REG_07H_SOFTBLEND_EN ) else False
     
     # ソフトブレンド（によるノイズ軽減機能）の有効化/無効化
     def enableSoftBlend( self, bEnable ):
@@ -422,29 +663,104 @@ class RDA5807M:
     def getSoftBlendThMax( self ):
         return SOFTBLENDTH_MAX
 
+    # - RDS -
+
+    # RDSが有効か
+    def isRDSEnabled( self ):
+        return True if self._decodeRegister( 0x02, REG_02H_RDS_EN, 0 ) else False
+
+    # RDSの有効/無効の設定
+    # begin()では無効に初期化されるので、RDSを使用する場合は、begin()の後に有効にする。
+    def enableRDS( self, bEnable ):
+        self._updateRegister( 0x02, REG_02H_RDS_EN, 0, REG_02H_RDS_EN if bEnable else 0 )
+
+    # RDSのグループの読み込み
+    # 一度の連続読み込みで、ステータス(0AH、0BH)とブロックA～D(0CH～0FH)を読み込む。
+    # 新しいグループを受信していない場合は、Noneを返す。
+    # 受信している場合は、( [ブロックA, B, C, D], BLERA, BLERB, READCHAN ) を返す。
+    def readRDSGroup( self ):
+        auiRegister = self._readRegistersSequential( STATUS_REGISTER_SIZE )
+        if( not (auiRegister[0] & REG_0AH_RDSR) ):
+            return None
+        if( auiRegister[1] & REG_0BH_ABCD_E ):
+            # RBDSのブロックEは対象外
+            return None
+        iOffset = RDS_BLOCK_FIRST - SEQUENTIAL_READ_FIRST
+        return ( auiRegister[iOffset:iOffset + RDS_BLOCK_COUNT],
+                 (auiRegister[1] & REG_0BH_BLERA_MASK) >> REG_0BH_BLERA_SHIFT,
+                 (auiRegister[1] & REG_0BH_BLERB_MASK) >> REG_0BH_BLERB_SHIFT,
+                 (auiRegister[0] & REG_0AH_READCHAN_MASK) >> REG_0AH_READCHAN_SHIFT )
+
     # - デバッグ関連 -
 
     # レジスタ列の読み込み
+    # 一度の連続読み込みで、全レジスタ(00H～0FH)を読み込む。
     def readRegisters( self ):
-        # アウトプットの初期化
-        auiRegister = []
+        # 連続読み込みは0AHから始まり、0FHの次は00Hに戻るので、00H始まりに並べ替える。
+        auiSequential = self._readRegistersSequential( READABLE_REGISTER_SIZE )
+        iOffset = READABLE_REGISTER_SIZE - SEQUENTIAL_READ_FIRST
+        auiRegister = auiSequential[iOffset:] + auiSequential[:iOffset]
 
-        for i in range(0, READABLE_REGISTER_SIZE):
-            auiRegister.append( self._readRegister( i ) )
+        # 読み込んだ値で、シャドウコピーを更新する。
+        for byRegAddr in range(SHADOW_REGISTER_FIRST, SHADOW_REGISTER_LAST + 1):
+            self._setShadowRegister( byRegAddr, auiRegister[byRegAddr] )
 
         return auiRegister
 
+    # ステータスレジスタ列の読み込み
+    # 一度の連続読み込みで、0AHからiCount個のレジスタを読み込む。（デフォルトは0AH～0FHの6個）
+    def readStatusRegisters( self, iCount = STATUS_REGISTER_SIZE ):
+        return self._readRegistersSequential( iCount )
+
+    # シャドウコピーの破棄
+    # 他のプロセス等により、チップのレジスタが書き換えられた可能性がある場合に呼び出す。次回参照時にチップから読み込み直す。
+    def invalidateShadowRegisters( self ):
+        for byRegAddr in range(SHADOW_REGISTER_FIRST, SHADOW_REGISTER_LAST + 1):
+            self._invalidateShadowRegister( byRegAddr )
+
     # - レジスタの読み書き -
 
+    # シャドウコピーを保持するレジスタかどうか
+    def _isShadowRegister( self, byRegAddr ):
+        return SHADOW_REGISTER_FIRST <= byRegAddr <= SHADOW_REGISTER_LAST
+
+    # シャドウコピーの更新
+    def _setShadowRegister( self, byRegAddr, uiRegister ):
+        # 自動的に倒れるビットは、倒した状態で保持する。
+        self._auiShadowRegister[byRegAddr] = uiRegister & ~SELF_CLEARING_BITS.get( byRegAddr, 0 ) & 0xFFFF
+
+    # シャドウコピーの読み込み
+    # 未読み込みのレジスタがある場合は、一度の連続読み込みで、全レジスタを読み込む。
+    def _loadShadowRegisters( self ):
+        if( None in self._auiShadowRegister[SHADOW_REGISTER_FIRST:SHADOW_REGISTER_LAST + 1] ):
+            self.readRegisters()
+
+    # シャドウコピーの破棄（1レジスタ分）
+    def _invalidateShadowRegister( self, byRegAddr ):
+        if( self._isShadowRegister( byRegAddr ) ):
+            self._auiShadowRegister[byRegAddr] = None
+
+    # レジスタの値の取得
+    # 書き込み可能レジスタ(02H～07H)は、シャドウコピーから取得する（初回のみチップから読み込む）。
+    # それ以外のレジスタ（ステータス等）は、チップから読み込む。
+    def _getRegister( self, byRegAddr ):
+        if( not self._isShadowRegister( byRegAddr ) ):
+            return self._readRegister( byRegAddr )
+
+        if( self._auiShadowRegister[byRegAddr] is None ):
+            self._setShadowRegister( byRegAddr, self._readRegister( byRegAddr ) )
+        return self._auiShadowRegister[byRegAddr]
+
     # レジスタからの値の解読
     def _decodeRegister( self, byRegAddr, uiMask, byShift ):
-        return ( self._readRegister( byRegAddr ) & uiMask ) >> byShift
+        return ( self._getRegister( byRegAddr ) & uiMask ) >> byShift
 
     # レジスタの値の更新
     def _updateRegister( self, byRegAddr, uiMask, byShift, uiValue  ):
         # uiMaskのビットを倒し、その後、value値をシフトした値のビットを立てる。
         # uiMask以外のビットが更新されないよう、value値はuiMaskでマスクする。
-        self._writeRegister( byRegAddr, ( self._readRegister(byRegAddr) & ~uiMask ) | ( (uiValue << byShift) & uiMask ) )
+        # 現在値はシャドウコピーから取得するので、チップへのアクセスは書き込みのみとなる。
+        self._writeRegister( byRegAddr, ( self._getRegister(byRegAddr) & ~uiMask ) | ( (uiValue << byShift) & uiMask ) )
 
     # レジスタの値の読み込み
     def _readRegister( self, byRegAddr ):
@@ -468,3 +784,38 @@ class RDA5807M:
 
         self._i2c.write_i2c_block_data( self._i2c_addr, byRegAddr, [byHigh, byLow] )
         time.sleep( 0.00001 )    # 10μs(STOP to START Time : Min 1.3[μs]のウェイトを設ける。)
+
+        # シャドウコピーの更新
+        if( self._isShadowRegister( byRegAddr ) ):
+            if( (0x02 == byRegAddr) and (uiRegister & REG_02H_SOFT_RESET) ):
+                # Soft resetにより、全レジスタがデフォルト値に戻るので、シャドウコピーは全て無効にする。
+                self.invalidateShadowRegisters()
+            else:
+                self._setShadowRegister( byRegAddr, uiRegister )
+
+    # レジスタ列の連続読み込み（Sequential access mode）
+    # 一度のトランザクションで、0AHからiCount個のレジスタを読み込む。（0FHの次は00Hに戻る）
+    def _readRegistersSequential( self, iCount ):
+        abyData = self._i2c.readRaw( self._i2c_addr_seq, iCount * 2 )
+        time.sleep( 0.00001 )    # 10μs(STOP to START Time : Min 1.3[μs]のウェイトを設ける。)
+
+        return [ ((abyData[i * 2] & 0xFF) << 8) + (abyData[i * 2 + 1] & 0xFF) for i in range(iCount) ]
+
+    # レジスタ列の連続書き込み（Sequential access mode）
+    # 一度のトランザクションで、02Hから順にauiRegisterの値を書き込む。
+    def _writeRegistersSequential( self, auiRegister ):
+        # 書き込み可能バッファーサイズを超えている場合は、無処理。
+        if( WRITABLE_REGISTER_SIZE < SEQUENTIAL_WRITE_FIRST + len(auiRegister) ):
+            return
+
+        abyData = []
+        for uiRegister in auiRegister:
+            abyData.append( (uiRegister >> 8) & 0xFF )
+            abyData.append( uiRegister & 0xFF )
+
+        self._i2c.writeRaw( self._i2c_addr_seq, abyData )
+        time.sleep( 0.00001 )    # 10μs(STOP to START Time : Min 1.3[μs]のウェイトを設ける。)
+
+        # シャドウコピーの更新
+        for i, uiRegister in enumerate( auiRegister ):
+            self._setShadowRegister( SEQUENTIAL_WRITE_FIRST + i, uiRegister )
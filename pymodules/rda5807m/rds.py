@@ -0,0 +1,314 @@
+# rds.py
+#
+# Classes to read and decode RDS groups from RDA5807M
+#
+# RDSReader      : 一定間隔で、RDA5807Mから受信済みのグループ（ブロックA～D）を読み込み、リングバッファーとデコーダーに渡す。
+#                  1回の確認は、ステータスとブロックの連続読み込み1回（12バイト）のみ。
+# RDSGroupBuffer : 受信したグループを、上限数まで保持するリングバッファー。利用側は、I2Cバスにアクセスせずに、受信済みのグループを読み込める。
+# RDSDecoder     : グループを逐次デコードし、局名(PS)、ラジオテキスト(RT)、時刻(CT)を得る。
+#                  ブロックのダンプファイルからも入力できる。（実機なしでの確認用）
+#
+# ダンプファイルの形式
+#   1行1グループ。ブロックA～Dを、16進数4桁で空白区切り。誤り訂正できないブロックは "----"。
+#   例 : "13E1 0408 E22F 4E48"
+
+# Copyright 2023 Nobuki HIRAMINE
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import collections
+import datetime
+import threading
+import time
+
+# --- 定数定義 ---
+
+RDS_POLL_INTERVAL_SEC = 0.04    # グループの確認間隔[秒]（グループの送信間隔は約87.6ms）
+RDS_DUPLICATE_SEC = 0.08        # この時間内に同じグループを読み込んだ場合は、同じグループの再読み込みとして捨てる
+RDS_BUFFER_SIZE = 256           # リングバッファーに保持するグループ数（約22秒分）
+
+BLER_UNCORRECTABLE = 3          # ブロックエラーレベル。誤り訂正できない。
+
+PS_LENGTH = 8                   # 局名の文字数
+RT_LENGTH_A = 64                # ラジオテキストの文字数（グループ2A）
+RT_LENGTH_B = 32                # ラジオテキストの文字数（グループ2B）
+RT_END = "\r"                   # ラジオテキストの終端文字
+
+MJD_EPOCH = datetime.date( 1858, 11, 17 )   # 修正ユリウス日の起点
+
+# 受信したグループ
+# sequence : 受信順の通し番号（1から）
+# blocks   : ブロックA～D（誤り訂正できないブロックはNone）
+RDSGroup = collections.namedtuple( "RDSGroup", [ "sequence", "timestamp", "blocks" ] )
+
+# --- クラス定義 ---
+
+# グループのリングバッファー
+class RDSGroupBuffer:
+    _deque = None
+    _iSequence = 0
+    _condition = None
+
+    def __init__( self, iSize = RDS_BUFFER_SIZE ):
+        self._deque = collections.deque( maxlen = iSize )
+        self._condition = threading.Condition()
+
+    # グループの追加（一杯の場合は、古いグループを捨てる）
+    def put( self, aBlock, fTimestamp = None ):
+        with self._condition:
+            self._iSequence += 1
+            group = RDSGroup( self._iSequence, time.time() if (fTimestamp is None) else fTimestamp, tuple( aBlock ) )
+            self._deque.append( group )
+            self._condition.notify_all()
+            return group
+
+    # iSequence より後のグループの読み込み
+    # fTimeoutSec : 新しいグループがない場合に待つ時間[秒]。0の場合は待たない。
+    # グループのリストを返す。（バッファーから溢れたグループは含まれない）
+    def read( self, iSequence = 0, fTimeoutSec = 0 ):
+        with self._condition:
+            if( (self._iSequence <= iSequence) and (0 < fTimeoutSec) ):
+                self._condition.wait( fTimeoutSec )
+            return [ group for group in self._deque if iSequence < group.sequence ]
+
+    # 最後に追加したグループの通し番号
+    def getSequence( self ):
+        with self._condition:
+            return self._iSequence
+
+    # 空にする（通し番号は継続する）
+    def clear( self ):
+        with self._condition:
+            self._deque.clear()
+
+# グループのデコーダー
+class RDSDecoder:
+    iPI = None                  # 番組識別コード（Programme Identification）
+    iPTY = None                 # 番組タイプ（Programme Type）
+    strPS = None                # 局名（Programme Service name）。4セグメントとも確定した場合に更新される。
+    strRT = None                # ラジオテキスト（Radio Text）。全セグメントを受信した場合に更新される。
+    dtClockTime = None          # 時刻（Clock Time）。タイムゾーン付きのdatetime。
+    iGroups = 0                 # デコードしたグループ数
+    iErrors = 0                 # 誤り訂正できずに捨てたグループ数
+
+    _achPS = None               # 受信中の局名
+    _atuplePSCandidate = None   # セグメントごとの、受信中の局名の候補（同じ文字を2回続けて受信したら確定する。誤り訂正できない誤りへの対策）
+    _abPSConfirmed = None
+    _achRT = None               # 受信中のラジオテキスト
+    _abRTReceived = None
+    _iRTFlag = None             # ラジオテキストのA/Bフラグ（切り替わったら、新しいテキスト）
+
+    def __init__( self ):
+        self.reset()
+
+    # 初期化（周波数の変更時に呼び出す）
+    def reset( self ):
+        self.iPI = None
+        self.iPTY = None
+        self.strPS = None
+        self.strRT = None
+        self.dtClockTime = None
+        self._achPS = [" "] * PS_LENGTH
+        self._atuplePSCandidate = [None] * (PS_LENGTH // 2)
+        self._abPSConfirmed = [False] * (PS_LENGTH // 2)
+        self._resetRT( None )
+
+    # グループのデコード
+    # aBlock : ブロックA～D（誤り訂正できないブロックはNone）
+    def feed( self, aBlock ):
+        (uiA, uiB, uiC, uiD) = aBlock
+        if( uiB is None ):
+            # グループの種類が分からないので、捨てる。
+            self.iErrors += 1
+            return
+        self.iGroups += 1
+
+        if( uiA is not None ):
+            self.iPI = uiA
+        self.iPTY = (uiB >> 5) & 0x1F
+        iGroupType = uiB >> 12
+        bVersionB = True if (uiB & 0x0800) else False
+
+        if( 0 == iGroupType ):
+            self._decodePS( uiB, uiD )
+        elif( 2 == iGroupType ):
+            self._decodeRT( uiB, uiC, uiD, bVersionB )
+        elif( (4 == iGroupType) and (not bVersionB) ):
+            self._decodeCT( uiB, uiC, uiD )
+
+    # ダンプファイルの行の入力
+    def feedDump( self, iterLine ):
+        for aBlock in readBlockDump( iterLine ):
+            self.feed( aBlock )
+
+    # 局名（グループ0A/0B）。ブロックDに2文字。
+    # 同じセグメントで、同じ2文字を続けて受信したら確定する。
+    def _decodePS( self, uiB, uiD ):
+        if( uiD is None ):
+            return
+        iSegment = uiB & 0x03
+        tupleChar = ( _toChar( uiD >> 8 ), _toChar( uiD & 0xFF ) )
+        if( self._atuplePSCandidate[iSegment] != tupleChar ):
+            self._atuplePSCandidate[iSegment] = tupleChar
+            return
+        self._achPS[iSegment * 2:iSegment * 2 + 2] = tupleChar
+        self._abPSConfirmed[iSegment] = True
+
+        if( all( self._abPSConfirmed ) ):
+            self.strPS = "".join( self._achPS )
+
+    # ラジオテキスト（グループ2A : ブロックC、Dに4文字、2B : ブロックDに2文字）
+    def _decodeRT( self, uiB, uiC, uiD, bVersionB ):
+        iFlag = (uiB >> 4) & 0x01
+        if( iFlag != self._iRTFlag ):
+            self._resetRT( iFlag )
+
+        iSegment = uiB & 0x0F
+        if( bVersionB ):
+            aui = [ uiD ]
+            iLength = RT_LENGTH_B
+        else:
+            aui = [ uiC, uiD ]
+            iLength = RT_LENGTH_A
+        iPos = iSegment * len( aui ) * 2
+        for ui in aui:
+            if( ui is None ):
+                return
+        for ui in aui:
+            for ch in (_toChar( ui >> 8 ), _toChar( ui & 0xFF )):
+                self._achRT[iPos] = ch
+                self._abRTReceived[iPos] = True
+                iPos += 1
+
+        # 終端文字、または末尾までの全文字を受信したら、確定する。
+        iEnd = self._achRT.index( RT_END ) if (RT_END in self._achRT[:iLength]) else iLength
+        if( all( self._abRTReceived[:iEnd] ) ):
+            self.strRT = "".join( self._achRT[:iEnd] ).rstrip()
+
+    def _resetRT( self, iFlag ):
+        self._iRTFlag = iFlag
+        self._achRT = [" "] * RT_LENGTH_A
+        self._abRTReceived = [False] * RT_LENGTH_A
+
+    # 時刻（グループ4A）。修正ユリウス日、UTCの時分、ローカル時刻のオフセット（30分単位）。
+    def _decodeCT( self, uiB, uiC, uiD ):
+        if( (uiC is None) or (uiD is None) ):
+            return
+        iMJD = ((uiB & 0x03) << 15) | (uiC >> 1)
+        iHour = ((uiC & 0x01) << 4) | (uiD >> 12)
+        iMinute = (uiD >> 6) & 0x3F
+        iOffset = (uiD & 0x1F) * (-30 if (uiD & 0x20) else 30)
+        if( (23 < iHour) or (59 < iMinute) ):
+            return
+        dtUTC = datetime.datetime.combine( MJD_EPOCH + datetime.timedelta( days = iMJD ), datetime.time( iHour, iMinute ), datetime.timezone.utc )
+        self.dtClockTime = dtUTC.astimezone( datetime.timezone( datetime.timedelta( minutes = iOffset ) ) )
+
+# グループの読み込み
+class RDSReader:
+    radio = None
+    buffer = None
+    decoder = None
+    _call = None
+    _fPollIntervalSec = RDS_POLL_INTERVAL_SEC
+    _fileDump = None
+    _thread = None
+    _eventStop = None
+
+    # コンストラクタ
+    # call     : I2Cアクセスを実行する関数 call( func, *args )。
+    #            チューナープール使用時は Tuner.call を指定し、I2Cバスの専用スレッドで、他の操作と交互に実行する。
+    # fileDump : 受信したグループを書き出すファイル（ダンプファイルの形式）。Noneの場合は書き出さない。
+    def __init__( self, radio, call = None, buffer = None, fPollIntervalSec = RDS_POLL_INTERVAL_SEC, fileDump = None ):
+        self.radio = radio
+        self.buffer = buffer if (buffer is not None) else RDSGroupBuffer()
+        self.decoder = RDSDecoder()
+        self._call = call if (call is not None) else (lambda func, *args: func( *args ))
+        self._fPollIntervalSec = fPollIntervalSec
+        self._fileDump = fileDump
+        self._eventStop = threading.Event()
+
+    # 読み込みの開始（RDSを有効にする）
+    def start( self ):
+        self._call( self.radio.enableRDS, True )
+        self._eventStop.clear()
+        self._thread = threading.Thread( target = self._run, daemon = True )
+        self._thread.start()
+
+    # 読み込みの停止
+    # bDisable : RDSを無効にするか（ラジオの電源を切る場合は不要）
+    def stop( self, bDisable = True ):
+        self._eventStop.set()
+        if( self._thread is not None ):
+            self._thread.join()
+            self._thread = None
+        if( bDisable ):
+            self._call( self.radio.enableRDS, False )
+
+    def isRunning( self ):
+        return self._thread is not None
+
+    def _run( self ):
+        aLastBlock = None
+        fLastSec = 0.0
+        iChannel = None
+        while( not self._eventStop.wait( self._fPollIntervalSec ) ):
+            try:
+                tupleGroup = self._call( self.radio.readRDSGroup )
+            except OSError:
+                continue
+            if( tupleGroup is None ):
+                continue
+            (auiBlock, byBlerA, byBlerB, iReadChannel) = tupleGroup
+
+            # 周波数が変わったら、デコード結果を破棄する。
+            if( iChannel != iReadChannel ):
+                iChannel = iReadChannel
+                self.decoder.reset()
+                self.buffer.clear()
+                aLastBlock = None
+
+            # ブロックC、Dのエラーレベルは得られないので、ブロックBのエラーレベルで代用する。
+            aBlock = [ None if (BLER_UNCORRECTABLE <= byBlerA) else auiBlock[0] ] \
+                   + [ None if (BLER_UNCORRECTABLE <= byBlerB) else uiBlock for uiBlock in auiBlock[1:] ]
+
+            fNowSec = time.monotonic()
+            if( (aBlock == aLastBlock) and (fNowSec - fLastSec < RDS_DUPLICATE_SEC) ):
+                continue
+            aLastBlock = aBlock
+            fLastSec = fNowSec
+
+            self.buffer.put( aBlock )
+            self.decoder.feed( aBlock )
+            if( self._fileDump is not None ):
+                self._fileDump.write( formatBlockDump( aBlock ) + "\n" )
+
+# --- 関数定義 ---
+
+# ダンプファイルの行の読み込み
+# ブロックA～Dのリスト（誤り訂正できないブロックはNone）を、順に返す。空行、"#"で始まる行は読み飛ばす。
+def readBlockDump( iterLine ):
+    for strLine in iterLine:
+        astrBlock = strLine.split()
+        if( (not astrBlock) or astrBlock[0].startswith( "#" ) ):
+            continue
+        if( 4 != len( astrBlock ) ):
+            raise ValueError( "Invalid RDS dump line : %s" % strLine.rstrip() )
+        yield [ None if ("----" == strBlock) else int( strBlock, 16 ) for strBlock in astrBlock ]
+
+# ダンプファイルの行の作成
+def formatBlockDump( aBlock ):
+    return " ".join( "----" if (uiBlock is None) else ("%04X" % uiBlock) for uiBlock in aBlock )
+
+# RDSの文字コードから文字への変換（ASCIIの範囲のみ。それ以外は"?"）
+def _toChar( byCode ):
+    return chr( byCode ) if (0x20 <= byCode < 0x7F) else ("\r" if (0x0D == byCode) else "?")
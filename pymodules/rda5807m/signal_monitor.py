@@ -0,0 +1,233 @@
+# signal_monitor.py
+#
+# Classes to monitor the signal quality of RDA5807M during a recording
+#
+# SignalMonitor      : 一定間隔で、RDA5807Mの受信状態（RSSI、ステレオ、FM_TRUE、FM_READY）を読み込み、
+#                      リングバッファー、集計、時系列ファイルに記録する。
+#                      1回の読み込みは、ステータスの連続読み込み1回（0AH、0BHの4バイト）のみ。
+# SignalSampleBuffer : 読み込んだ受信状態を、上限数まで保持するリングバッファー。（array による固定長の配列で、サンプルごとのオブジェクトを作らない）
+# SignalSummary      : 受信状態の逐次の集計（RSSIの最小・平均・最大、ステレオの割合、途切れの回数と時間）。
+#                      録音全体の集計を、時系列を読み直さずに得られる。
+#
+# 時系列ファイル（CSV）の形式
+#   1行目はヘッダー（"#"で始まる）。以降は1行1サンプル。
+#   時刻（UNIX時刻[秒]）,RSSI,ステレオ(0/1),FM_TRUE(0/1),FM_READY(0/1)
+#   例 : "1700000000.0,42,1,1,1"
+# 録音終了時に、集計を、時系列ファイルと同じ名前の拡張子 ".json" のファイルに書き出す。
+
+# Copyright 2023 Nobuki HIRAMINE
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import array
+import json
+import os
+import threading
+import time
+
+# --- 定数定義 ---
+
+SIGNAL_INTERVAL_SEC = 1.0       # 受信状態の読み込み間隔[秒]
+SIGNAL_BUFFER_SIZE = 3600       # リングバッファーに保持するサンプル数（1秒間隔で1時間分）
+DROPOUT_RSSI = 15               # RSSIがこの値未満のサンプルを、途切れとみなす
+SERIES_FLUSH_SAMPLES = 60       # 時系列ファイルを、何サンプルごとにフラッシュするか（異常終了時に失われる量の上限）
+
+SERIES_EXTENSION = ".signal.csv"    # 録音ファイルに対する、時系列ファイルの拡張子
+SERIES_HEADER = "# time,rssi,stereo,fm_true,fm_ready"
+
+# サンプルのフラグ
+FLAG_STEREO = 0x01
+FLAG_FM_TRUE = 0x02
+FLAG_FM_READY = 0x04
+
+# --- クラス定義 ---
+
+# 受信状態のリングバッファー
+class SignalSampleBuffer:
+    _afTime = None          # 時刻（UNIX時刻[秒]）
+    _abyRSSI = None
+    _abyFlags = None        # FLAG_* の組み合わせ
+    _iSize = 0
+    _iNext = 0              # 次に書き込む位置
+    _iCount = 0
+
+    def __init__( self, iSize = SIGNAL_BUFFER_SIZE ):
+        self._iSize = iSize
+        self._afTime = array.array( "d", bytes( 8 * iSize ) )
+        self._abyRSSI = array.array( "B", bytes( iSize ) )
+        self._abyFlags = array.array( "B", bytes( iSize ) )
+
+    def __len__( self ):
+        return self._iCount
+
+    def put( self, fTime, byRSSI, byFlags ):
+        self._afTime[self._iNext] = fTime
+        self._abyRSSI[self._iNext] = byRSSI
+        self._abyFlags[self._iNext] = byFlags
+        self._iNext = (self._iNext + 1) % self._iSize
+        self._iCount = min( self._iCount + 1, self._iSize )
+
+    # 保持しているサンプルの取得
+    # 新しい方から iCount 個（省略時は全て）を、( 時刻, RSSI, フラグ ) のリストで、古い順に返す。
+    def getSamples( self, iCount = None ):
+        iCount = self._iCount if (iCount is None) else min( iCount, self._iCount )
+        aSample = []
+        for i in range( self._iNext - iCount, self._iNext ):
+            i %= self._iSize
+            aSample.append( (self._afTime[i], self._abyRSSI[i], self._abyFlags[i]) )
+        return aSample
+
+# 受信状態の集計
+class SignalSummary:
+    iSamples = 0
+    iRSSIMin = None
+    iRSSIMax = None
+    iRSSISum = 0
+    iStereoSamples = 0
+    iStationSamples = 0     # FM_TRUEのサンプル数
+    iDropouts = 0           # 途切れの回数（連続する途切れのサンプルは1回）
+    iDropoutSamples = 0
+    fFirstTime = None
+    fLastTime = None
+    _bInDropout = False
+
+    def add( self, fTime, byRSSI, byFlags, bDropout ):
+        self.iSamples += 1
+        self.iRSSIMin = byRSSI if (self.iRSSIMin is None) else min( self.iRSSIMin, byRSSI )
+        self.iRSSIMax = byRSSI if (self.iRSSIMax is None) else max( self.iRSSIMax, byRSSI )
+        self.iRSSISum += byRSSI
+        if( byFlags & FLAG_STEREO ):
+            self.iStereoSamples += 1
+        if( byFlags & FLAG_FM_TRUE ):
+            self.iStationSamples += 1
+        if( bDropout ):
+            self.iDropoutSamples += 1
+            if( not self._bInDropout ):
+                self.iDropouts += 1
+        self._bInDropout = bDropout
+        if( self.fFirstTime is None ):
+            self.fFirstTime = fTime
+        self.fLastTime = fTime
+
+    # fIntervalSec : サンプルの間隔[秒]（途切れの時間の算出に使用する）
+    def toDict( self, fIntervalSec = SIGNAL_INTERVAL_SEC ):
+        return { "samples" : self.iSamples,
+                 "start" : self.fFirstTime,
+                 "end" : self.fLastTime,
+                 "rssi_min" : self.iRSSIMin,
+                 "rssi_mean" : (self.iRSSISum / self.iSamples) if self.iSamples else None,
+                 "rssi_max" : self.iRSSIMax,
+                 "stereo_ratio" : (self.iStereoSamples / self.iSamples) if self.iSamples else None,
+                 "station_ratio" : (self.iStationSamples / self.iSamples) if self.iSamples else None,
+                 "dropouts" : self.iDropouts,
+                 "dropout_sec" : self.iDropoutSamples * fIntervalSec }
+
+# 受信状態の監視
+class SignalMonitor:
+    radio = None
+    buffer = None
+    summary = None
+    _call = None
+    _fIntervalSec = SIGNAL_INTERVAL_SEC
+    _iDropoutRSSI = DROPOUT_RSSI
+    _strSeriesPath = None
+    _fileSeries = None
+    _lock = None            # buffer、summary の排他（監視スレッドと、集計を参照するスレッド）
+    _thread = None
+    _eventStop = None
+
+    # コンストラクタ
+    # call          : I2Cアクセスを実行する関数 call( func, *args )。
+    #                 チューナープール使用時は Tuner.call を指定し、I2Cバスの専用スレッドで、他の操作と交互に実行する。
+    # strSeriesPath : 時系列ファイルのパス。Noneの場合は書き出さない。
+    def __init__( self, radio, call = None, fIntervalSec = SIGNAL_INTERVAL_SEC, iBufferSize = SIGNAL_BUFFER_SIZE,
+                  iDropoutRSSI = DROPOUT_RSSI, strSeriesPath = None ):
+        self.radio = radio
+        self.buffer = SignalSampleBuffer( iBufferSize )
+        self.summary = SignalSummary()
+        self._call = call if (call is not None) else (lambda func, *args: func( *args ))
+        self._fIntervalSec = fIntervalSec
+        self._iDropoutRSSI = iDropoutRSSI
+        self._strSeriesPath = strSeriesPath
+        self._lock = threading.Lock()
+        self._eventStop = threading.Event()
+
+    # 監視の開始
+    def start( self ):
+        if( self._strSeriesPath is not None ):
+            self._fileSeries = open( self._strSeriesPath, "w", encoding = "utf-8" )
+            self._fileSeries.write( SERIES_HEADER + "\n" )
+        self._eventStop.clear()
+        self._thread = threading.Thread( target = self._run, daemon = True )
+        self._thread.start()
+
+    # 監視の停止
+    # 時系列ファイルを閉じ、集計をファイルに書き出して、集計（dict）を返す。
+    def stop( self ):
+        self._eventStop.set()
+        if( self._thread is not None ):
+            self._thread.join()
+            self._thread = None
+        dictSummary = self.getSummary()
+        if( self._fileSeries is not None ):
+            self._fileSeries.close()
+            self._fileSeries = None
+            with open( getSummaryPath( self._strSeriesPath ), "w", encoding = "utf-8" ) as file:
+                json.dump( dictSummary, file, indent = 2 )
+        return dictSummary
+
+    def isRunning( self ):
+        return self._thread is not None
+
+    # 集計の取得（監視中でも取得できる）
+    def getSummary( self ):
+        with self._lock:
+            return self.summary.toDict( self._fIntervalSec )
+
+    # 直近のサンプルの取得（SignalSampleBuffer.getSamples 参照）
+    def getSamples( self, iCount = None ):
+        with self._lock:
+            return self.buffer.getSamples( iCount )
+
+    def _run( self ):
+        # 読み込みにかかった時間で間隔がずれないよう、開始時刻からの一定間隔で読み込む。
+        fNextSec = time.monotonic()
+        iUnflushed = 0
+        while( not self._eventStop.wait( max( 0, fNextSec - time.monotonic() ) ) ):
+            fNextSec += self._fIntervalSec
+            try:
+                (byRSSI, bStereo, bFMTrue, bFMReady, iReadChannel) = self._call( self.radio.readSignalStatus )
+            except OSError:
+                continue
+            fTime = time.time()
+            byFlags = (FLAG_STEREO if bStereo else 0) | (FLAG_FM_TRUE if bFMTrue else 0) | (FLAG_FM_READY if bFMReady else 0)
+            with self._lock:
+                self.buffer.put( fTime, byRSSI, byFlags )
+                self.summary.add( fTime, byRSSI, byFlags, byRSSI < self._iDropoutRSSI )
+
+            if( self._fileSeries is not None ):
+                self._fileSeries.write( "%.1f,%d,%d,%d,%d\n" % (fTime, byRSSI, bStereo, bFMTrue, bFMReady) )
+                iUnflushed += 1
+                if( SERIES_FLUSH_SAMPLES <= iUnflushed ):
+                    self._fileSeries.flush()
+                    iUnflushed = 0
+
+# --- 関数定義 ---
+
+# 録音ファイルのパスから、時系列ファイルのパスを作成する
+def getSeriesPath( strAudioPath ):
+    return os.path.splitext( strAudioPath )[0] + SERIES_EXTENSION
+
+# 時系列ファイルのパスから、集計ファイルのパスを作成する
+def getSummaryPath( strSeriesPath ):
+    return os.path.splitext( strSeriesPath )[0] + ".json"
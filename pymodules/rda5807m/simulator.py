@@ -0,0 +1,419 @@
+# simulator.py
+#
+# Simulated I2C bus with a register-level RDA5807M model
+#
+# 実機（Raspberry Pi、RDA5807M）なしで、RDA5807Mクラスや radio_*.py を動作させ、処理時間を計測するためのI2Cバス。
+# I2CBusと同じインターフェース（read_i2c_block_data、write_i2c_block_data、readRaw、writeRaw、close）を持つ。
+# - レジスタ00H～0FHを保持し、Random access mode、Sequential access mode の読み書きに応答する。
+# - TUNE、SEEKビットの書き込みで、Tune/Seekを開始し、設定した時間の経過後に、STCビット、READCHANを更新する。
+#   STCIENとGPIO2（割り込み出力）が設定されている場合は、完了時に割り込みコールバックを呼び出す。（gpio.FakeGPIOBackend.trigger等）
+# - 受信状態は、バンドプロファイル（局の周波数ごとのRSSI、ステレオ、RDS）から作る。局以外の周波数のRSSIはノイズレベル。
+# - RDSが有効で、受信中の局にRDSの設定がある場合は、約87.6ms間隔でグループ（PS、RT、CT）を生成する。
+# - I2Cのクロック周波数から、トランザクションごとの転送時間を模擬する。（0の場合は待たない）
+#
+# バンドプロファイル（JSON）の形式
+#   { "noise_rssi" : 局以外のRSSI, "station_rssi" : 局とみなすRSSIの最小値,
+#     "stations" : [ { "frequency" : 周波数[MHz], "rssi" : RSSI, "stereo" : ステレオか,
+#                      "rds" : { "pi" : "13E1", "ps" : 局名, "rt" : ラジオテキスト } }, ... ] }
+
+# Copyright 2023 Nobuki HIRAMINE
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import datetime
+import json
+import os
+import threading
+import time
+
+from .rda5807m import *
+
+# --- 定数定義 ---
+
+CHIP_ID = 0x5804                # 00H の CHIPID
+
+# ソフトリセット後のレジスタ値（02H～07H）
+RESET_REGISTERS = { 0x02 : 0x0000, 0x03 : 0x0000, 0x04 : 0x0400, 0x05 : 0x888B, 0x06 : 0x0000, 0x07 : 0x4202 }
+
+TUNE_LATENCY_SEC = 0.025        # Tuneの所要時間[秒]
+SEEK_CHANNEL_LATENCY_SEC = 0.01 # Seekの1チャンネルあたりの所要時間[秒]
+I2C_CLOCK_HZ = 100000           # I2Cのクロック周波数[Hz]（Raspberry Piのデフォルト）
+RDS_GROUP_INTERVAL_SEC = 0.0876 # RDSのグループの送信間隔[秒]（1187.5bps、104ビット）
+RDS_PS_LENGTH = 8               # 局名の文字数
+RDS_RT_LENGTH = 64              # ラジオテキストの文字数（グループ2A）
+
+NOISE_RSSI_DEFAULT = 8          # 局以外の周波数のRSSI
+STATION_RSSI_DEFAULT = 20       # 局とみなすRSSIの最小値（FM_TRUE、Seekの停止）
+ADJACENT_RSSI_DROP = 15         # 隣接チャンネル（±100kHz）での、局のRSSIの減衰量
+
+# バンドごとの周波数の最小値[kHz]（BAND 0～3。BAND 3は、65M_50M_MODEで65000か50000）
+BAND_FREQUENCY_MIN = ( 87000, 76000, 76000, 65000 )
+BAND_FREQUENCY_MAX = ( 108000, 91000, 108000, 76000 )
+SPACE_KHZ = ( 100, 200, 50, 25 )
+
+# --- クラス定義 ---
+
+# バンドプロファイル（周波数ごとの受信状態）
+class BandProfile:
+    iNoiseRSSI = NOISE_RSSI_DEFAULT
+    iStationRSSI = STATION_RSSI_DEFAULT
+    dictStation = None          # 周波数[kHz] → 局の設定（dict）
+
+    def __init__( self, aStation = (), iNoiseRSSI = NOISE_RSSI_DEFAULT, iStationRSSI = STATION_RSSI_DEFAULT ):
+        self.iNoiseRSSI = iNoiseRSSI
+        self.iStationRSSI = iStationRSSI
+        self.dictStation = {}
+        for dictStation in aStation:
+            self.dictStation[int( round( float( dictStation["frequency"] ) * 1000 ) )] = dictStation
+
+    # RSSIの取得
+    def getRSSI( self, ulFrequency ):
+        iRSSI = self.iNoiseRSSI
+        for (ulStation, dictStation) in self.dictStation.items():
+            iDistance = abs( ulStation - ulFrequency )
+            if( 0 == iDistance ):
+                iRSSI = max( iRSSI, int( dictStation.get( "rssi", 40 ) ) )
+            elif( 100 >= iDistance ):
+                iRSSI = max( iRSSI, int( dictStation.get( "rssi", 40 ) ) - ADJACENT_RSSI_DROP )
+        return min( iRSSI, REG_0BH_RSSI_MASK >> REG_0BH_RSSI_SHIFT )
+
+    # 局かどうか（隣接チャンネルは、RSSIが高くても局ではない）
+    def isStation( self, ulFrequency ):
+        return (ulFrequency in self.dictStation) and (self.iStationRSSI <= self.getRSSI( ulFrequency ))
+
+    def isStereo( self, ulFrequency ):
+        return bool( self.dictStation.get( ulFrequency, {} ).get( "stereo", False ) )
+
+    def getRDS( self, ulFrequency ):
+        return self.dictStation.get( ulFrequency, {} ).get( "rds" )
+
+# RDA5807Mを模擬するI2Cバス
+class SimulatedBus:
+    iTransactions = 0           # トランザクション数
+    _profile = None
+    _auiRegister = None
+    _lock = None
+    _clock = None
+    _fTuneLatencySec = TUNE_LATENCY_SEC
+    _fSeekChannelLatencySec = SEEK_CHANNEL_LATENCY_SEC
+    _iI2CClockHz = I2C_CLOCK_HZ
+    _strStatePath = None
+    _interruptCallback = None
+
+    # 実行中のTune/Seek
+    _fOperationDoneSec = None   # 完了時刻（実行中でない場合はNone）
+    _iOperationChannel = None   # 完了時のチャンネル
+    _bOperationFail = False     # Seekで局が見つからなかったか
+    _timerInterrupt = None
+
+    # RDS
+    _fRDSStartSec = None        # 現在の局の受信開始時刻
+    _aRDSGroup = None           # 現在の局の、送信するグループの列
+    _iRDSDelivered = -1         # 読み込み済みのグループの番号
+
+    # コンストラクタ
+    # profile        : バンドプロファイル（BandProfile）。Noneの場合は、局のないバンド。
+    # clock          : 現在時刻[秒]を返す関数（time.monotonic互換）
+    # iI2CClockHz    : 転送時間の模擬に使用する、I2Cのクロック周波数。0の場合は待たない。
+    # strStatePath   : レジスタの値を保存するファイル。指定した場合は、プロセスをまたいで状態を引き継ぐ。（radio_on.py → radio_off.py 等）
+    def __init__( self, profile = None, clock = time.monotonic, fTuneLatencySec = TUNE_LATENCY_SEC,
+                  fSeekChannelLatencySec = SEEK_CHANNEL_LATENCY_SEC, iI2CClockHz = I2C_CLOCK_HZ, strStatePath = None ):
+        self._profile = profile if (profile is not None) else BandProfile()
+        self._clock = clock
+        self._fTuneLatencySec = fTuneLatencySec
+        self._fSeekChannelLatencySec = fSeekChannelLatencySec
+        self._iI2CClockHz = iI2CClockHz
+        self._strStatePath = strStatePath
+        self._lock = threading.RLock()
+        self._auiRegister = [0] * READABLE_REGISTER_SIZE
+        self._auiRegister[0x00] = CHIP_ID
+        self._reset()
+        self._loadState()
+
+    def close( self ):
+        if( self._timerInterrupt is not None ):
+            self._timerInterrupt.cancel()
+
+    # 割り込みコールバックの設定（STCIENが立っていて、GPIO2が割り込み出力の場合に、Tune/Seekの完了時に呼び出す）
+    def setInterruptCallback( self, callback ):
+        self._interruptCallback = callback
+
+    # - I2CBus互換のインターフェース -
+
+    def read_i2c_block_data( self, byAddr, byRegAddr, iLength ):
+        with self._lock:
+            self._transfer( 2 + iLength )
+            self._update()
+            abyData = []
+            for i in range( (iLength + 1) // 2 ):
+                uiRegister = self._readRegister( (byRegAddr + i) % READABLE_REGISTER_SIZE )
+                abyData += [ uiRegister >> 8, uiRegister & 0xFF ]
+            return abyData[:iLength]
+
+    def write_i2c_block_data( self, byAddr, byRegAddr, abyData ):
+        with self._lock:
+            self._transfer( 2 + len( abyData ) )
+            self._update()
+            for i in range( len( abyData ) // 2 ):
+                self._writeRegister( byRegAddr + i, (abyData[i * 2] << 8) | abyData[i * 2 + 1] )
+            self._saveState()
+
+    def readRaw( self, byAddr, iLength ):
+        with self._lock:
+            self._transfer( 1 + iLength )
+            self._update()
+            abyData = []
+            for i in range( (iLength + 1) // 2 ):
+                uiRegister = self._readRegister( (SEQUENTIAL_READ_FIRST + i) % READABLE_REGISTER_SIZE )
+                abyData += [ uiRegister >> 8, uiRegister & 0xFF ]
+            return abyData[:iLength]
+
+    def writeRaw( self, byAddr, abyData ):
+        with self._lock:
+            self._transfer( 1 + len( abyData ) )
+            self._update()
+            for i in range( len( abyData ) // 2 ):
+                self._writeRegister( SEQUENTIAL_WRITE_FIRST + i, (abyData[i * 2] << 8) | abyData[i * 2 + 1] )
+            self._saveState()
+
+    # - レジスタの模擬 -
+
+    def _reset( self ):
+        for (byRegAddr, uiRegister) in RESET_REGISTERS.items():
+            self._auiRegister[byRegAddr] = uiRegister
+        for byRegAddr in range( SEQUENTIAL_READ_FIRST, READABLE_REGISTER_SIZE ):
+            self._auiRegister[byRegAddr] = 0
+        self._fOperationDoneSec = None
+        self._fRDSStartSec = None
+
+    def _readRegister( self, byRegAddr ):
+        uiRegister = self._auiRegister[byRegAddr]
+        if( (RDS_BLOCK_FIRST + RDS_BLOCK_COUNT - 1 == byRegAddr) and (self._auiRegister[0x0A] & REG_0AH_RDSR) ):
+            # ブロックDまで読み込んだら、グループは読み込み済み。
+            self._iRDSDelivered = self._getRDSGroupIndex()
+            self._auiRegister[0x0A] &= ~REG_0AH_RDSR
+        return uiRegister
+
+    def _writeRegister( self, byRegAddr, uiRegister ):
+        if( not (SEQUENTIAL_WRITE_FIRST <= byRegAddr < WRITABLE_REGISTER_SIZE) ):
+            return
+        uiPrevious = self._auiRegister[byRegAddr]
+
+        if( (0x02 == byRegAddr) and (uiRegister & REG_02H_SOFT_RESET) ):
+            self._reset()
+            return
+        self._auiRegister[byRegAddr] = uiRegister
+
+        if( 0x02 == byRegAddr ):
+            if( not (uiRegister & REG_02H_ENABLE) ):
+                # 電源オフ
+                self._fOperationDoneSec = None
+                self._fRDSStartSec = None
+                self._auiRegister[0x0A] = 0
+                self._auiRegister[0x0B] = 0
+            elif( (uiRegister & REG_02H_SEEK) and (not (uiPrevious & REG_02H_SEEK)) ):
+                self._startSeek( True if (uiRegister & REG_02H_SEEKUP) else False, not (uiRegister & REG_02H_SKMODE) )
+            elif( (not (uiRegister & REG_02H_SEEK)) and (uiPrevious & REG_02H_SEEK) and (self._fOperationDoneSec is not None) ):
+                # Seekの中止。その時点のチャンネルで止める。
+                self._fOperationDoneSec = None
+                self._auiRegister[0x0A] |= REG_0AH_STC
+        elif( (0x03 == byRegAddr) and (uiRegister & REG_03H_TUNE) and (self._auiRegister[0x02] & REG_02H_ENABLE) ):
+            self._startOperation( (uiRegister & REG_03H_CHAN_MASK) >> REG_03H_CHAN_SHIFT, self._fTuneLatencySec, False )
+
+    # Tune/Seekの開始
+    def _startOperation( self, iChannel, fLatencySec, bFail ):
+        self._auiRegister[0x0A] &= ~(REG_0AH_STC | REG_0AH_SF | REG_0AH_RDSR)
+        self._fOperationDoneSec = self._clock() + fLatencySec
+        self._iOperationChannel = iChannel
+        self._bOperationFail = bFail
+        self._fRDSStartSec = None
+
+        if( (self._interruptCallback is not None) and self._isInterruptEnabled() ):
+            self._timerInterrupt = threading.Timer( fLatencySec, self._onOperationTimer )
+            self._timerInterrupt.daemon = True
+            self._timerInterrupt.start()
+
+    # Seekの開始。局が見つかるまでチャンネルを進め、所要時間を決める。
+    def _startSeek( self, bUp, bWrap ):
+        iChannelCount = self._getChannelCount()
+        iChannel = self._getCurrentChannel()
+        for iStep in range( 1, iChannelCount + 1 ):
+            iNext = iChannel + (iStep if bUp else -iStep)
+            if( (not bWrap) and (not 0 <= iNext < iChannelCount) ):
+                self._startOperation( max( 0, min( iChannelCount - 1, iNext ) ), iStep * self._fSeekChannelLatencySec, True )
+                return
+            iNext %= iChannelCount
+            if( self._profile.isStation( self._getFrequency( iNext ) ) ):
+                self._startOperation( iNext, iStep * self._fSeekChannelLatencySec, False )
+                return
+        self._startOperation( iChannel, iChannelCount * self._fSeekChannelLatencySec, True )
+
+    # 時刻の経過の反映（Tune/Seekの完了、受信状態、RDS）
+    def _update( self ):
+        fNowSec = self._clock()
+        if( (self._fOperationDoneSec is not None) and (self._fOperationDoneSec <= fNowSec) ):
+            self._completeOperation()
+
+        if( not (self._auiRegister[0x02] & REG_02H_ENABLE) ):
+            return
+        if( (self._fOperationDoneSec is None) and (self._auiRegister[0x0A] & REG_0AH_STC) ):
+            ulFrequency = self._getFrequency( self._getCurrentChannel() )
+            iRSSI = self._profile.getRSSI( ulFrequency )
+            self._auiRegister[0x0B] = (iRSSI << REG_0BH_RSSI_SHIFT) | REG_0BH_FM_READY \
+                                    | (REG_0BH_FM_TRUE if self._profile.isStation( ulFrequency ) else 0)
+            if( self._profile.isStereo( ulFrequency ) and (not (self._auiRegister[0x02] & REG_02H_MONO)) ):
+                self._auiRegister[0x0A] |= REG_0AH_ST
+            else:
+                self._auiRegister[0x0A] &= ~REG_0AH_ST
+            self._updateRDS( ulFrequency, fNowSec )
+
+    def _completeOperation( self ):
+        self._fOperationDoneSec = None
+        self._auiRegister[0x0A] = (self._auiRegister[0x0A] & ~REG_0AH_READCHAN_MASK & ~REG_0AH_SF) | REG_0AH_STC \
+                                | (REG_0AH_SF if self._bOperationFail else 0) \
+                                | (self._iOperationChannel << REG_0AH_READCHAN_SHIFT)
+        # Seek完了時は、CHANも更新される。
+        self._auiRegister[0x03] = (self._auiRegister[0x03] & ~REG_03H_CHAN_MASK & ~REG_03H_TUNE) | (self._iOperationChannel << REG_03H_CHAN_SHIFT)
+        self._auiRegister[0x02] &= ~REG_02H_SEEK
+
+    def _onOperationTimer( self ):
+        with self._lock:
+            self._update()
+            callback = self._interruptCallback
+        if( callback is not None ):
+            callback()
+
+    def _isInterruptEnabled( self ):
+        uiRegister = self._auiRegister[0x04]
+        return (uiRegister & REG_04H_STCIEN) and (1 == (uiRegister & REG_04H_GPIO2_MASK) >> REG_04H_GPIO2_SHIFT)
+
+    # RDSのグループの生成
+    def _updateRDS( self, ulFrequency, fNowSec ):
+        dictRDS = self._profile.getRDS( ulFrequency )
+        if( (not (self._auiRegister[0x02] & REG_02H_RDS_EN)) or (dictRDS is None) ):
+            self._auiRegister[0x0A] &= ~(REG_0AH_RDSR | REG_0AH_RDSS)
+            return
+        if( self._fRDSStartSec is None ):
+            self._fRDSStartSec = fNowSec
+            self._aRDSGroup = _createRDSGroups( dictRDS )
+            self._iRDSDelivered = -1
+
+        self._auiRegister[0x0A] |= REG_0AH_RDSS
+        iIndex = self._getRDSGroupIndex()
+        if( self._iRDSDelivered < iIndex ):
+            aBlock = self._aRDSGroup[iIndex % len( self._aRDSGroup )]
+            if( aBlock is None ):
+                aBlock = _createClockTimeGroup( int( dictRDS.get( "pi", "0000" ), 16 ) )
+            self._auiRegister[RDS_BLOCK_FIRST:RDS_BLOCK_FIRST + RDS_BLOCK_COUNT] = aBlock
+            self._auiRegister[0x0A] |= REG_0AH_RDSR
+            self._auiRegister[0x0B] &= ~(REG_0BH_ABCD_E | REG_0BH_BLERA_MASK | REG_0BH_BLERB_MASK)
+
+    def _getRDSGroupIndex( self ):
+        return int( (self._clock() - self._fRDSStartSec) / RDS_GROUP_INTERVAL_SEC ) - 1 if (self._fRDSStartSec is not None) else -1
+
+    # - 周波数 -
+
+    def _getBandRange( self ):
+        byBand = (self._auiRegister[0x03] & REG_03H_BAND_MASK) >> REG_03H_BAND_SHIFT
+        if( (3 == byBand) and (not (self._auiRegister[0x07] & REG_07H_65M_50M_MODE)) ):
+            return (50000, 65000)
+        return (BAND_FREQUENCY_MIN[byBand], BAND_FREQUENCY_MAX[byBand])
+
+    def _getSpacing( self ):
+        return SPACE_KHZ[(self._auiRegister[0x03] & REG_03H_SPACE_MASK) >> REG_03H_SPACE_SHIFT]
+
+    def _getChannelCount( self ):
+        (ulMin, ulMax) = self._getBandRange()
+        return (ulMax - ulMin) // self._getSpacing() + 1
+
+    def _getFrequency( self, iChannel ):
+        return self._getBandRange()[0] + iChannel * self._getSpacing()
+
+    def _getCurrentChannel( self ):
+        return (self._auiRegister[0x0A] & REG_0AH_READCHAN_MASK) >> REG_0AH_READCHAN_SHIFT
+
+    # - 転送時間、状態の保存 -
+
+    # 転送時間の模擬（アドレス、データの各バイトは、ACKを含めて9クロック）
+    def _transfer( self, iBytes ):
+        self.iTransactions += 1
+        if( 0 < self._iI2CClockHz ):
+            time.sleep( iBytes * 9 / self._iI2CClockHz )
+
+    def _loadState( self ):
+        if( (self._strStatePath is None) or (not os.path.exists( self._strStatePath )) ):
+            return
+        with open( self._strStatePath ) as file:
+            auiRegister = json.load( file )["registers"]
+        self._auiRegister[SEQUENTIAL_WRITE_FIRST:] = auiRegister[SEQUENTIAL_WRITE_FIRST:]
+        self._auiRegister[0x0A] &= ~REG_0AH_RDSR
+        self._fOperationDoneSec = None
+        if( (self._auiRegister[0x02] & REG_02H_ENABLE) and (self._auiRegister[0x03] & REG_03H_TUNE) ):
+            # 前のプロセスで開始したTuneは、完了しているものとする。（状態の保存は書き込み時のみなので、完了は保存されていない）
+            self._iOperationChannel = (self._auiRegister[0x03] & REG_03H_CHAN_MASK) >> REG_03H_CHAN_SHIFT
+            self._bOperationFail = False
+            self._completeOperation()
+
+    def _saveState( self ):
+        if( self._strStatePath is None ):
+            return
+        with open( self._strStatePath, "w" ) as file:
+            json.dump( { "registers" : self._auiRegister }, file )
+
+# --- 関数定義 ---
+
+# バンドプロファイルの読み込み
+def loadBandProfile( strPath ):
+    with open( strPath, encoding = "utf-8" ) as file:
+        dictProfile = json.load( file )
+    return BandProfile( dictProfile.get( "stations", [] ),
+                        int( dictProfile.get( "noise_rssi", NOISE_RSSI_DEFAULT ) ),
+                        int( dictProfile.get( "station_rssi", STATION_RSSI_DEFAULT ) ) )
+
+# 局の送信するグループの列の作成
+# PS（グループ0A）4セグメントを2回、RT（グループ2A）、CT（グループ4A）の順。CTは送信時に作成するので、Noneとする。
+def _createRDSGroups( dictRDS ):
+    iPI = int( dictRDS.get( "pi", "0000" ), 16 )
+    strPS = (dictRDS.get( "ps", "" ) + " " * RDS_PS_LENGTH)[:RDS_PS_LENGTH]
+    aGroup = []
+    for _ in range( 2 ):
+        for iSegment in range( 4 ):
+            aGroup.append( [ iPI, (0 << 12) | iSegment, iPI, _pack( strPS[iSegment * 2:iSegment * 2 + 2] ) ] )
+
+    strRT = dictRDS.get( "rt" )
+    if( strRT ):
+        strRT = strRT[:RDS_RT_LENGTH]
+        if( len( strRT ) < RDS_RT_LENGTH ):
+            strRT += "\r"
+        strRT += " " * (-len( strRT ) % 4)
+        for iSegment in range( len( strRT ) // 4 ):
+            strSegment = strRT[iSegment * 4:iSegment * 4 + 4]
+            aGroup.append( [ iPI, (2 << 12) | iSegment, _pack( strSegment[:2] ), _pack( strSegment[2:] ) ] )
+
+    aGroup.append( None )
+    return aGroup
+
+# CT（グループ4A）の作成。現在時刻（UTC、オフセットはローカル時刻）。
+def _createClockTimeGroup( iPI ):
+    dtNow = datetime.datetime.now( datetime.timezone.utc )
+    iMJD = (dtNow.date() - datetime.date( 1858, 11, 17 )).days
+    iOffset = int( datetime.datetime.now().astimezone().utcoffset().total_seconds() // 1800 )
+    uiB = (4 << 12) | (iMJD >> 15)
+    uiC = ((iMJD & 0x7FFF) << 1) | (dtNow.hour >> 4)
+    uiD = ((dtNow.hour & 0x0F) << 12) | (dtNow.minute << 6) | (0x20 if (iOffset < 0) else 0) | abs( iOffset )
+    return [ iPI, uiB, uiC, uiD ]
+
+# 2文字を、ブロックの16ビットに詰める（ASCII以外の文字は"?"）
+def _pack( str2 ):
+    abyChar = str2.encode( "ascii", "replace" )
+    return (abyChar[0] << 8) | abyChar[1]
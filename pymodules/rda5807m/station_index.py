@@ -0,0 +1,200 @@
+# station_index.py
+#
+# Class to keep an index of known stations
+#
+# バンドスキャンやSeekで見つかった局を、周波数をキーとして、sqliteファイルに保存する。
+# 局ごとに、最後に確認したRSSI、ステレオ表示、確認日時を保持する。
+# - 起動時に全件をメモリに読み込み、周波数での検索は辞書で、近傍の局の検索は二分探索で行う。（I2Cアクセスなし）
+# - 追加・更新・削除は、メモリとsqliteファイルの両方に反映する。
+# - 確認日時が古い局は、removeStale()で削除する。
+
+# Copyright 2023 Nobuki HIRAMINE
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import bisect
+import collections
+import sqlite3
+import time
+
+from .rda5807m import REG_0AH_ST, REG_0AH_READCHAN_MASK, REG_0AH_READCHAN_SHIFT, \
+                      REG_0BH_RSSI_MASK, REG_0BH_RSSI_SHIFT, REG_0BH_FM_TRUE
+
+# --- 定数定義 ---
+
+# 登録済みの局
+StationEntry = collections.namedtuple( "StationEntry", [ "frequency", "rssi", "stereo", "last_seen" ] )
+
+# --- クラス定義 ---
+
+class StationIndex:
+    _db = None
+    _dictEntry = None       # 周波数[kHz] → StationEntry
+    _aulFrequency = None    # 登録済みの周波数[kHz]の昇順リスト
+
+    # コンストラクタ
+    # strPath : sqliteファイルのパス。（":memory:"の場合は、ファイルに保存しない）
+    def __init__( self, strPath ):
+        self._db = sqlite3.connect( strPath, check_same_thread = False )
+        self._db.execute( "CREATE TABLE IF NOT EXISTS stations ( frequency INTEGER PRIMARY KEY, rssi INTEGER, stereo INTEGER, last_seen REAL )" )
+        self._db.commit()
+
+        self._dictEntry = {}
+        for row in self._db.execute( "SELECT frequency, rssi, stereo, last_seen FROM stations" ):
+            self._dictEntry[row[0]] = StationEntry( row[0], row[1], bool( row[2] ), row[3] )
+        self._aulFrequency = sorted( self._dictEntry )
+
+    # 終了
+    def close( self ):
+        self._db.close()
+
+    def __len__( self ):
+        return len( self._aulFrequency )
+
+    # 全局の取得（周波数順）
+    def getAll( self ):
+        return [ self._dictEntry[ulFrequency] for ulFrequency in self._aulFrequency ]
+
+    # - 検索 -
+
+    # 周波数[kHz]での検索。登録がない場合はNoneを返す。
+    def get( self, ulFrequency ):
+        return self._dictEntry.get( ulFrequency )
+
+    # RSSIが最大の局の取得。登録がない場合はNoneを返す。
+    def getBest( self ):
+        if( not self._dictEntry ):
+            return None
+        return max( self._dictEntry.values(), key = lambda entry: entry.rssi )
+
+    # 周波数[kHz]に最も近い局の取得。登録がない場合はNoneを返す。
+    def getNearest( self, ulFrequency ):
+        if( not self._aulFrequency ):
+            return None
+        i = bisect.bisect_left( self._aulFrequency, ulFrequency )
+        aulCandidate = self._aulFrequency[max( i - 1, 0 ):i + 1]
+        return self._dictEntry[min( aulCandidate, key = lambda ulCandidate: abs( ulCandidate - ulFrequency ) )]
+
+    # 周波数[kHz]の次（bUpがTrueの場合は上、Falseの場合は下）の局の取得
+    # bWrapがTrueの場合は、バンドの端に達したら反対の端から探す。局がない場合はNoneを返す。
+    def getNext( self, ulFrequency, bUp, bWrap = True ):
+        if( not self._aulFrequency ):
+            return None
+        if( bUp ):
+            i = bisect.bisect_right( self._aulFrequency, ulFrequency )
+            if( len( self._aulFrequency ) <= i ):
+                if( not bWrap ):
+                    return None
+                i = 0
+        else:
+            i = bisect.bisect_left( self._aulFrequency, ulFrequency ) - 1
+            if( 0 > i ):
+                if( not bWrap ):
+                    return None
+                i = len( self._aulFrequency ) - 1
+        return self._dictEntry[self._aulFrequency[i]]
+
+    # - 追加・更新・削除 -
+
+    # 局の追加・更新
+    def update( self, ulFrequency, byRSSI, bStereo, fTimestamp = None ):
+        self.updateMany( [ (ulFrequency, byRSSI, bStereo) ], fTimestamp )
+
+    # 複数局の追加・更新（一度のトランザクションで保存する）
+    # aStation : (周波数[kHz], RSSI, ステレオ表示) のリスト
+    def updateMany( self, aStation, fTimestamp = None ):
+        if( fTimestamp is None ):
+            fTimestamp = time.time()
+
+        aEntry = [ StationEntry( int( ulFrequency ), int( byRSSI ), bool( bStereo ), fTimestamp ) for (ulFrequency, byRSSI, bStereo) in aStation ]
+        with self._db:
+            self._db.executemany( "INSERT OR REPLACE INTO stations ( frequency, rssi, stereo, last_seen ) VALUES ( ?, ?, ?, ? )", aEntry )
+
+        for entry in aEntry:
+            if( entry.frequency not in self._dictEntry ):
+                bisect.insort( self._aulFrequency, entry.frequency )
+            self._dictEntry[entry.frequency] = entry
+
+    # 局の削除
+    def remove( self, ulFrequency ):
+        self._removeMany( [ ulFrequency ] )
+
+    # 確認日時が fMaxAgeSec[秒] より古い局の削除。削除した局数を返す。
+    def removeStale( self, fMaxAgeSec, fNow = None ):
+        if( fNow is None ):
+            fNow = time.time()
+        aulStale = [ entry.frequency for entry in self._dictEntry.values() if (fMaxAgeSec < fNow - entry.last_seen) ]
+        self._removeMany( aulStale )
+        return len( aulStale )
+
+    # バンドスキャン結果の反映
+    # スキャンした範囲の局は、検出した局（rda5807m.bandscan.Station のリスト）で置き換える。
+    def updateFromScan( self, result, aStation, fTimestamp = None ):
+        ulFrequencyMin = result.getFrequency( 0 )
+        ulFrequencyMax = result.getFrequency( result.getChannelCount() - 1 )
+        setFound = set( station.frequency for station in aStation )
+        self._removeMany( [ ulFrequency for ulFrequency in self._aulFrequency
+                            if (ulFrequencyMin <= ulFrequency <= ulFrequencyMax) and (ulFrequency not in setFound) ] )
+        self.updateMany( [ (station.frequency, station.rssi, station.stereo) for station in aStation ], fTimestamp )
+
+    def _removeMany( self, aulFrequency ):
+        if( not aulFrequency ):
+            return
+        with self._db:
+            self._db.executemany( "DELETE FROM stations WHERE frequency = ?", [ (ulFrequency,) for ulFrequency in aulFrequency ] )
+        for ulFrequency in aulFrequency:
+            if( self._dictEntry.pop( ulFrequency, None ) is not None ):
+                del self._aulFrequency[bisect.bisect_left( self._aulFrequency, ulFrequency )]
+
+# --- 関数定義 ---
+
+# 現在の周波数の状態の読み込み
+# 0AH～0BHの一度の連続読み込みで、(StationEntry, 局であるか（FM_TRUEビット）) を返す。
+def _readCurrentStation( radio ):
+    (uiRegister0A, uiRegister0B) = radio.readStatusRegisters( 2 )
+    ulFrequency = radio.getFrequencyMin() + radio.getChannelSpacing() * ((uiRegister0A & REG_0AH_READCHAN_MASK) >> REG_0AH_READCHAN_SHIFT)
+    entry = StationEntry( ulFrequency, (uiRegister0B & REG_0BH_RSSI_MASK) >> REG_0BH_RSSI_SHIFT,
+                          True if (uiRegister0A & REG_0AH_ST) else False, time.time() )
+    return (entry, True if (uiRegister0B & REG_0BH_FM_TRUE) else False)
+
+# 現在の周波数の局の登録
+# 0AH～0BHの一度の連続読み込みで状態を取得し、局である（FM_TRUEビットが立っている）場合は登録・更新し、StationEntryを返す。
+# 局でない場合は、登録済みであれば削除し、Noneを返す。
+def recordCurrentStation( radio, index ):
+    (entry, bStation) = _readCurrentStation( radio )
+    if( not bStation ):
+        index.remove( entry.frequency )
+        return None
+
+    index.update( entry.frequency, entry.rssi, entry.stereo, entry.last_seen )
+    return index.get( entry.frequency )
+
+# 次の局への移動
+# 登録済みの局がある場合は、その局にTuneする（Seekしない）。
+# 登録済みの局がない場合は、Seekし、見つかった局を登録する。
+# 移動先のStationEntryを返す。局が見つからなかった（Seekが失敗した）場合はNoneを返す。
+# Seekが完了しても、直後の読み込みでFM_TRUEビットが立っていない場合は、登録せず、last_seenがNoneのStationEntry（未確認の局）を返す。
+# （チューナーは、その周波数に移動している）
+def seekStation( radio, index, bUp, bWrap = True ):
+    entry = index.getNext( radio.getFrequency(), bUp, bWrap )
+    if( entry is not None ):
+        radio.setFrequency( entry.frequency )
+        return entry
+
+    if( not radio.seek( bUp, bWrap ) ):
+        return None
+    (entry, bStation) = _readCurrentStation( radio )
+    if( not bStation ):
+        return entry._replace( last_seen = None )
+    index.update( entry.frequency, entry.rssi, entry.stereo, entry.last_seen )
+    return index.get( entry.frequency )
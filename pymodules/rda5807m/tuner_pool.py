@@ -0,0 +1,239 @@
+# tuner_pool.py
+#
+# Classes to manage several RDA5807M chips on multiple I2C buses
+#
+# RDA5807MのI2Cアドレスは固定なので、複数のチップを使用する場合は、チップごとに別のI2Cバスに接続する。
+# （Raspberry Piでは、i2c-gpio等のオーバーレイで、I2Cバスを追加できる）
+# - チューナー（チップと、その音声を入力するキャプチャデバイスの組）を、ジョブ（録音、聴取）に割り当てる。
+# - I2Cアクセスは、バスごとの専用スレッドで実行する。別々のバスのチューナーの操作は並行に、同じバスのチューナーの操作は直列に実行される。
+#   1回の要求で終了するプロセス（radio_client.py の直接操作等）では、スレッドを使わず、呼び出し元のスレッドで実行できる。（bThreaded = False）
+#   この場合は、concurrent.futures（とloggingの）importも省略され、起動が速くなる。
+#
+# 設定ファイル（JSON）の形式
+#   [ { "name" : "tuner0", "bus" : 1, "address" : 17, "capture_device" : "default" }, ... ]
+#   address は Random access mode のI2Cアドレス。Sequential access mode のI2Cアドレスは、address - 1 とする。
+
+# Copyright 2023 Nobuki HIRAMINE
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import collections
+import json
+import os
+import threading
+
+from .rda5807m import RDA5807M, I2C_ADDR_RDA5807M
+from .i2c_bus import openBus
+
+# --- 定数定義 ---
+
+# チューナーの設定
+TunerConfig = collections.namedtuple( "TunerConfig", [ "name", "bus", "address", "capture_device" ] )
+
+# デフォルトのチューナー構成（チップ1つ、I2Cバス1、デフォルトキャプチャデバイス）
+TUNER_CONFIGS_DEFAULT = [ TunerConfig( "tuner0", 1, I2C_ADDR_RDA5807M, "default" ) ]
+
+# --- クラス定義 ---
+
+# 呼び出し元のスレッドで実行する Executor（concurrent.futures.ThreadPoolExecutor の代わり）
+class _InlineExecutor:
+    def submit( self, func, *args ):
+        return _InlineFuture( func, *args )
+
+    def shutdown( self, wait = True ):
+        pass
+
+# _InlineExecutor の実行結果
+class _InlineFuture:
+    _result = None
+    _exception = None
+
+    def __init__( self, func, *args ):
+        try:
+            self._result = func( *args )
+        except Exception as e:
+            self._exception = e
+
+    def result( self ):
+        if( self._exception is not None ):
+            raise self._exception
+        return self._result
+
+# チューナー
+class Tuner:
+    strName = None
+    radio = None
+    strCaptureDevice = None
+    lock = None             # 操作の排他（Seek中に別のジョブがTuneする、といった割り込みを防ぐ）
+    dictJob = None          # 割り当て済みのジョブ名 → 横取り可能か
+    dictJobFrequency = None # 割り当て済みのジョブ名 → 要求された周波数[kHz]（チューナーの復旧時に、設定し直す周波数）
+    _executor = None        # このチューナーが接続されているI2Cバスの専用スレッド
+
+    def __init__( self, strName, radio, strCaptureDevice, executor ):
+        self.strName = strName
+        self.radio = radio
+        self.strCaptureDevice = strCaptureDevice
+        self.lock = threading.RLock()
+        self.dictJob = {}
+        self.dictJobFrequency = {}
+        self._executor = executor
+
+    # I2Cバスの専用スレッドでの実行（Futureを返す）
+    def submit( self, func, *args ):
+        return self._executor.submit( func, *args )
+
+    # I2Cバスの専用スレッドでの実行（完了を待ち、結果を返す）
+    def call( self, func, *args ):
+        return self.submit( func, *args ).result()
+
+    # 割り当て済みのジョブがないか
+    def isIdle( self ):
+        return not self.dictJob
+
+# チューナープール
+class TunerPool:
+    _aTuner = None
+    _dictExecutor = None    # バス番号 → 専用スレッド
+    _dictBus = None         # バス番号 → I2Cバス
+    _lock = None            # 割り当ての排他
+
+    # コンストラクタ
+    # aConfig      : TunerConfig のリスト
+    # busFactory   : バス番号からI2Cバスを生成する関数（テスト用のバスを使用する場合に指定する）
+    # bThreaded    : I2Cアクセスを、バスごとの専用スレッドで実行するか。Falseの場合は、呼び出し元のスレッドで実行する。
+    def __init__( self, aConfig = TUNER_CONFIGS_DEFAULT, busFactory = openBus, bThreaded = True ):
+        self._aTuner = []
+        self._dictExecutor = {}
+        self._dictBus = {}
+        self._lock = threading.Lock()
+
+        for config in aConfig:
+            if( config.bus not in self._dictBus ):
+                self._dictBus[config.bus] = busFactory( config.bus )
+                if( bThreaded ):
+                    import concurrent.futures   # 起動を速くするため、使用する場合のみimportする。
+                    self._dictExecutor[config.bus] = concurrent.futures.ThreadPoolExecutor( max_workers = 1, thread_name_prefix = "i2c-%d" % config.bus )
+                else:
+                    self._dictExecutor[config.bus] = _InlineExecutor()
+            radio = RDA5807M( config.bus, config.address, config.address - 1, bus = self._dictBus[config.bus] )
+            self._aTuner.append( Tuner( config.name, radio, config.capture_device, self._dictExecutor[config.bus] ) )
+
+    # 終了
+    def close( self ):
+        for executor in self._dictExecutor.values():
+            executor.shutdown( wait = True )
+        for bus in self._dictBus.values():
+            bus.close()
+
+    # 全チューナーの取得
+    def getTuners( self ):
+        return list( self._aTuner )
+
+    # 名前でのチューナーの取得。ない場合はNoneを返す。
+    def getTuner( self, strName ):
+        for tuner in self._aTuner:
+            if( strName == tuner.strName ):
+                return tuner
+        return None
+
+    # ジョブが割り当てられているチューナーの取得。ない場合はNoneを返す。
+    def findJob( self, strJob ):
+        with self._lock:
+            for tuner in self._aTuner:
+                if( strJob in tuner.dictJob ):
+                    return tuner
+        return None
+
+    # チューナーの割り当て
+    # 空いているチューナーを割り当てる。空いていない場合は、横取り可能なジョブ（聴取等）だけが割り当てられているチューナーを共用で割り当てる。
+    # bPreemptible : このジョブを、横取り可能とするか
+    # strTuner     : 割り当てるチューナー名。指定した場合は、他のジョブが割り当てられていても、そのチューナーを共用で割り当てる。
+    #                （予約録音で、前の録音のチューナーを電源を切らずに引き継ぐ場合等、呼び出し元で割り当てを計画済みの場合に使用する）
+    # ulFrequency  : このジョブが要求する周波数[kHz]（getJobFrequency()で参照する）
+    # 割り当てたチューナーを返す。割り当てられない場合はNoneを返す。（既に割り当て済みのジョブは、同じチューナーを返す）
+    def acquire( self, strJob, bPreemptible = False, strTuner = None, ulFrequency = None ):
+        with self._lock:
+            tuner = self._acquire( strJob, bPreemptible, strTuner )
+            if( (tuner is not None) and (ulFrequency is not None) ):
+                tuner.dictJobFrequency[strJob] = ulFrequency
+            return tuner
+
+    def _acquire( self, strJob, bPreemptible, strTuner ):
+        for tuner in self._aTuner:
+            if( strJob in tuner.dictJob ):
+                return tuner
+
+        if( strTuner is not None ):
+            for tuner in self._aTuner:
+                if( strTuner == tuner.strName ):
+                    tuner.dictJob[strJob] = bPreemptible
+                    return tuner
+            return None
+
+        tunerShared = None
+        for tuner in self._aTuner:
+            if( tuner.isIdle() ):
+                tuner.dictJob[strJob] = bPreemptible
+                return tuner
+            if( (tunerShared is None) and (not bPreemptible) and all( tuner.dictJob.values() ) ):
+                tunerShared = tuner
+
+        if( tunerShared is not None ):
+            tunerShared.dictJob[strJob] = bPreemptible
+        return tunerShared
+
+    # ジョブが要求する周波数[kHz]の変更（ジョブが周波数を変更した場合に呼び出す）
+    def setJobFrequency( self, strJob, ulFrequency ):
+        with self._lock:
+            for tuner in self._aTuner:
+                if( strJob in tuner.dictJob ):
+                    tuner.dictJobFrequency[strJob] = ulFrequency
+
+    # ジョブが要求した周波数[kHz]の取得。ない場合はNoneを返す。
+    def getJobFrequency( self, strJob ):
+        with self._lock:
+            for tuner in self._aTuner:
+                if( strJob in tuner.dictJobFrequency ):
+                    return tuner.dictJobFrequency[strJob]
+        return None
+
+    # チューナーの解放
+    # 解放したチューナーを返す。ジョブが割り当てられていない場合はNoneを返す。
+    def release( self, strJob ):
+        with self._lock:
+            for tuner in self._aTuner:
+                if( strJob in tuner.dictJob ):
+                    del tuner.dictJob[strJob]
+                    tuner.dictJobFrequency.pop( strJob, None )
+                    return tuner
+        return None
+
+    # 複数のチューナーでの並行実行
+    # atupleCall : (チューナー, 関数, 引数...) のリスト。関数の第1引数には、チューナーのRDA5807Mが渡される。
+    # 結果のリストを返す。
+    def callMany( self, atupleCall ):
+        aFuture = [ tupleCall[0].submit( tupleCall[1], tupleCall[0].radio, *tupleCall[2:] ) for tupleCall in atupleCall ]
+        return [ future.result() for future in aFuture ]
+
+# --- 関数定義 ---
+
+# 設定ファイルの読み込み
+# ファイルがない場合は、デフォルトのチューナー構成を返す。
+def loadTunerConfigs( strPath ):
+    if( not os.path.exists( strPath ) ):
+        return TUNER_CONFIGS_DEFAULT
+
+    with open( strPath, encoding = "utf-8" ) as file:
+        return [ TunerConfig( dictConfig["name"], int( dictConfig.get( "bus", 1 ) ), int( dictConfig.get( "address", I2C_ADDR_RDA5807M ) ),
+                              dictConfig.get( "capture_device", "default" ) )
+                 for dictConfig in json.load( file ) ]
@@ -0,0 +1,204 @@
+# record.py
+# ラジオの音声を録音する
+# キャプチャデバイスからPCMを読み込み、エンコードしながら、出力ファイルに書き込む。
+# Arguments
+#   argv[1] : Recording length [second]
+#   argv[2] : Output file path
+#   --bitrate      : Bit rate for mp3 file [kbps] : Optional. Default is 128[kbps].
+#   --source       : Capture source. "alsa[:device]", "hub[:socket path]", "wav:path" or "tone[:frequency]" : Optional. Default is "alsa".
+#   --encoder      : Encoder. "mp3" or "wav" : Optional. Default is "mp3".
+#   --buffer-sec   : Maximum length of PCM held in memory [second] : Optional.
+#   --deferred     : Deferred encoding mode : Optional.
+#                    エンコーダーの優先度を下げ、エンコードがキャプチャに追いつかない分は、一時ファイルに退避する。
+#                    （record.shのWAV2MP3モードで使用する。WAVファイルの書き込みと読み直しなしに、MP3ファイルを作成する）
+#   --segment-sec  : Segment length [second] : Optional.
+#                    指定すると、一定時間ごとのセグメントに分けて書き込み、プレイリスト（.m3u8）を更新する。（recording/sink.py 参照）
+#   --concat       : Concatenate segments into the output file at the end : Optional. (--segment-sec only)
+#   --flush-kb     : Write size [KiB] : Optional. Default is 1024[KiB].
+#                    エンコードしたデータをメモリ上にためて、このサイズごとにまとめて書き込む。（SDカードへの小さな書き込みを減らす）
+#                    録音中は、出力ファイルパスの末尾に ".part" を付けたファイルに書き込み、終了時に名前を変更する。（recording/sink.py 参照）
+#                    0 を指定すると、ためずに出力ファイルに直接書き込む。
+#   --sync-kb      : Sync (fsync) interval [KiB] : Optional. Default is 4096[KiB]. 0 syncs only at the end. (--flush-kb only)
+#   --transcode    : Transcode profiles (comma separated. e.g. "mp3_128,opus_64") : Optional.
+#                    指定すると、WAVで録音し、録音後の変換を、変換キューに追加する。（transcoder.py が変換する。recording/transcode.py 参照）
+#                    出力ファイルは、先頭のプロファイルは出力ファイルパスの拡張子を変えたもの、2つ目以降はさらに "_プロファイル名" を付けたもの。
+#   --signal       : Signal series file path : Optional.
+#                    録音中のラジオの受信状態を監視し、ファイルに書き出す。（rda5807m/signal_monitor.py 参照）
+#                    radio_server.py（常駐プロセス）を使用しない場合に使用する。（常駐プロセス使用時は、radio_client.py acquire で指定する）
+#   --dropout      : Detect silence and recover the tuner : Optional.
+#                    無音が続いた場合に、ラジオのRSSIを確認し、RSSIが低い場合は、チューナーを設定し直す。（recording/dropout.py 参照）
+#   --job          : Job name of the tuner acquired by "radio_client.py acquire" : Optional. (--dropout only)
+#                    radio_server.py（常駐プロセス）使用時に、復旧するチューナーの指定に使用する。
+#                    指定した場合に radio_server.py に接続できない場合は、チューナーを確保したプロセス（radio_scheduler.py等）以外から
+#                    チューナーを操作しないよう、無音の検出を行わない。
+#   --tuner        : Tuner name to recover : Optional. (--dropout only) Default is the listening tuner or the first tuner.
+#   --no-catalogue : Do not add the output file to the recording catalogue : Optional.
+#                    省略時は、録音の終了時に、出力ファイルを録音の目録に追加する。（catalogue.py 参照）
+#                    --transcode の場合は、変換後のファイルを transcoder.py が追加する。
+#   --quiet        : Quiet mode. Suppress messages. : Optional.
+
+import argparse
+import datetime
+import os
+import signal
+import sys
+
+from recording.source import openSource
+from recording.encoder import createEncoder
+from recording.sink import FileSink, StagedFileSink, SegmentedSink, FLUSH_BYTES_DEFAULT, SYNC_BYTES_DEFAULT
+from recording.pipeline import RecordingPipeline, BUFFER_SECONDS_DEFAULT
+from recording.transcode import TranscodeQueue, getOutputPaths
+from recording.dropout import DropoutDetector, MonitoredSource
+
+DEFERRED_ENCODER_NICE = 10  # Deferred encoding mode での、エンコーダープロセスのnice値
+
+# 無音の検出時の、チューナーの操作の作成（recording/dropout.py 参照）
+# radio_server.py が起動している場合は常駐プロセスに、起動していない場合はこのプロセス内のRadioServiceに要求する。
+# RadioServiceは、最初の操作まで作成しない。（無音がない場合は、smbus等のimportを省略する）
+def _createTunerControl( strJob, strTuner ):
+    from radio_client import sendRequest
+    service = None
+
+    def control( strAction ):
+        nonlocal service
+        dictRequest = { "command" : "recover", "action" : strAction }
+        if( strTuner ):
+            dictRequest["tuner"] = strTuner
+        dictResponse = sendRequest( dict( dictRequest, job = strJob ) if strJob else dictRequest )
+        if( dictResponse is None ):
+            if( service is None ):
+                from radio_service import RadioService
+                service = RadioService()
+            dictResponse = service.handleRequest( dictRequest )
+        if( "ok" != dictResponse["result"] ):
+            raise OSError( dictResponse["message"] )
+        return dictResponse["rssi"]
+    return control
+
+def _log( strMessage ):
+    print( "%s %s" % (datetime.datetime.now().strftime( "%Y/%m/%d %H:%M:%S" ), strMessage), file = sys.stderr, flush = True )
+
+def main():
+    # 引数の処理
+    parser = argparse.ArgumentParser()
+    parser.add_argument( "length_sec", type = float )
+    parser.add_argument( "output_path" )
+    parser.add_argument( "--bitrate", type = int, default = 128 )
+    parser.add_argument( "--source", default = "alsa" )
+    parser.add_argument( "--encoder", default = "mp3" )
+    parser.add_argument( "--buffer-sec", type = float, default = BUFFER_SECONDS_DEFAULT )
+    parser.add_argument( "--deferred", action = "store_true" )
+    parser.add_argument( "--segment-sec", type = float )
+    parser.add_argument( "--concat", action = "store_true" )
+    parser.add_argument( "--flush-kb", type = int, default = FLUSH_BYTES_DEFAULT // 1024 )
+    parser.add_argument( "--sync-kb", type = int, default = SYNC_BYTES_DEFAULT // 1024 )
+    parser.add_argument( "--transcode" )
+    parser.add_argument( "--signal" )
+    parser.add_argument( "--dropout", action = "store_true" )
+    parser.add_argument( "--job" )
+    parser.add_argument( "--tuner" )
+    parser.add_argument( "--no-catalogue", action = "store_true" )
+    parser.add_argument( "--quiet", action = "store_true" )
+    args = parser.parse_args()
+
+    # 変換キューを使用する場合は、WAVで録音する。
+    strOutputPath = args.output_path
+    aTranscodeOutput = None
+    if( args.transcode ):
+        if( args.segment_sec and (not args.concat) ):
+            parser.error( "--transcode requires --concat with --segment-sec" )
+        try:
+            aTranscodeOutput = getOutputPaths( args.output_path, args.transcode.split( "," ) )
+        except ValueError as e:
+            parser.error( str( e ) )
+        strOutputPath = os.path.splitext( args.output_path )[0] + ".wav"
+        args.encoder = "wav"
+
+    # 録音の準備
+    source = openSource( args.source )
+    detector = None
+    if( args.dropout and args.job ):
+        # ジョブのチューナーは、radio_server.py が保持している。（このプロセスのRadioServiceからは、チューナーを特定できず、
+        # チューナーを確保したプロセスとI2Cバスへのアクセスが競合するので、操作しない）
+        from radio_client import sendRequest
+        if( sendRequest( { "command" : "tuners" } ) is None ):
+            _log( "Warning : Radio server is not running. Silence detection is disabled. (job %s)" % args.job )
+            args.dropout = False
+    if( args.dropout ):
+        detector = DropoutDetector( source.iSampleRate, source.iChannels, source.iSampleWidth, _createTunerControl( args.job, args.tuner ),
+                                    log = _log )
+        source = MonitoredSource( source, detector )
+    encoder = createEncoder( args.encoder, args.bitrate, source.iSampleRate, source.iChannels,
+                             DEFERRED_ENCODER_NICE if args.deferred else 0 )
+    if( args.segment_sec ):
+        sink = SegmentedSink( strOutputPath, encoder.strExtension, args.concat, args.flush_kb * 1024, args.sync_kb * 1024 )
+    elif( 0 < args.flush_kb ):
+        sink = StagedFileSink( strOutputPath, args.flush_kb * 1024, args.sync_kb * 1024 )
+    else:
+        sink = FileSink( strOutputPath )
+    pipeline = RecordingPipeline( source, encoder, sink, args.length_sec,
+                                  fBufferSec = args.buffer_sec,
+                                  bSpill = args.deferred,
+                                  strSpillDir = os.path.dirname( os.path.abspath( strOutputPath ) ),
+                                  fSegmentSec = args.segment_sec )
+
+    # SIGTERM、SIGINTで、録音を終了する（録音済みの分は、出力ファイルに書き込む）
+    signal.signal( signal.SIGTERM, lambda iSignal, frame: pipeline.stop() )
+    signal.signal( signal.SIGINT, lambda iSignal, frame: pipeline.stop() )
+
+    # 受信状態の監視
+    monitor = None
+    if( args.signal ):
+        from rda5807m.rda5807m import RDA5807M                # 監視しない場合は、smbus等のimportを省略するため、ここでimportする。
+        from rda5807m.signal_monitor import SignalMonitor
+        monitor = SignalMonitor( RDA5807M(), strSeriesPath = args.signal )
+        monitor.start()
+
+    # 録音
+    if( detector is not None ):
+        detector.start()
+    try:
+        pipeline.run()
+    finally:
+        dictSignal = monitor.stop() if (monitor is not None) else None
+        if( detector is not None ):
+            detector.stop()
+
+    # 変換キューへの追加
+    if( aTranscodeOutput is not None ):
+        from transcoder import getQueueDir
+        TranscodeQueue( getQueueDir() ).put( strOutputPath, aTranscodeOutput )
+    elif( (not args.no_catalogue) and ((not args.segment_sec) or args.concat) ):
+        # 録音の目録への追加（セグメントのみの録音は、連結後のファイルがないので追加しない）
+        from catalogue import addRecordings
+        strError = addRecordings( [ strOutputPath ] )
+        if( strError is not None ):
+            _log( "Warning : %s" % strError )
+
+    if( not args.quiet ):
+        dictStatistics = pipeline.getStatistics()
+        print( "Recorded." )
+        print( "  output          : %s" % strOutputPath )
+        print( "  length          : %.1f[sec]" % (dictStatistics["frames_captured"] / source.iSampleRate) )
+        print( "  bytes written   : %d" % dictStatistics["bytes_written"] )
+        print( "  buffer peak     : %d[bytes]" % dictStatistics["buffer_peak_bytes"] )
+        print( "  spilled         : %d[bytes]" % dictStatistics["spilled_bytes"] )
+        if( args.segment_sec ):
+            print( "  segments        : %d" % sink.iSegments )
+        if( getattr( sink, "statistics", None ) is not None ):
+            dictWrite = sink.statistics.toDict()
+            print( "  flushes         : %d (%d[bytes], mean %.1f[ms], max %.1f[ms])" % (dictWrite["flushes"], dictWrite["bytes_flushed"],
+                                                                                 dictWrite["flush_sec_mean"] * 1000, dictWrite["flush_sec_max"] * 1000) )
+            print( "  syncs           : %d (mean %.1f[ms], max %.1f[ms])" % (dictWrite["syncs"], dictWrite["sync_sec_mean"] * 1000,
+                                                                           dictWrite["sync_sec_max"] * 1000) )
+        if( aTranscodeOutput is not None ):
+            print( "  transcode       : %s" % ", ".join( strPath for (strProfile, strPath) in aTranscodeOutput ) )
+        if( dictSignal is not None ):
+            print( "  signal dropouts : %d (%.0f[sec])" % (dictSignal["dropouts"], dictSignal["dropout_sec"]) )
+        if( detector is not None ):
+            dictDropout = detector.getStatistics()
+            print( "  silences        : %d (%.0f[sec]), recoveries : %d" % (dictDropout["silences"], dictDropout["silence_sec"],
+                                                                         sum( 1 for dictEvent in dictDropout["events"] if dictEvent["action"] )) )
+
+if( "__main__" == __name__ ):
+    sys.exit( main() )
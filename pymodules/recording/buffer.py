@@ -0,0 +1,139 @@
+# buffer.py
+#
+# Class to buffer PCM between capture and encoder
+#
+# キャプチャ（書き込み側）とエンコード（読み込み側）の間のFIFOバッファー。
+# - メモリ上に iMemoryBytesMax バイトまで保持する。
+# - メモリが一杯の場合
+#   bSpill が False : 書き込み側は、空きができるまで待つ。
+#   bSpill が True  : 溢れた分は、一時ファイルに書き出す（スピル）。読み込み側がメモリ上のデータを読み終えた後、一時ファイルから読み込む。
+#                     エンコードが一時的にキャプチャに追いつかない場合でも、キャプチャを止めずに済み、
+#                     追いついている間は、ディスクへの書き込みは発生しない。
+
+# Copyright 2023 Nobuki HIRAMINE
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import collections
+import os
+import tempfile
+import threading
+
+# --- 定数定義 ---
+
+SPILL_READ_SIZE = 262144    # 一時ファイルからの読み込み単位[バイト]
+
+# --- クラス定義 ---
+
+class SpoolBuffer:
+    _iMemoryBytesMax = 0
+    _strSpillDir = None
+    _bSpill = False
+    _condition = None
+    _dequeMemory = None     # メモリ上のデータ（古い順）
+    _iMemoryBytes = 0
+    _fileSpill = None       # 一時ファイル（未使用時はNone）
+    _iSpillWritePos = 0
+    _iSpillReadPos = 0
+    _bClosed = False        # 書き込み側が終了したか
+    _bDiscarded = False     # 破棄されたか（以降の書き込みは捨てる）
+
+    # 統計
+    iMemoryBytesPeak = 0    # メモリ上に保持したデータの最大バイト数
+    iSpilledBytes = 0       # 一時ファイルに書き出したバイト数の合計
+
+    # コンストラクタ
+    # strSpillDir : 一時ファイルを作成するディレクトリ。Noneの場合は、システムの一時ディレクトリ。
+    def __init__( self, iMemoryBytesMax, bSpill = False, strSpillDir = None ):
+        self._iMemoryBytesMax = iMemoryBytesMax
+        self._bSpill = bSpill
+        self._strSpillDir = strSpillDir
+        self._condition = threading.Condition()
+        self._dequeMemory = collections.deque()
+
+    # 書き込み
+    def put( self, byData ):
+        with self._condition:
+            while( not self._bDiscarded ):
+                # 一時ファイルに未読み込みのデータがある場合は、順序を保つため、一時ファイルに書き出す。
+                if( (not self._isSpilling()) and (self._iMemoryBytes + len( byData ) <= self._iMemoryBytesMax) ):
+                    self._dequeMemory.append( byData )
+                    self._iMemoryBytes += len( byData )
+                    self.iMemoryBytesPeak = max( self.iMemoryBytesPeak, self._iMemoryBytes )
+                    break
+                if( self._bSpill ):
+                    self._spill( byData )
+                    break
+                self._condition.wait()
+            self._condition.notify_all()
+
+    # 書き込み側の終了
+    def closeWriter( self ):
+        with self._condition:
+            self._bClosed = True
+            self._condition.notify_all()
+
+    # 読み込み
+    # データがない場合は、書き込まれるまで待つ。書き込み側が終了し、データがなくなった場合は、Noneを返す。
+    def get( self ):
+        with self._condition:
+            while( True ):
+                if( self._dequeMemory ):
+                    byData = self._dequeMemory.popleft()
+                    self._iMemoryBytes -= len( byData )
+                    self._condition.notify_all()
+                    return byData
+                if( self._isSpilling() ):
+                    return self._unspill()
+                if( self._bClosed ):
+                    return None
+                self._condition.wait()
+
+    # 破棄（一時ファイルの削除）
+    # 書き込みを待っている書き込み側があれば、待ちを解除する。
+    def close( self ):
+        with self._condition:
+            self._bDiscarded = True
+            self._condition.notify_all()
+            if( self._fileSpill is not None ):
+                self._fileSpill.close()
+                self._fileSpill = None
+
+    # 現在保持しているバイト数（メモリ、一時ファイルの合計）
+    def getBufferedBytes( self ):
+        with self._condition:
+            return self._iMemoryBytes + (self._iSpillWritePos - self._iSpillReadPos)
+
+    def _isSpilling( self ):
+        return self._iSpillReadPos < self._iSpillWritePos
+
+    # 一時ファイルへの書き出し
+    def _spill( self, byData ):
+        if( self._fileSpill is None ):
+            self._fileSpill = tempfile.TemporaryFile( dir = self._strSpillDir )
+        os.pwrite( self._fileSpill.fileno(), byData, self._iSpillWritePos )
+        self._iSpillWritePos += len( byData )
+        self.iSpilledBytes += len( byData )
+
+    # 一時ファイルからの読み込み
+    def _unspill( self ):
+        iBytes = min( SPILL_READ_SIZE, self._iSpillWritePos - self._iSpillReadPos )
+        byData = os.pread( self._fileSpill.fileno(), iBytes, self._iSpillReadPos )
+        self._iSpillReadPos += len( byData )
+
+        # 全て読み込んだら、一時ファイルを空にする。
+        if( self._iSpillReadPos == self._iSpillWritePos ):
+            self._fileSpill.truncate( 0 )
+            self._iSpillReadPos = 0
+            self._iSpillWritePos = 0
+        return byData
@@ -0,0 +1,422 @@
+# capture_hub.py
+#
+# Classes to capture PCM once and distribute it to many subscribers
+#
+# CaptureHub        : ソースからPCMを1か所で読み込み、全ての購読者（エンコーダー、ループバック再生、レベルメーター等）に配る。
+#                     読み込んだチャンク（bytes）は、購読者間で共有し、購読者ごとのコピーはしない。
+# Subscription      : 購読者ごとの、上限のあるキュー。ソースのインターフェース（source.py）を持ち、RecordingPipeline等のソースとして使用できる。
+#                     キューが一杯の場合（購読者の処理が遅れている場合）は、古いチャンクを捨てる。キャプチャは、購読者を待たない。
+# LevelMeter        : 購読したPCMの、ピークとRMSのレベル[dBFS]を計測する。
+# Loopback          : 購読したPCMを、aplayで再生する。（PulseAudioの module-loopback の代わり）
+# CaptureHubServer  : CaptureHub を、Unixドメインソケット経由で、別のプロセスの購読者に配る。
+# HubSource         : CaptureHubServer から、PCMを読み込むソース。（openSource の "hub"）
+#
+# CaptureHubServer の要求と応答（要求は1行のJSON）
+#   { "command" : "subscribe", "name" : 購読者名 } : 応答の1行のJSON（PCMの形式）に続けて、RAW形式のPCMを、切断まで送る。
+#   { "command" : "status" }                       : 購読者ごとの状態（受信・破棄したチャンク数）と、レベルを返す。
+#   { "command" : "loopback", "enable" : 再生するか, "device" : 再生デバイス名（省略可） } : ループバック再生（購読者名 "listen"）の開始・終了。
+
+# Copyright 2023 Nobuki HIRAMINE
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import collections
+import json
+import os
+import socket
+import socketserver
+import subprocess
+import threading
+
+from .source import _readFully
+from .level import measureLevel, toDB, LEVEL_FLOOR_DB
+
+# --- 定数定義 ---
+
+# CaptureHubServer のソケットファイルのパス（環境変数 CAPTURE_HUB_SOCKET で変更可能）
+CAPTURE_HUB_SOCKET_DEFAULT = "/tmp/capture_hub.sock"
+
+CHUNK_FRAMES = 4410             # 1回の読み込みのフレーム数（44.1kHzで100ms。RecordingPipelineの読み込み単位と同じ）
+QUEUE_CHUNKS_DEFAULT = 20       # 購読者のキューの上限チャンク数（約2秒分）
+RECORD_QUEUE_CHUNKS = 100       # 録音の購読者のキューの上限チャンク数（約10秒分。録音では、できるだけ捨てない）
+
+LISTEN_NAME = "listen"          # ループバック再生の購読者名
+METER_NAME = "meter"            # レベルメーターの購読者名
+
+# --- クラス定義 ---
+
+# 購読者ごとのキュー
+class Subscription:
+    strName = None
+    iSampleRate = 0
+    iChannels = 0
+    iSampleWidth = 0
+
+    # 統計
+    iChunks = 0                 # 受け取ったチャンク数
+    iDroppedChunks = 0          # キューが一杯で捨てたチャンク数
+
+    _hub = None
+    _deque = None
+    _iMaxChunks = QUEUE_CHUNKS_DEFAULT
+    _condition = None
+    _bEnded = False
+    _viewPending = None         # 読みかけのチャンク
+
+    def __init__( self, hub, strName, iMaxChunks = QUEUE_CHUNKS_DEFAULT ):
+        self._hub = hub
+        self.strName = strName
+        self.iSampleRate = hub.source.iSampleRate
+        self.iChannels = hub.source.iChannels
+        self.iSampleWidth = hub.source.iSampleWidth
+        self._deque = collections.deque()
+        self._iMaxChunks = iMaxChunks
+        self._condition = threading.Condition()
+        self._viewPending = memoryview( b"" )
+
+    # チャンクの追加（キャプチャのスレッドから呼び出す。待たない）
+    def put( self, byChunk ):
+        with self._condition:
+            if( self._iMaxChunks <= len( self._deque ) ):
+                self._deque.popleft()
+                self.iDroppedChunks += 1
+            self._deque.append( byChunk )
+            self.iChunks += 1
+            self._condition.notify()
+
+    # キャプチャの終了（読み込みを待っている購読者の待ちを解除する）
+    def end( self ):
+        with self._condition:
+            self._bEnded = True
+            self._condition.notify_all()
+
+    # チャンクの読み込み（チャンクが届くまで待つ）
+    # キャプチャが終了し、キューが空の場合は、Noneを返す。
+    def readChunk( self ):
+        with self._condition:
+            while( (not self._deque) and (not self._bEnded) ):
+                self._condition.wait()
+            return self._deque.popleft() if self._deque else None
+
+    # ソースのインターフェース
+    # 要求のフレーム数がチャンクのフレーム数と同じ場合は、チャンクをそのまま返す。
+    def read( self, iFrames ):
+        iBytes = iFrames * self.iChannels * self.iSampleWidth
+        if( not self._viewPending ):
+            byChunk = self.readChunk()
+            if( byChunk is None ):
+                return b""
+            if( len( byChunk ) == iBytes ):
+                return byChunk
+            self._viewPending = memoryview( byChunk )
+
+        abyData = bytearray()
+        while( len( abyData ) < iBytes ):
+            if( not self._viewPending ):
+                byChunk = self.readChunk()
+                if( byChunk is None ):
+                    break
+                self._viewPending = memoryview( byChunk )
+            iCopy = min( iBytes - len( abyData ), len( self._viewPending ) )
+            abyData += self._viewPending[:iCopy]
+            self._viewPending = self._viewPending[iCopy:]
+        return bytes( abyData )
+
+    def close( self ):
+        self._hub.unsubscribe( self )
+        self.end()
+
+    def getStatistics( self ):
+        with self._condition:
+            return { "name" : self.strName, "chunks" : self.iChunks, "dropped_chunks" : self.iDroppedChunks, "queued_chunks" : len( self._deque ) }
+
+# キャプチャと配布
+class CaptureHub:
+    source = None
+    iChunks = 0                 # 読み込んだチャンク数
+    _iChunkFrames = CHUNK_FRAMES
+    _aSubscription = None
+    _lock = None
+    _thread = None
+    _bStop = False
+    _bEnded = False             # キャプチャが終了したか（以降の購読は、すぐに終端となる）
+
+    # コンストラクタ
+    # source : ソース（source.py）
+    def __init__( self, source, iChunkFrames = CHUNK_FRAMES ):
+        self.source = source
+        self._iChunkFrames = iChunkFrames
+        self._aSubscription = []
+        self._lock = threading.Lock()
+
+    # キャプチャの開始
+    def start( self ):
+        self._bStop = False
+        self._thread = threading.Thread( target = self._run, daemon = True )
+        self._thread.start()
+
+    # キャプチャの終了（全ての購読者の読み込みは、キューの残りを読んだ後に終端となる）
+    def stop( self ):
+        self._bStop = True
+        if( self._thread is not None ):
+            self._thread.join()
+            self._thread = None
+
+    def isRunning( self ):
+        return (self._thread is not None) and self._thread.is_alive()
+
+    # 購読の開始
+    # iMaxChunks : キューの上限チャンク数
+    def subscribe( self, strName, iMaxChunks = QUEUE_CHUNKS_DEFAULT ):
+        subscription = Subscription( self, strName, iMaxChunks )
+        with self._lock:
+            if( self._bEnded ):
+                subscription.end()
+            self._aSubscription.append( subscription )
+        return subscription
+
+    # 購読の終了
+    def unsubscribe( self, subscription ):
+        with self._lock:
+            if( subscription in self._aSubscription ):
+                self._aSubscription.remove( subscription )
+
+    # 購読者の一覧（購読者ごとの統計）
+    def getSubscriptions( self ):
+        with self._lock:
+            aSubscription = list( self._aSubscription )
+        return [ subscription.getStatistics() for subscription in aSubscription ]
+
+    def _run( self ):
+        try:
+            while( not self._bStop ):
+                byChunk = self.source.read( self._iChunkFrames )
+                if( not byChunk ):
+                    break
+                self.iChunks += 1
+                with self._lock:
+                    aSubscription = list( self._aSubscription )
+                for subscription in aSubscription:
+                    subscription.put( byChunk )
+        finally:
+            self.source.close()
+            with self._lock:
+                self._bEnded = True
+                aSubscription = list( self._aSubscription )
+            for subscription in aSubscription:
+                subscription.end()
+
+# レベルメーター
+class LevelMeter:
+    fPeakDB = LEVEL_FLOOR_DB    # 直近のチャンクのピーク[dBFS]
+    fRMSDB = LEVEL_FLOOR_DB     # 直近のチャンクのRMS[dBFS]
+    _subscription = None
+    _thread = None
+
+    def __init__( self, subscription ):
+        self._subscription = subscription
+
+    def start( self ):
+        self._thread = threading.Thread( target = self._run, daemon = True )
+        self._thread.start()
+
+    def stop( self ):
+        self._subscription.close()
+        if( self._thread is not None ):
+            self._thread.join()
+            self._thread = None
+
+    def getLevel( self ):
+        return { "peak_db" : round( self.fPeakDB, 1 ), "rms_db" : round( self.fRMSDB, 1 ) }
+
+    def _run( self ):
+        while( True ):
+            byChunk = self._subscription.readChunk()
+            if( byChunk is None ):
+                break
+            (iPeak, fRMS) = measureLevel( byChunk )
+            self.fPeakDB = toDB( iPeak )
+            self.fRMSDB = toDB( fRMS )
+
+# ループバック再生
+class Loopback:
+    _subscription = None
+    _process = None
+    _thread = None
+
+    # strDevice : 再生デバイス名（aplay -D で指定する名前）
+    def __init__( self, subscription, strDevice = "default" ):
+        self._subscription = subscription
+        self._process = subprocess.Popen( [ "aplay", "-D", strDevice, "-t", "raw", "-f", "S16_LE",
+                                            "-c", str( subscription.iChannels ), "-r", str( subscription.iSampleRate ), "--quiet" ],
+                                          stdin = subprocess.PIPE )
+
+    def start( self ):
+        self._thread = threading.Thread( target = self._run, daemon = True )
+        self._thread.start()
+
+    def stop( self ):
+        self._subscription.close()
+        if( self._thread is not None ):
+            self._thread.join()
+            self._thread = None
+
+    def _run( self ):
+        try:
+            while( True ):
+                byChunk = self._subscription.readChunk()
+                if( byChunk is None ):
+                    break
+                self._process.stdin.write( byChunk )
+        except OSError:
+            self._subscription.close()
+        finally:
+            try:
+                self._process.stdin.close()
+            except OSError:
+                pass
+            self._process.wait()
+
+# 購読の要求の処理
+class CaptureHubRequestHandler( socketserver.StreamRequestHandler ):
+    def handle( self ):
+        try:
+            dictRequest = json.loads( self.rfile.readline() )
+            strCommand = dictRequest.get( "command" )
+        except ValueError as e:
+            self._sendJson( { "result" : "error", "message" : "Invalid request : %s" % e } )
+            return
+
+        if( "subscribe" == strCommand ):
+            self._subscribe( str( dictRequest.get( "name", "client" ) ) )
+        elif( "status" == strCommand ):
+            self._sendJson( dict( self.server.getStatus(), result = "ok", message = "Capturing." ) )
+        elif( "loopback" == strCommand ):
+            self.server.setLoopback( bool( dictRequest.get( "enable", True ) ), dictRequest.get( "device", "default" ) )
+            self._sendJson( { "result" : "ok", "message" : "Loopback %s." % ("started" if dictRequest.get( "enable", True ) else "stopped") } )
+        else:
+            self._sendJson( { "result" : "error", "message" : "Unknown command : %s" % strCommand } )
+
+    # PCMの送信（切断されるか、キャプチャが終了するまで戻らない）
+    # 送信が遅れた分は、購読者のキューで捨てる。
+    def _subscribe( self, strName ):
+        source = self.server.hub.source
+        subscription = self.server.hub.subscribe( strName, RECORD_QUEUE_CHUNKS if strName.startswith( "record" ) else QUEUE_CHUNKS_DEFAULT )
+        try:
+            self._sendJson( { "result" : "ok", "message" : "Subscribed.",
+                              "sample_rate" : source.iSampleRate, "channels" : source.iChannels, "sample_width" : source.iSampleWidth } )
+            while( True ):
+                byChunk = subscription.readChunk()
+                if( byChunk is None ):
+                    break
+                self.wfile.write( byChunk )
+        except OSError:
+            pass
+        finally:
+            subscription.close()
+
+    def _sendJson( self, dictResponse ):
+        self.wfile.write( (json.dumps( dictResponse ) + "\n").encode() )
+        self.wfile.flush()
+
+class CaptureHubServer( socketserver.ThreadingMixIn, socketserver.UnixStreamServer ):
+    daemon_threads = True
+    hub = None
+    strDevice = None            # キャプチャデバイス名（状態の応答に含める）
+    _meter = None
+    _loopback = None
+    _lockLoopback = None
+
+    def __init__( self, strSocketPath, hub, strDevice = None ):
+        self.hub = hub
+        self.strDevice = strDevice
+        self._lockLoopback = threading.Lock()
+        self._meter = LevelMeter( hub.subscribe( METER_NAME ) )
+        self._meter.start()
+
+        # 前回の異常終了等で残っているソケットファイルは削除する。
+        if( os.path.exists( strSocketPath ) ):
+            os.unlink( strSocketPath )
+        socketserver.UnixStreamServer.__init__( self, strSocketPath, CaptureHubRequestHandler )
+
+    # ループバック再生の開始・終了
+    def setLoopback( self, bEnable, strDevice = "default" ):
+        with self._lockLoopback:
+            if( bEnable and (self._loopback is None) ):
+                self._loopback = Loopback( self.hub.subscribe( LISTEN_NAME ), strDevice )
+                self._loopback.start()
+            elif( (not bEnable) and (self._loopback is not None) ):
+                self._loopback.stop()
+                self._loopback = None
+
+    def getStatus( self ):
+        return { "device" : self.strDevice,
+                 "capturing" : self.hub.isRunning(),
+                 "level" : self._meter.getLevel(),
+                 "subscribers" : self.hub.getSubscriptions() }
+
+    def server_close( self ):
+        self.setLoopback( False )
+        socketserver.UnixStreamServer.server_close( self )
+
+# CaptureHubServer からのPCM
+class HubSource:
+    iSampleRate = 0
+    iChannels = 0
+    iSampleWidth = 0
+    _socket = None
+    _file = None
+
+    # コンストラクタ
+    # strName : 購読者名（CaptureHubServer の状態に表示する。"record"で始まる名前は、録音として、大きいキューで購読する）
+    def __init__( self, strSocketPath = None, strName = "record" ):
+        strSocketPath = strSocketPath if strSocketPath else getHubSocketPath()
+        self._socket = socket.socket( socket.AF_UNIX, socket.SOCK_STREAM )
+        self._socket.connect( strSocketPath )
+        self._file = self._socket.makefile( "rwb" )
+        self._file.write( (json.dumps( { "command" : "subscribe", "name" : strName } ) + "\n").encode() )
+        self._file.flush()
+        dictResponse = json.loads( self._file.readline() )
+        if( "ok" != dictResponse["result"] ):
+            self.close()
+            raise OSError( dictResponse["message"] )
+        self.iSampleRate = dictResponse["sample_rate"]
+        self.iChannels = dictResponse["channels"]
+        self.iSampleWidth = dictResponse["sample_width"]
+
+    def read( self, iFrames ):
+        return _readFully( self._file, iFrames * self.iChannels * self.iSampleWidth )
+
+    def close( self ):
+        self._file.close()
+        self._socket.close()
+
+# --- 関数定義 ---
+
+# CaptureHubServer のソケットファイルのパスの取得
+def getHubSocketPath():
+    return os.environ.get( "CAPTURE_HUB_SOCKET", CAPTURE_HUB_SOCKET_DEFAULT )
+
+# CaptureHubServer への要求（status、loopback）
+# 接続できない場合は、Noneを返す。
+def sendHubRequest( strSocketPath, dictRequest ):
+    sock = socket.socket( socket.AF_UNIX, socket.SOCK_STREAM )
+    try:
+        sock.connect( strSocketPath )
+    except OSError:
+        sock.close()
+        return None
+    with sock, sock.makefile( "rwb" ) as file:
+        file.write( (json.dumps( dictRequest ) + "\n").encode() )
+        file.flush()
+        return json.loads( file.readline() )
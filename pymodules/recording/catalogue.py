@@ -0,0 +1,385 @@
+# catalogue.py
+#
+# Class to keep a catalogue of recordings, and to select recordings to delete by retention policies
+#
+# 録音ファイル（MP3等）ごとに、予約録音名、周波数、開始時刻、録音時間、ビットレート、サイズ、受信状態の集計を、sqliteファイルに保存する。
+# - 予約録音名、周波数、開始時刻は、ファイル名（record.sh、recording/timetable.py の「予約録音名_周波数_日時.mp3」の形式）から取得する。
+# - 録音時間、ビットレートは、MP3はフレームヘッダー（とXing/Infoヘッダー）から、WAVはヘッダーから取得する。（ffprobe等は使用しない）
+#   それ以外の形式（変換キューで作成したAAC、Opus）は、取得しない。（None）
+# - 受信状態の集計は、録音ファイルと同じ名前の ".signal.json"（rda5807m/signal_monitor.py）から取得する。
+# - 録音の終了時に add() で追加する。ディレクトリの scan() で、ディレクトリの中の録音ファイルと一致させる（作り直す）。
+#   scan() は、サイズと更新日時（と受信状態の集計ファイルの更新日時）が変わっていないファイルは、読み込み直さない。
+# - 検索、保持期間の管理（予約録音ごとに新しいN件を残す、合計サイズの上限、経過日数）は、インデックスを使用したSQLで行う。
+#   （ディレクトリの全ファイルの一覧と解析は行わない）
+
+# Copyright 2023 Nobuki HIRAMINE
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import collections
+import json
+import os
+import re
+import sqlite3
+import struct
+import time
+import wave
+
+from .sink import SEGMENT_DIR_EXTENSION
+
+# --- 定数定義 ---
+
+AUDIO_EXTENSIONS = ( ".mp3", ".m4a", ".opus", ".wav" )  # 録音ファイルの拡張子（recording/encoder.py、recording/transcode.py の出力）
+SERIES_EXTENSION = ".signal.csv"    # 受信状態の時系列ファイルの拡張子（rda5807m/signal_monitor.py と同じ）
+SUMMARY_EXTENSION = ".signal.json"  # 受信状態の集計ファイルの拡張子（rda5807m/signal_monitor.py と同じ）
+MP3_SYNC_SEARCH_BYTES = 65536       # MP3の最初のフレームを探す範囲[バイト]
+DB_TIMEOUT_SEC = 30                 # 別のプロセス（同時に終了した録音等）が書き込み中の場合に待つ時間[秒]
+
+# ファイル名の形式 : [予約録音名_]周波数_日時(YYYYmmddHHMM)[_変換プロファイル名]
+FILE_NAME_PATTERN = re.compile( r"^(?:(?P<name>.*)_)?(?P<frequency>\d+(?:\.\d+)?)_(?P<datetime>\d{12})(?:_(?P<profile>[a-z0-9]+_\d+))?$" )
+
+# 録音
+# frequency   : 周波数[kHz]（ファイル名から取得できない場合はNone）
+# start       : 開始時刻（UNIX時間）。ファイル名から取得できない場合は、更新日時から録音時間を引いた時刻。
+# duration    : 録音時間[秒]、bitrate : ビットレート[kbps]（取得できない場合はNone）
+# size、mtime : ファイルのサイズ[バイト]、更新日時（UNIX時間）
+# rssi_min ～ dropout_sec : 受信状態の集計（集計ファイルがない場合はNone）
+# signal_path : 受信状態の集計ファイルのパス（変換キューで作成した複数の形式のファイルは、同じ集計ファイルを参照する）
+RecordingEntry = collections.namedtuple( "RecordingEntry", [ "path", "name", "frequency", "start", "duration", "bitrate", "size", "mtime",
+                                                             "rssi_min", "rssi_mean", "stereo_ratio", "dropouts", "dropout_sec",
+                                                             "signal_path", "signal_mtime" ] )
+
+_COLUMNS = ", ".join( RecordingEntry._fields )
+
+# MPEG Audio Layer III のビットレート[kbps]（MPEG1、MPEG2/2.5）と、サンプリング周波数[Hz]（MPEG1、MPEG2、MPEG2.5）
+MP3_BITRATES = { 1 : ( 0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320 ),
+                 2 : ( 0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160 ) }
+MP3_SAMPLE_RATES = { 3 : ( 44100, 48000, 32000 ), 2 : ( 22050, 24000, 16000 ), 0 : ( 11025, 12000, 8000 ) }   # キーはヘッダーのバージョンの値
+
+# --- クラス定義 ---
+
+class RecordingCatalogue:
+    _db = None
+
+    # コンストラクタ
+    # strPath : sqliteファイルのパス。（":memory:"の場合は、ファイルに保存しない）
+    def __init__( self, strPath ):
+        self._db = sqlite3.connect( strPath, timeout = DB_TIMEOUT_SEC, check_same_thread = False )
+        if( ":memory:" != strPath ):
+            self._db.execute( "PRAGMA journal_mode = WAL" )     # 録音の追加中も、検索できるようにする。
+        self._db.execute( "CREATE TABLE IF NOT EXISTS recordings ( path TEXT PRIMARY KEY, name TEXT, frequency INTEGER, start REAL, "
+                          "duration REAL, bitrate INTEGER, size INTEGER, mtime REAL, rssi_min INTEGER, rssi_mean REAL, stereo_ratio REAL, "
+                          "dropouts INTEGER, dropout_sec REAL, signal_path TEXT, signal_mtime REAL )" )
+        self._db.execute( "CREATE INDEX IF NOT EXISTS recordings_name_start ON recordings ( name, start )" )
+        self._db.execute( "CREATE INDEX IF NOT EXISTS recordings_start ON recordings ( start )" )
+        self._db.execute( "CREATE INDEX IF NOT EXISTS recordings_frequency_start ON recordings ( frequency, start )" )
+        self._db.execute( "CREATE INDEX IF NOT EXISTS recordings_signal_path ON recordings ( signal_path )" )
+        self._db.commit()
+
+    # 終了
+    def close( self ):
+        self._db.close()
+
+    def __len__( self ):
+        return self._db.execute( "SELECT COUNT(*) FROM recordings" ).fetchone()[0]
+
+    # - 追加・更新 -
+
+    # 録音ファイルの追加・更新
+    # 追加した RecordingEntry を返す。ファイルがない場合は、登録済みであれば削除し、Noneを返す。
+    def add( self, strPath ):
+        strPath = os.path.abspath( strPath )
+        try:
+            entry = readRecordingEntry( strPath )
+        except FileNotFoundError:
+            with self._db:
+                self._db.execute( "DELETE FROM recordings WHERE path = ?", ( strPath, ) )
+            return None
+        with self._db:
+            self._insert( [ entry ] )
+        return entry
+
+    # ディレクトリの中の録音ファイルとの一致（サブディレクトリを含む）
+    # 新しいファイル、サイズか更新日時が変わったファイル、受信状態の集計ファイルが作成・更新されたファイルのみ読み込み、
+    # なくなったファイルは削除する。( 追加数, 更新数, 削除数 ) を返す。
+    def scan( self, strDir ):
+        strDir = os.path.abspath( strDir )
+        dictKnown = { row[0] : row[1:] for row in self._db.execute( "SELECT path, size, mtime, signal_path, signal_mtime FROM recordings "
+                                                                    "WHERE path >= ? AND path < ?", _getPathRange( strDir ) ) }
+        aEntry = []
+        iAdded = 0
+        setFound = set()
+        for (strDirPath, astrDirName, astrFileName) in os.walk( strDir ):
+            # 録音中のセグメント（recording/sink.py）は、対象外
+            astrDirName[:] = [ strDirName for strDirName in astrDirName if not strDirName.endswith( SEGMENT_DIR_EXTENSION ) ]
+            for strFileName in astrFileName:
+                if( not strFileName.lower().endswith( AUDIO_EXTENSIONS ) ):
+                    continue
+                strPath = os.path.join( strDirPath, strFileName )
+                setFound.add( strPath )
+                try:
+                    stat = os.stat( strPath )
+                    known = dictKnown.get( strPath )
+                    if( (known is not None) and (known[0] == stat.st_size) and (known[1] == stat.st_mtime)
+                        and (known[3] == _getMTime( known[2] )) ):
+                        continue
+                    aEntry.append( readRecordingEntry( strPath, stat ) )
+                except FileNotFoundError:
+                    setFound.discard( strPath )     # 一覧の作成後に削除された
+                    continue
+                if( known is None ):
+                    iAdded += 1
+
+        astrRemoved = [ strPath for strPath in dictKnown if strPath not in setFound ]
+        with self._db:
+            self._insert( aEntry )
+            self._db.executemany( "DELETE FROM recordings WHERE path = ?", [ ( strPath, ) for strPath in astrRemoved ] )
+        return (iAdded, len( aEntry ) - iAdded, len( astrRemoved ))
+
+    # - 検索 -
+
+    # パスでの検索。登録がない場合はNoneを返す。
+    def get( self, strPath ):
+        row = self._db.execute( "SELECT %s FROM recordings WHERE path = ?" % _COLUMNS, ( os.path.abspath( strPath ), ) ).fetchone()
+        return None if (row is None) else RecordingEntry( *row )
+
+    # 録音の検索（開始時刻の新しい順）
+    # strName      : 予約録音名
+    # ulFrequency  : 周波数[kHz]
+    # fFrom、fTo   : 開始時刻（UNIX時間）の範囲。fFrom 以上、fTo 未満。
+    # strDir       : ディレクトリ（サブディレクトリを含む）
+    # iLimit       : 最大件数
+    def find( self, strName = None, ulFrequency = None, fFrom = None, fTo = None, strDir = None, iLimit = None ):
+        (strWhere, aParam) = _getFilter( strName, strDir, ulFrequency, fFrom, fTo )
+        strSQL = "SELECT %s FROM recordings%s ORDER BY start DESC" % (_COLUMNS, strWhere)
+        if( iLimit is not None ):
+            strSQL += " LIMIT %d" % int( iLimit )
+        return self._select( strSQL, aParam )
+
+    # 予約録音ごとの集計（予約録音名順）
+    # [ ( 予約録音名, 録音数, 合計サイズ[バイト], 合計録音時間[秒], 最新の開始時刻 ), ... ] を返す。
+    def getProgrammes( self ):
+        return self._db.execute( "SELECT name, COUNT(*), SUM(size), SUM(duration), MAX(start) FROM recordings GROUP BY name ORDER BY name" ).fetchall()
+
+    # 合計サイズ[バイト]
+    def getTotalSize( self, strDir = None ):
+        if( strDir is None ):
+            return self._db.execute( "SELECT COALESCE(SUM(size), 0) FROM recordings" ).fetchone()[0]
+        return self._db.execute( "SELECT COALESCE(SUM(size), 0) FROM recordings WHERE path >= ? AND path < ?",
+                                 _getPathRange( os.path.abspath( strDir ) ) ).fetchone()[0]
+
+    # - 保持期間の管理 -
+    # 削除する録音を、開始時刻の古い順に返す。（削除は remove() で行う）
+    # strDir を指定した場合は、そのディレクトリ（サブディレクトリを含む）の録音のみを対象とする。
+
+    # 予約録音ごとに、新しい iKeep 件より古い録音
+    # 開始時刻が同じファイル（変換キューで作成した、複数の形式のファイル）は、1件と数える。
+    # strName を指定した場合は、その予約録音のみを対象とする。
+    def selectBeyondCount( self, iKeep, strName = None, strDir = None ):
+        (strWhere, aParam) = _getFilter( strName, strDir )
+        return self._select( "SELECT %s FROM ( SELECT *, DENSE_RANK() OVER ( PARTITION BY name ORDER BY start DESC ) AS rank FROM recordings%s ) "
+                             "WHERE rank > ? ORDER BY start" % (_COLUMNS, strWhere), aParam + [ int( iKeep ) ] )
+
+    # 新しい順に合計したサイズが、iMaxBytes を超える録音
+    def selectBeyondQuota( self, iMaxBytes, strDir = None ):
+        (strWhere, aParam) = _getFilter( None, strDir )
+        return self._select( "SELECT %s FROM ( SELECT *, SUM(size) OVER ( ORDER BY start DESC, path ROWS UNBOUNDED PRECEDING ) AS total FROM recordings%s ) "
+                             "WHERE total > ? ORDER BY start" % (_COLUMNS, strWhere), aParam + [ int( iMaxBytes ) ] )
+
+    # 開始時刻から fMaxAgeSec[秒] より経過した録音
+    def selectOlderThan( self, fMaxAgeSec, strName = None, strDir = None, fNow = None ):
+        if( fNow is None ):
+            fNow = time.time()
+        (strWhere, aParam) = _getFilter( strName, strDir, fTo = fNow - fMaxAgeSec )
+        return self._select( "SELECT %s FROM recordings%s ORDER BY start" % (_COLUMNS, strWhere), aParam )
+
+    # 録音の削除
+    # bDeleteFiles が True の場合は、録音ファイルと、（同じ集計ファイルを参照する録音が残っていない場合は）受信状態のファイルも削除する。
+    # 削除したファイルの合計サイズ[バイト]を返す。
+    def remove( self, aEntry, bDeleteFiles = True ):
+        iBytes = 0
+        with self._db:
+            self._db.executemany( "DELETE FROM recordings WHERE path = ?", [ ( entry.path, ) for entry in aEntry ] )
+        if( not bDeleteFiles ):
+            return iBytes
+
+        for entry in aEntry:
+            try:
+                os.remove( entry.path )
+                iBytes += entry.size
+            except FileNotFoundError:
+                pass
+        for strSignalPath in set( entry.signal_path for entry in aEntry ):
+            if( self._db.execute( "SELECT 1 FROM recordings WHERE signal_path = ? LIMIT 1", ( strSignalPath, ) ).fetchone() is not None ):
+                continue
+            for strPath in ( strSignalPath, strSignalPath[:-len( SUMMARY_EXTENSION )] + SERIES_EXTENSION ):
+                try:
+                    os.remove( strPath )
+                except FileNotFoundError:
+                    pass
+        return iBytes
+
+    def _select( self, strSQL, aParam ):
+        return [ RecordingEntry( *row ) for row in self._db.execute( strSQL, aParam ) ]
+
+    def _insert( self, aEntry ):
+        self._db.executemany( "INSERT OR REPLACE INTO recordings ( %s ) VALUES ( %s )" % (_COLUMNS, ", ".join( "?" * len( RecordingEntry._fields ) )),
+                              aEntry )
+
+# --- 関数定義 ---
+
+# 録音ファイルの情報の読み込み
+# ファイルがない場合は、FileNotFoundErrorを送出する。
+def readRecordingEntry( strPath, stat = None ):
+    strPath = os.path.abspath( strPath )
+    if( stat is None ):
+        stat = os.stat( strPath )
+
+    (strName, ulFrequency, fStart, strBase) = parseFileName( strPath )
+    (fDuration, iBitrate) = (None, None)
+    try:
+        if( strPath.lower().endswith( ".mp3" ) ):
+            (fDuration, iBitrate) = readMp3Info( strPath )
+        elif( strPath.lower().endswith( ".wav" ) ):
+            (fDuration, iBitrate) = readWavInfo( strPath )
+    except (OSError, EOFError, wave.Error, struct.error):
+        pass    # 書き込み中や、壊れたファイル
+    if( fStart is None ):
+        fStart = stat.st_mtime - (fDuration or 0)
+
+    # 受信状態の集計
+    strSignalPath = strBase + SUMMARY_EXTENSION
+    dictSignal = {}
+    fSignalMTime = _getMTime( strSignalPath )
+    if( fSignalMTime is not None ):
+        try:
+            with open( strSignalPath, encoding = "utf-8" ) as file:
+                dictSignal = json.load( file )
+        except (OSError, ValueError):
+            fSignalMTime = None
+
+    return RecordingEntry( strPath, strName, ulFrequency, fStart, fDuration, iBitrate, stat.st_size, stat.st_mtime,
+                           dictSignal.get( "rssi_min" ), dictSignal.get( "rssi_mean" ), dictSignal.get( "stereo_ratio" ),
+                           dictSignal.get( "dropouts" ), dictSignal.get( "dropout_sec" ), strSignalPath, fSignalMTime )
+
+# ファイル名の解析
+# ( 予約録音名, 周波数[kHz], 開始時刻（UNIX時間）, 変換プロファイル名を除いた拡張子なしのパス ) を返す。
+# 形式が異なる場合は、( 拡張子なしのファイル名, None, None, 拡張子なしのパス ) を返す。
+def parseFileName( strPath ):
+    strBase = os.path.splitext( strPath )[0]
+    strStem = os.path.basename( strBase )
+    match = FILE_NAME_PATTERN.match( strStem )
+    if( match is None ):
+        return (strStem, None, None, strBase)
+
+    fStart = time.mktime( time.strptime( match.group( "datetime" ), "%Y%m%d%H%M" ) )   # 録音した機器のローカル時刻
+    if( match.group( "profile" ) ):
+        strBase = strBase[:-len( match.group( "profile" ) ) - 1]
+    return (match.group( "name" ) or "", int( round( float( match.group( "frequency" ) ) * 1000 ) ), fStart, strBase)
+
+# MP3の録音時間[秒]とビットレート[kbps]の読み込み
+# 最初のフレームのヘッダーから、ビットレートを求める。Xing/Infoヘッダーがある場合は、そのフレーム数から録音時間を求め、
+# ない場合（ffmpegのパイプ出力等）は、固定ビットレートとしてファイルサイズから求める。
+def readMp3Info( strPath ):
+    with open( strPath, "rb" ) as file:
+        iFileSize = os.fstat( file.fileno() ).st_size
+        file.seek( max( 0, iFileSize - 128 ) )
+        iTailSize = 128 if (b"TAG" == file.read( 3 )) else 0    # ID3v1タグ
+
+        # ID3v2タグの読み飛ばし
+        file.seek( 0 )
+        byTag = file.read( 10 )
+        iTagSize = 0
+        if( (10 == len( byTag )) and (b"ID3" == byTag[:3]) ):
+            iTagSize = 10 + ((byTag[6] & 0x7F) << 21 | (byTag[7] & 0x7F) << 14 | (byTag[8] & 0x7F) << 7 | (byTag[9] & 0x7F))
+            if( byTag[5] & 0x10 ):
+                iTagSize += 10  # フッター
+        file.seek( iTagSize )
+        byHead = file.read( MP3_SYNC_SEARCH_BYTES )
+
+    # 最初のフレームのヘッダー
+    iOffset = 0
+    while( iOffset + 4 <= len( byHead ) ):
+        uiHeader = struct.unpack_from( ">I", byHead, iOffset )[0]
+        iVersion = (uiHeader >> 19) & 0x3
+        iLayer = (uiHeader >> 17) & 0x3
+        iBitrateIndex = (uiHeader >> 12) & 0xF
+        iRateIndex = (uiHeader >> 10) & 0x3
+        if( (0x7FF == uiHeader >> 21) and (1 != iVersion) and (1 == iLayer) and (0 < iBitrateIndex < 15) and (3 != iRateIndex) ):
+            break
+        iOffset += 1
+    else:
+        return (None, None)
+
+    iBitrate = MP3_BITRATES[1 if (3 == iVersion) else 2][iBitrateIndex]
+    iSampleRate = MP3_SAMPLE_RATES[iVersion][iRateIndex]
+    iSamplesPerFrame = 1152 if (3 == iVersion) else 576
+    bMono = (3 == (uiHeader >> 6) & 0x3)
+    iAudioBytes = iFileSize - iTagSize - iOffset - iTailSize
+
+    # Xing/Infoヘッダー（サイド情報の後）
+    iXingOffset = iOffset + 4 + ((17 if bMono else 32) if (3 == iVersion) else (9 if bMono else 17))
+    if( (iXingOffset + 12 <= len( byHead )) and (byHead[iXingOffset:iXingOffset + 4] in (b"Xing", b"Info")) ):
+        uiFlags = struct.unpack_from( ">I", byHead, iXingOffset + 4 )[0]
+        if( uiFlags & 0x1 ):
+            iFrames = struct.unpack_from( ">I", byHead, iXingOffset + 8 )[0]
+            fDuration = iFrames * iSamplesPerFrame / iSampleRate
+            if( (b"Xing" == byHead[iXingOffset:iXingOffset + 4]) and (0 < fDuration) ):
+                iBitrate = int( round( iAudioBytes * 8 / fDuration / 1000 ) )     # 可変ビットレートの平均
+            return (fDuration, iBitrate)
+    return (iAudioBytes * 8 / (iBitrate * 1000), iBitrate)
+
+# WAVの録音時間[秒]とビットレート[kbps]の読み込み
+# ヘッダーのデータサイズが書き戻されていない場合（録音中、異常終了）は、ファイルサイズから求める。
+def readWavInfo( strPath ):
+    with wave.open( strPath, "rb" ) as file:
+        iFrameBytes = file.getnchannels() * file.getsampwidth()
+        iSampleRate = file.getframerate()
+        iFrames = file.getnframes()
+    if( 0 == iFrames ):
+        iFrames = max( 0, os.path.getsize( strPath ) - 44 ) // iFrameBytes
+    return (iFrames / iSampleRate, iSampleRate * iFrameBytes * 8 // 1000)
+
+# ファイルの更新日時。ファイルがない場合はNoneを返す。
+def _getMTime( strPath ):
+    try:
+        return os.stat( strPath ).st_mtime
+    except OSError:
+        return None
+
+# ディレクトリの中のパスの範囲（パスのインデックスでの範囲検索に使用する）。[ 下限, 上限 ) を返す。
+def _getPathRange( strDir ):
+    strPrefix = strDir.rstrip( os.sep ) + os.sep
+    return [ strPrefix, strPrefix[:-1] + chr( ord( os.sep ) + 1 ) ]
+
+# 検索の条件（find() 参照）
+# ( WHERE句, パラメーターのリスト ) を返す。条件がない場合のWHERE句は、空文字列。
+def _getFilter( strName = None, strDir = None, ulFrequency = None, fFrom = None, fTo = None ):
+    astrWhere = []
+    aParam = []
+    if( strName is not None ):
+        astrWhere.append( "name = ?" )
+        aParam.append( strName )
+    if( ulFrequency is not None ):
+        astrWhere.append( "frequency = ?" )
+        aParam.append( int( ulFrequency ) )
+    if( fFrom is not None ):
+        astrWhere.append( "start >= ?" )
+        aParam.append( fFrom )
+    if( fTo is not None ):
+        astrWhere.append( "start < ?" )
+        aParam.append( fTo )
+    if( strDir is not None ):
+        astrWhere.append( "path >= ? AND path < ?" )
+        aParam += _getPathRange( os.path.abspath( strDir ) )
+    return ((" WHERE " + " AND ".join( astrWhere )) if astrWhere else "", aParam)
@@ -0,0 +1,184 @@
+# dropout.py
+#
+# Classes to detect silence and dropouts during a recording and recover the tuner
+#
+# DropoutDetector : 録音中のPCMのブロックごとのレベル（RMS）から、無音の継続を検出する。
+#                   無音が SILENCE_SEC 秒続いたら、チューナーのRSSIを読み込み、
+#                   RSSIが低い場合（局の電波が途切れた、チューナーが同調を失った）は、復旧の操作を順に試す。
+#                     1回目 : "retune"  同じ周波数に設定し直す
+#                     2回目 : "restart" チューナーを初期化し直して、同じ周波数に設定する
+#                     以降  : 警告の出力のみ
+#                   RSSIが十分な場合（放送自体が無音）は、警告の出力のみ。
+#                   音声が戻ったら、復旧の操作は1回目からに戻す。
+#                   レベルの計算はキャプチャのスレッドで行い（recording/level.py）、チューナーの操作は別のスレッドで行う。（キャプチャを止めない）
+#                   時間は、PCMのフレーム数で数える。
+# MonitoredSource : ソースから読み込んだPCMを、DropoutDetector に渡すソース（source.py のソースのインターフェース）
+
+# Copyright 2023 Nobuki HIRAMINE
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import threading
+import time
+
+from .level import measureLevel, toDB
+
+# --- 定数定義 ---
+
+SILENCE_DB = -50.0              # RMSがこのレベル[dBFS]未満のブロックを、無音とみなす
+SILENCE_SEC = 10.0              # 無音がこの秒数続いたら、RSSIを確認する
+RETRY_SEC = 30.0                # 復旧の操作の後、次の確認まで待つ秒数
+DROPOUT_RSSI = 15               # RSSIがこの値未満の場合に、チューナーを復旧する（rda5807m/signal_monitor.py と同じ）
+
+RECOVERY_ACTIONS = ( "retune", "restart" )  # 復旧の操作（この順に試す）
+
+# --- クラス定義 ---
+
+# 無音と途切れの検出
+class DropoutDetector:
+    # 統計
+    iSilences = 0               # 無音（SILENCE_SEC 秒以上）の回数
+    iSilentFrames = 0           # 無音（SILENCE_SEC 秒以上）のフレーム数の合計
+    aEvent = None               # 確認と操作の記録 [ { "time", "action", "rssi", ... }, ... ]
+
+    _iFrameBytes = 0
+    _iSampleRate = 0
+    _control = None
+    _fSilenceDB = SILENCE_DB
+    _iSilenceFrames = 0         # SILENCE_SEC のフレーム数
+    _iRetryFrames = 0           # RETRY_SEC のフレーム数
+    _iRSSIMin = DROPOUT_RSSI
+    _log = None
+
+    _iRunFrames = 0             # 現在の無音の継続フレーム数
+    _iFramesSinceCheck = 0      # 前回の確認からのフレーム数
+    _iStep = 0                  # 次の復旧の操作（RECOVERY_ACTIONS の位置）
+    _lock = None
+    _eventCheck = None
+    _bStop = False
+    _thread = None
+
+    # コンストラクタ
+    # control : チューナーを操作する関数 control( strAction )。strAction は "rssi"（読み込みのみ）、"retune"、"restart"。
+    #           RSSIを返す。操作できない場合は、例外を送出する。
+    # log     : メッセージを出力する関数 log( strMessage )
+    def __init__( self, iSampleRate, iChannels, iSampleWidth, control, fSilenceDB = SILENCE_DB, fSilenceSec = SILENCE_SEC,
+                  fRetrySec = RETRY_SEC, iRSSIMin = DROPOUT_RSSI, log = None ):
+        self._iSampleRate = iSampleRate
+        self._iFrameBytes = iChannels * iSampleWidth
+        self._control = control
+        self._fSilenceDB = fSilenceDB
+        self._iSilenceFrames = int( fSilenceSec * iSampleRate )
+        self._iRetryFrames = int( fRetrySec * iSampleRate )
+        self._iFramesSinceCheck = self._iRetryFrames
+        self._iRSSIMin = iRSSIMin
+        self._log = log if (log is not None) else (lambda strMessage: None)
+        self.aEvent = []
+        self._lock = threading.Lock()
+        self._eventCheck = threading.Event()
+
+    # 操作のスレッドの開始
+    def start( self ):
+        self._bStop = False
+        self._thread = threading.Thread( target = self._run, daemon = True )
+        self._thread.start()
+
+    # 操作のスレッドの終了
+    def stop( self ):
+        self._bStop = True
+        self._eventCheck.set()
+        if( self._thread is not None ):
+            self._thread.join()
+            self._thread = None
+
+    # PCMのブロックの解析（キャプチャのスレッドから呼び出す）
+    def observe( self, byPCM ):
+        iFrames = len( byPCM ) // self._iFrameBytes
+        (iPeak, fRMS) = measureLevel( byPCM )
+        with self._lock:
+            self._iFramesSinceCheck += iFrames
+            if( self._fSilenceDB <= toDB( fRMS ) ):
+                # 音声あり
+                self._iRunFrames = 0
+                self._iStep = 0
+                return
+
+            self._iRunFrames += iFrames
+            if( self._iSilenceFrames <= self._iRunFrames ):
+                if( self._iSilenceFrames > self._iRunFrames - iFrames ):
+                    # 無音が SILENCE_SEC 秒に達した
+                    self.iSilences += 1
+                    self.iSilentFrames += self._iRunFrames
+                else:
+                    self.iSilentFrames += iFrames
+                if( self._iRetryFrames <= self._iFramesSinceCheck ):
+                    self._iFramesSinceCheck = 0
+                    self._eventCheck.set()
+
+    def getStatistics( self ):
+        with self._lock:
+            return { "silences" : self.iSilences,
+                     "silence_sec" : self.iSilentFrames / self._iSampleRate,
+                     "events" : list( self.aEvent ) }
+
+    # チューナーの確認と復旧
+    def _run( self ):
+        while( True ):
+            self._eventCheck.wait()
+            self._eventCheck.clear()
+            if( self._bStop ):
+                break
+            with self._lock:
+                strAction = RECOVERY_ACTIONS[self._iStep] if (self._iStep < len( RECOVERY_ACTIONS )) else None
+            dictEvent = { "time" : time.time(), "action" : None }
+            try:
+                dictEvent["rssi"] = self._control( "rssi" )
+                if( self._iRSSIMin <= dictEvent["rssi"] ):
+                    self._log( "Warning : Silence with signal. (RSSI %d)" % dictEvent["rssi"] )
+                elif( strAction is None ):
+                    self._log( "Warning : Signal lost. Recovery failed. (RSSI %d)" % dictEvent["rssi"] )
+                else:
+                    dictEvent["action"] = strAction
+                    dictEvent["rssi_after"] = self._control( strAction )
+                    self._log( "Signal lost. Tuner %s. (RSSI %d -> %d)" % (strAction, dictEvent["rssi"], dictEvent["rssi_after"]) )
+                    with self._lock:
+                        self._iStep += 1
+            except Exception as e:
+                dictEvent["error"] = str( e )
+                self._log( "Error : Tuner could not be checked. %s" % e )
+            with self._lock:
+                self.aEvent.append( dictEvent )
+
+# DropoutDetector に渡すソース
+class MonitoredSource:
+    iSampleRate = 0
+    iChannels = 0
+    iSampleWidth = 0
+    _source = None
+    _detector = None
+
+    def __init__( self, source, detector ):
+        self._source = source
+        self._detector = detector
+        self.iSampleRate = source.iSampleRate
+        self.iChannels = source.iChannels
+        self.iSampleWidth = source.iSampleWidth
+
+    def read( self, iFrames ):
+        byPCM = self._source.read( iFrames )
+        if( byPCM ):
+            self._detector.observe( byPCM )
+        return byPCM
+
+    def close( self ):
+        self._source.close()
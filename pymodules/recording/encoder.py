@@ -0,0 +1,157 @@
+# encoder.py
+#
+# Classes to encode PCM audio
+#
+# エンコーダーのインターフェース
+#   strExtension      : 出力ファイルの拡張子
+#   start()           : エンコードを開始する。ファイル先頭に書き込むデータ（ヘッダー等）を返す。
+#   encode( byPCM )   : PCMをエンコードし、エンコード済みのデータを返す。（エンコーダー内部にたまっている場合は、空のbytesを返す）
+#   finish()          : エンコードを終了し、残りのエンコード済みのデータを返す。
+#   getFinalHeader()  : 終了後、ファイル先頭に書き戻すべきヘッダーを返す。不要な場合はNoneを返す。
+
+# Copyright 2023 Nobuki HIRAMINE
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import struct
+import subprocess
+import threading
+
+from .source import SAMPLE_RATE, CHANNELS, SAMPLE_WIDTH
+
+# --- 定数定義 ---
+
+ENCODER_READ_SIZE = 65536   # エンコーダープロセスの出力の読み込み単位[バイト]
+
+# --- クラス定義 ---
+
+# WAV形式
+class WavEncoder:
+    strExtension = "wav"
+    _iSampleRate = SAMPLE_RATE
+    _iChannels = CHANNELS
+    _iSampleWidth = SAMPLE_WIDTH
+    _iDataBytes = 0
+
+    # コンストラクタ
+    def __init__( self, iSampleRate = SAMPLE_RATE, iChannels = CHANNELS, iSampleWidth = SAMPLE_WIDTH ):
+        self._iSampleRate = iSampleRate
+        self._iChannels = iChannels
+        self._iSampleWidth = iSampleWidth
+
+    def start( self ):
+        # データサイズが未確定なので、最大値のヘッダーとする。（終了後に書き戻せない場合でも、再生はできる）
+        self._iDataBytes = 0
+        return self._makeHeader( 0xFFFFFFFF - 36 )
+
+    def encode( self, byPCM ):
+        self._iDataBytes += len( byPCM )
+        return byPCM
+
+    def finish( self ):
+        return b""
+
+    def getFinalHeader( self ):
+        return self._makeHeader( self._iDataBytes )
+
+    # WAVヘッダー（44バイト）の作成
+    def _makeHeader( self, iDataBytes ):
+        iBlockAlign = self._iChannels * self._iSampleWidth
+        return struct.pack( "<4sI4s4sIHHIIHH4sI",
+                            b"RIFF", 36 + iDataBytes, b"WAVE",
+                            b"fmt ", 16, 1, self._iChannels, self._iSampleRate, self._iSampleRate * iBlockAlign, iBlockAlign, self._iSampleWidth * 8,
+                            b"data", iDataBytes )
+
+# ffmpegを使用する形式（MP3等）
+# PCMをffmpegの標準入力に書き込み、エンコード済みのデータをffmpegの標準出力から読み込む。
+class FFmpegEncoder:
+    strExtension = None
+    _astrCodecArgs = None
+    _iSampleRate = SAMPLE_RATE
+    _iChannels = CHANNELS
+    _iNice = 0
+    _process = None
+    _thread = None
+    _lock = None
+    _abyOutput = None   # 読み込み済みで、未返却のエンコード済みデータ
+
+    # コンストラクタ
+    # astrCodecArgs : ffmpegの出力側の引数（コーデック、ビットレート、フォーマット）
+    # iNice         : エンコーダープロセスのnice値（キャプチャより優先度を下げる場合に指定する）
+    def __init__( self, strExtension, astrCodecArgs, iSampleRate = SAMPLE_RATE, iChannels = CHANNELS, iNice = 0 ):
+        self.strExtension = strExtension
+        self._astrCodecArgs = astrCodecArgs
+        self._iSampleRate = iSampleRate
+        self._iChannels = iChannels
+        self._iNice = iNice
+
+    def start( self ):
+        self._abyOutput = bytearray()
+        self._lock = threading.Lock()
+        self._process = subprocess.Popen( [ "ffmpeg", "-f", "s16le", "-ar", str( self._iSampleRate ), "-ac", str( self._iChannels ), "-i", "pipe:0" ]
+                                          + [ "-vn" ] + self._astrCodecArgs + [ "pipe:1", "-loglevel", "error" ],
+                                          stdin = subprocess.PIPE, stdout = subprocess.PIPE,
+                                          preexec_fn = ( lambda: os.nice( self._iNice ) ) if self._iNice else None )
+
+        # 標準出力を読み込み続けるスレッド（読み込まないと、ffmpegの出力が詰まり、標準入力への書き込みもブロックする）
+        self._thread = threading.Thread( target = self._readOutput, daemon = True )
+        self._thread.start()
+        return b""
+
+    def encode( self, byPCM ):
+        self._process.stdin.write( byPCM )
+        return self._takeOutput()
+
+    def finish( self ):
+        self._process.stdin.close()
+        self._thread.join()
+        self._process.wait()
+        if( 0 != self._process.returncode ):
+            raise RuntimeError( "ffmpeg exited with code %d." % self._process.returncode )
+        return self._takeOutput()
+
+    def getFinalHeader( self ):
+        return None
+
+    def _readOutput( self ):
+        while( True ):
+            byChunk = self._process.stdout.read1( ENCODER_READ_SIZE )
+            if( not byChunk ):
+                break
+            with self._lock:
+                self._abyOutput += byChunk
+
+    def _takeOutput( self ):
+        with self._lock:
+            byOutput = bytes( self._abyOutput )
+            self._abyOutput.clear()
+        return byOutput
+
+# MP3形式（record.shのffmpegの設定と同じ）
+class Mp3Encoder( FFmpegEncoder ):
+    def __init__( self, iBitrateKbps = 128, iSampleRate = SAMPLE_RATE, iChannels = CHANNELS, iNice = 0 ):
+        FFmpegEncoder.__init__( self, "mp3", [ "-ac", str( iChannels ), "-ar", str( iSampleRate ), "-ab", "%dk" % iBitrateKbps, "-acodec", "libmp3lame", "-f", "mp3" ],
+                                iSampleRate, iChannels, iNice )
+
+# --- 関数定義 ---
+
+# エンコーダー指定文字列からのエンコーダーの生成
+#   "mp3" : Mp3Encoder
+#   "wav" : WavEncoder
+def createEncoder( strSpec, iBitrateKbps = 128, iSampleRate = SAMPLE_RATE, iChannels = CHANNELS, iNice = 0 ):
+    if( "mp3" == strSpec ):
+        return Mp3Encoder( iBitrateKbps, iSampleRate, iChannels, iNice )
+    elif( "wav" == strSpec ):
+        return WavEncoder( iSampleRate, iChannels )
+    raise ValueError( "Unknown encoder : %s" % strSpec )
@@ -0,0 +1,156 @@
+# pipeline.py
+#
+# Class to record audio from a source through an encoder into a sink
+#
+# キャプチャスレッド : ソースから、固定フレーム数ずつPCMを読み込み、バッファーに書き込む。
+# 呼び出し元スレッド : バッファーからPCMを読み込み、エンコーダーでエンコードし、シンクに書き込む。
+# キャプチャとエンコードをバッファーで分離するので、エンコードや書き込みが一時的に遅れても、キャプチャは止まらない。
+# セグメント出力（fSegmentSec 指定時）では、一定時間のPCMごとにエンコーダーを終了・再開し、シンク（SegmentedSink）のセグメントを切り替える。
+# 各セグメントは、単独で再生できるファイルになる。
+
+# Copyright 2023 Nobuki HIRAMINE
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import threading
+import time
+
+from .buffer import SpoolBuffer
+
+# --- 定数定義 ---
+
+BUFFER_FRAMES_DEFAULT = 4410            # 1回の読み込みのフレーム数（44.1kHzで100ms）
+BUFFER_SECONDS_DEFAULT = 30             # メモリ上に保持するPCMの最大時間[秒]
+
+# --- クラス定義 ---
+
+class RecordingPipeline:
+    _source = None
+    _encoder = None
+    _sink = None
+    _iTotalFrames = None        # 録音するフレーム数（Noneの場合は、stop()またはソースの終端まで）
+    _iBufferFrames = BUFFER_FRAMES_DEFAULT
+    _buffer = None
+    _eventStop = None
+    _exception = None           # キャプチャスレッドで発生した例外
+    _iSegmentBytes = None       # 1セグメントのPCMのバイト数（セグメント出力しない場合はNone）
+    _iSegmentPCMBytes = 0       # 書き込み中のセグメントにエンコードしたPCMのバイト数
+    _iBytesPerSec = 0
+
+    # 統計
+    iFramesCaptured = 0
+    fElapsedSec = 0.0
+
+    # コンストラクタ
+    # fDurationSec        : 録音時間[秒]。Noneの場合は、stop()またはソースの終端まで録音する。
+    # fBufferSec          : メモリ上に保持するPCMの最大時間[秒]
+    # bSpill              : メモリが一杯の場合に、一時ファイルに書き出すか（Falseの場合は、キャプチャを待たせる）
+    # strSpillDir         : 一時ファイルを作成するディレクトリ
+    # fSegmentSec         : セグメントの時間[秒]。指定する場合は、シンクに SegmentedSink を使用する。
+    def __init__( self, source, encoder, sink, fDurationSec = None, iBufferFrames = BUFFER_FRAMES_DEFAULT,
+                  fBufferSec = BUFFER_SECONDS_DEFAULT, bSpill = False, strSpillDir = None, fSegmentSec = None ):
+        self._source = source
+        self._encoder = encoder
+        self._sink = sink
+        self._iTotalFrames = None if (fDurationSec is None) else int( fDurationSec * source.iSampleRate )
+        self._iBufferFrames = iBufferFrames
+
+        iFrameBytes = source.iChannels * source.iSampleWidth
+        self._iBytesPerSec = source.iSampleRate * iFrameBytes
+        if( fSegmentSec is not None ):
+            self._iSegmentBytes = int( fSegmentSec * source.iSampleRate ) * iFrameBytes
+        self._buffer = SpoolBuffer( int( fBufferSec * source.iSampleRate ) * iFrameBytes, bSpill, strSpillDir )
+        self._eventStop = threading.Event()
+
+    # 録音の実行（録音が終わるまで戻らない）
+    def run( self ):
+        fStartSec = time.monotonic()
+        thread = threading.Thread( target = self._capture, daemon = True )
+        thread.start()
+        try:
+            self._sink.write( self._encoder.start() )
+            while( True ):
+                byPCM = self._buffer.get()
+                if( byPCM is None ):
+                    break
+                if( self._iSegmentBytes is None ):
+                    self._sink.write( self._encoder.encode( byPCM ) )
+                else:
+                    self._encodeSegmented( byPCM )
+            if( self._iSegmentBytes is None ):
+                self._sink.write( self._encoder.finish() )
+                self._sink.close( self._encoder.getFinalHeader() )
+            else:
+                self._finishSegment()
+                self._sink.close()
+        finally:
+            self._eventStop.set()
+            self._buffer.close()
+            thread.join()
+            self.fElapsedSec = time.monotonic() - fStartSec
+
+        if( self._exception is not None ):
+            raise self._exception
+
+    # 録音の停止要求（別スレッドやシグナルハンドラーから呼び出す）
+    def stop( self ):
+        self._eventStop.set()
+
+    # 統計の取得
+    def getStatistics( self ):
+        return { "frames_captured"     : self.iFramesCaptured,
+                 "bytes_written"       : self._sink.iBytesWritten,
+                 "buffer_peak_bytes"   : self._buffer.iMemoryBytesPeak,
+                 "spilled_bytes"       : self._buffer.iSpilledBytes,
+                 "elapsed_sec"         : self.fElapsedSec }
+
+    # セグメント出力でのエンコード
+    # セグメントの境界で、PCMを分割する。
+    def _encodeSegmented( self, byPCM ):
+        while( byPCM ):
+            # 前のセグメントが一杯の場合は、次のデータが来た時点で、新しいセグメントを始める。（録音の終了時に、空のセグメントを作らない）
+            if( self._iSegmentBytes <= self._iSegmentPCMBytes ):
+                self._finishSegment()
+                self._sink.write( self._encoder.start() )
+            iBytes = min( len( byPCM ), self._iSegmentBytes - self._iSegmentPCMBytes )
+            self._sink.write( self._encoder.encode( byPCM[:iBytes] ) )
+            self._iSegmentPCMBytes += iBytes
+            byPCM = byPCM[iBytes:]
+
+    # 書き込み中のセグメントの確定
+    def _finishSegment( self ):
+        self._sink.write( self._encoder.finish() )
+        self._sink.rotate( self._encoder.getFinalHeader(), self._iSegmentPCMBytes / self._iBytesPerSec )
+        self._iSegmentPCMBytes = 0
+
+    # キャプチャスレッドの処理
+    def _capture( self ):
+        iFrameBytes = self._source.iChannels * self._source.iSampleWidth
+        try:
+            while( not self._eventStop.is_set() ):
+                iFrames = self._iBufferFrames
+                if( self._iTotalFrames is not None ):
+                    iFrames = min( iFrames, self._iTotalFrames - self.iFramesCaptured )
+                    if( 0 >= iFrames ):
+                        break
+
+                byPCM = self._source.read( iFrames )
+                if( not byPCM ):
+                    break
+                self.iFramesCaptured += len( byPCM ) // iFrameBytes
+                self._buffer.put( byPCM )
+        except Exception as e:
+            self._exception = e
+        finally:
+            self._source.close()
+            self._buffer.closeWriter()
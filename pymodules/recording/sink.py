@@ -0,0 +1,360 @@
+# sink.py
+#
+# Classes to write encoded audio
+#
+# シンクのインターフェース
+#   write( byData )          : エンコード済みのデータを書き込む。
+#   close( byFinalHeader )   : 終了する。byFinalHeader が None でない場合は、ファイル先頭に書き戻す。
+#   iBytesWritten            : 書き込んだバイト数
+#
+# StagedFileSink、SegmentedSink は、さらに以下を持つ。
+#   statistics               : 書き込みの統計（WriteStatistics）
+#
+# SegmentedSink は、さらに以下を持つ。（RecordingPipeline の fSegmentSec 指定時に使用する）
+#   rotate( byFinalHeader, fDurationSec ) : 書き込み中のセグメントを確定し、次のセグメントに切り替える。
+#
+# セグメント出力（SegmentedSink）
+#   一定時間ごとに、別々のファイル（セグメント）に書き込む。録音中のプロセスが異常終了しても、失われるのは書き込み中のセグメントのみ。
+#   - セグメントは、出力ファイルパスの拡張子を ".segments" にしたディレクトリに、"00000.mp3" のような名前で作成する。
+#   - 書き込み中のセグメントの名前は、末尾に ".part" を付ける。確定時に、同期（fsync）してから名前を変更する。（確定したファイルは、常に完全）
+#   - 確定したセグメントの一覧を、HLS形式のプレイリスト（出力ファイルパスの拡張子を ".m3u8" にしたファイル）に書き出す。
+#     確定のたびに更新する（一時ファイルに書き込んでから名前を変更する）ので、録音中でも、確定済みのセグメントから処理を始められる。
+#     録音の終了時に、終端（#EXT-X-ENDLIST）を書き込む。
+#   - bConcatenate が True の場合は、終了時に、全セグメントを再エンコードせずに連結して出力ファイルを作成し、セグメントとプレイリストを削除する。
+#     WAVはヘッダーを書き換えてデータを連結し、それ以外（MP3）は ffmpeg の concat（-c copy）で連結する。
+#
+# メモリ上でまとめた書き込み（StagedFileSink、SegmentedSink の iFlushBytes 指定時。StagedWriter）
+#   エンコーダーの出力（100ms分で数KB）を、そのたびにファイル（SDカード）に書き込むと、小さな書き込みが多数発生し、
+#   書き込みの遅延のばらつきが大きくなり、フラッシュメモリの書き込み量も増える。
+#   - 書き込むデータは、メモリ上（最大 iFlushBytes バイト）にためておき、iFlushBytes バイトたまるごとに、
+#     iFlushBytes の倍数のバイト数を、1回で書き込む。（ファイル上の位置も、iFlushBytes の倍数に揃う）
+#   - 同期（fsync）は、iSyncBytes バイト書き込むごとと、終了時のみ行う。同期した範囲は、ページキャッシュから解放する。
+#   - 書き込み中のファイルの名前は、末尾に ".part" を付け、終了時に、同期してから名前を変更する。（出力ファイルパスのファイルは、常に完全）
+#   - 書き込み、同期の回数と所要時間を、WriteStatistics に記録する。
+
+# Copyright 2023 Nobuki HIRAMINE
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import math
+import os
+import shutil
+import struct
+import subprocess
+import tempfile
+import time
+
+# --- 定数定義 ---
+
+SEGMENT_DIR_EXTENSION = ".segments"     # セグメントのディレクトリの拡張子
+PLAYLIST_EXTENSION = ".m3u8"            # プレイリストの拡張子
+PART_EXTENSION = ".part"                # 書き込み中のファイルの拡張子
+WAV_HEADER_SIZE = 44                    # WavEncoderのヘッダーのバイト数
+FLUSH_BYTES_DEFAULT = 1048576           # メモリ上にためて、まとめて書き込むバイト数
+SYNC_BYTES_DEFAULT = 4194304            # 同期（fsync）する間隔[バイト]
+
+# --- クラス定義 ---
+
+# ファイルへの書き込み
+class FileSink:
+    iBytesWritten = 0
+    _file = None
+
+    # コンストラクタ
+    def __init__( self, strPath ):
+        self._file = open( strPath, "wb" )
+
+    def write( self, byData ):
+        if( byData ):
+            self._file.write( byData )
+            self.iBytesWritten += len( byData )
+
+    def close( self, byFinalHeader = None ):
+        if( byFinalHeader is not None ):
+            self._file.seek( 0 )
+            self._file.write( byFinalHeader )
+        self._file.close()
+
+# 書き込みの統計
+class WriteStatistics:
+    iFlushes = 0                # 書き込みの回数
+    iBytesFlushed = 0           # 書き込んだバイト数
+    fFlushSecTotal = 0.0        # 書き込みの所要時間[秒]の合計
+    fFlushSecMax = 0.0          # 書き込みの所要時間[秒]の最大
+    iSyncs = 0                  # 同期の回数
+    fSyncSecTotal = 0.0
+    fSyncSecMax = 0.0
+
+    def addFlush( self, iBytes, fSec ):
+        self.iFlushes += 1
+        self.iBytesFlushed += iBytes
+        self.fFlushSecTotal += fSec
+        self.fFlushSecMax = max( self.fFlushSecMax, fSec )
+
+    def addSync( self, fSec ):
+        self.iSyncs += 1
+        self.fSyncSecTotal += fSec
+        self.fSyncSecMax = max( self.fSyncSecMax, fSec )
+
+    def toDict( self ):
+        return { "flushes"        : self.iFlushes,
+                 "bytes_flushed"  : self.iBytesFlushed,
+                 "flush_sec_max"  : self.fFlushSecMax,
+                 "flush_sec_mean" : (self.fFlushSecTotal / self.iFlushes) if self.iFlushes else 0.0,
+                 "syncs"          : self.iSyncs,
+                 "sync_sec_max"   : self.fSyncSecMax,
+                 "sync_sec_mean"  : (self.fSyncSecTotal / self.iSyncs) if self.iSyncs else 0.0 }
+
+# メモリ上でまとめた、ファイルへの書き込み
+# iFlushBytes が 0 の場合は、ためずに、そのたびに書き込む。iSyncBytes が 0 の場合は、finish()でのみ同期する。
+class StagedWriter:
+    name = None                 # ファイルパス
+    _file = None
+    _byStage = None             # 書き込み前のデータ
+    _iFlushBytes = 0
+    _iSyncBytes = 0
+    _iUnsyncedBytes = 0         # 前回の同期から書き込んだバイト数
+    _iSyncedOffset = 0          # 同期済みの範囲の終端（ページキャッシュから解放済み）
+    _statistics = None
+
+    def __init__( self, strPath, iFlushBytes, iSyncBytes, statistics ):
+        self.name = strPath
+        self._file = open( strPath, "wb", buffering = 0 )
+        self._byStage = bytearray()
+        self._iFlushBytes = iFlushBytes
+        self._iSyncBytes = iSyncBytes
+        self._statistics = statistics
+
+    def write( self, byData ):
+        self._byStage += byData
+        if( self._iFlushBytes <= len( self._byStage ) ):
+            self._flush( len( self._byStage ) - (len( self._byStage ) % self._iFlushBytes if self._iFlushBytes else 0) )
+
+    # 終了
+    # 残りのデータを書き込み、byFinalHeader が None でない場合は、ファイル先頭に書き戻してから、同期して閉じる。
+    def finish( self, byFinalHeader = None ):
+        self._flush( len( self._byStage ) )
+        if( byFinalHeader is not None ):
+            os.pwrite( self._file.fileno(), byFinalHeader, 0 )
+        self._sync()
+        self._file.close()
+
+    # 破棄
+    def discard( self ):
+        self._file.close()
+        os.remove( self.name )
+
+    # 先頭から iBytes バイトの書き込み
+    def _flush( self, iBytes ):
+        if( 0 >= iBytes ):
+            return
+        fStartSec = time.monotonic()
+        viewData = memoryview( self._byStage )[:iBytes]
+        try:
+            while( viewData ):
+                viewData = viewData[self._file.write( viewData ):]
+        finally:
+            viewData.release()
+        del self._byStage[:iBytes]
+        self._statistics.addFlush( iBytes, time.monotonic() - fStartSec )
+        self._iUnsyncedBytes += iBytes
+        if( self._iSyncBytes and (self._iSyncBytes <= self._iUnsyncedBytes) ):
+            self._sync()
+
+    def _sync( self ):
+        fStartSec = time.monotonic()
+        os.fsync( self._file.fileno() )
+        self._statistics.addSync( time.monotonic() - fStartSec )
+        self._iUnsyncedBytes = 0
+        # 録音したデータは、すぐには読み直さないので、ページキャッシュから解放する。（Raspberry Pi のメモリを圧迫しない）
+        iOffset = self._file.tell()
+        if( hasattr( os, "posix_fadvise" ) ):
+            os.posix_fadvise( self._file.fileno(), self._iSyncedOffset, iOffset - self._iSyncedOffset, os.POSIX_FADV_DONTNEED )
+        self._iSyncedOffset = iOffset
+
+# メモリ上でまとめた、ファイルへの書き込み
+# 書き込み中は、出力ファイルパスの末尾に ".part" を付けたファイルに書き込み、終了時に名前を変更する。
+class StagedFileSink:
+    iBytesWritten = 0
+    statistics = None
+    _strPath = None
+    _writer = None
+
+    # コンストラクタ
+    # iFlushBytes : メモリ上にためて、まとめて書き込むバイト数
+    # iSyncBytes  : 同期（fsync）する間隔[バイト]。0の場合は、終了時のみ同期する。
+    def __init__( self, strPath, iFlushBytes = FLUSH_BYTES_DEFAULT, iSyncBytes = SYNC_BYTES_DEFAULT ):
+        self._strPath = strPath
+        self.statistics = WriteStatistics()
+        self._writer = StagedWriter( strPath + PART_EXTENSION, iFlushBytes, iSyncBytes, self.statistics )
+
+    def write( self, byData ):
+        if( byData ):
+            self._writer.write( byData )
+            self.iBytesWritten += len( byData )
+
+    def close( self, byFinalHeader = None ):
+        self._writer.finish( byFinalHeader )
+        os.replace( self._writer.name, self._strPath )
+
+# セグメントへの書き込み
+class SegmentedSink:
+    iBytesWritten = 0
+    iSegments = 0               # 確定したセグメント数
+    statistics = None
+    _strOutputPath = None
+    _strExtension = None
+    _strSegmentDir = None
+    _strPlaylistPath = None
+    _bConcatenate = False
+    _aSegment = None            # 確定したセグメント [ ( ファイル名, 時間[秒] ), ... ]
+    _iFlushBytes = 0
+    _iSyncBytes = 0
+    _writer = None              # 書き込み中のセグメント（StagedWriter）
+
+    # コンストラクタ
+    # strOutputPath : 出力ファイルパス（セグメントのディレクトリ、プレイリストのパスは、これから作る）
+    # strExtension  : セグメントの拡張子（エンコーダーの strExtension）
+    # bConcatenate  : 終了時に、セグメントを連結して出力ファイルを作成するか
+    # iFlushBytes   : メモリ上にためて、まとめて書き込むバイト数。0の場合は、ためずに書き込む。
+    # iSyncBytes    : 同期（fsync）する間隔[バイト]。0の場合は、セグメントの確定時のみ同期する。
+    def __init__( self, strOutputPath, strExtension, bConcatenate = False, iFlushBytes = 0, iSyncBytes = 0 ):
+        self._strOutputPath = strOutputPath
+        self._strExtension = strExtension
+        self._strSegmentDir = getSegmentDir( strOutputPath )
+        self._strPlaylistPath = getPlaylistPath( strOutputPath )
+        self._bConcatenate = bConcatenate
+        self._aSegment = []
+        self._iFlushBytes = iFlushBytes
+        self._iSyncBytes = iSyncBytes
+        self.statistics = WriteStatistics()
+        os.makedirs( self._strSegmentDir, exist_ok = True )
+        self._openSegment()
+
+    def write( self, byData ):
+        if( byData ):
+            self._writer.write( byData )
+            self.iBytesWritten += len( byData )
+
+    # 書き込み中のセグメントの確定
+    # fDurationSec が 0 の場合（データなし）は、セグメントを破棄する。
+    def rotate( self, byFinalHeader, fDurationSec ):
+        strPartPath = self._writer.name
+        if( 0 >= fDurationSec ):
+            self._writer.discard()
+        else:
+            self._writer.finish( byFinalHeader )
+            os.replace( strPartPath, strPartPath[:-len( PART_EXTENSION )] )
+            self._aSegment.append( (os.path.basename( strPartPath[:-len( PART_EXTENSION )] ), fDurationSec) )
+            self.iSegments += 1
+            self._writePlaylist( False )
+        self._openSegment()
+
+    # 終了
+    # 最後のセグメントは、rotate()で確定済みとする。（未確定のデータは破棄する）
+    def close( self, byFinalHeader = None ):
+        self._writer.discard()
+        self._writePlaylist( True )
+        if( self._bConcatenate ):
+            self._concatenate()
+
+    # 次のセグメントを開く
+    def _openSegment( self ):
+        strName = "%05d.%s%s" % (self.iSegments, self._strExtension, PART_EXTENSION)
+        self._writer = StagedWriter( os.path.join( self._strSegmentDir, strName ), self._iFlushBytes, self._iSyncBytes, self.statistics )
+
+    # プレイリストの書き込み
+    def _writePlaylist( self, bEnd ):
+        strDirName = os.path.basename( self._strSegmentDir )
+        astrLine = [ "#EXTM3U",
+                     "#EXT-X-VERSION:3",
+                     "#EXT-X-TARGETDURATION:%d" % math.ceil( max( [ fSec for (strName, fSec) in self._aSegment ], default = 0 ) ),
+                     "#EXT-X-MEDIA-SEQUENCE:0" ]
+        if( bEnd ):
+            astrLine.append( "#EXT-X-PLAYLIST-TYPE:VOD" )
+        for (strName, fSec) in self._aSegment:
+            astrLine += [ "#EXTINF:%.3f," % fSec, "%s/%s" % (strDirName, strName) ]
+        if( bEnd ):
+            astrLine.append( "#EXT-X-ENDLIST" )
+        _writeAtomically( self._strPlaylistPath, ("\n".join( astrLine ) + "\n").encode() )
+
+    # セグメントの連結
+    def _concatenate( self ):
+        astrPath = [ os.path.join( self._strSegmentDir, strName ) for (strName, fSec) in self._aSegment ]
+        strPartPath = self._strOutputPath + PART_EXTENSION
+        if( "wav" == self._strExtension ):
+            _concatenateWav( astrPath, strPartPath )
+        elif( astrPath ):
+            _concatenateFFmpeg( astrPath, strPartPath )
+        else:
+            open( strPartPath, "wb" ).close()
+        os.replace( strPartPath, self._strOutputPath )
+
+        os.remove( self._strPlaylistPath )
+        shutil.rmtree( self._strSegmentDir )
+
+# --- 関数定義 ---
+
+# 出力ファイルパスに対する、セグメントのディレクトリのパス
+def getSegmentDir( strOutputPath ):
+    return os.path.splitext( strOutputPath )[0] + SEGMENT_DIR_EXTENSION
+
+# 出力ファイルパスに対する、プレイリストのパス
+def getPlaylistPath( strOutputPath ):
+    return os.path.splitext( strOutputPath )[0] + PLAYLIST_EXTENSION
+
+# 一時ファイルに書き込んでから、名前を変更する
+def _writeAtomically( strPath, byData ):
+    with open( strPath + PART_EXTENSION, "wb" ) as file:
+        file.write( byData )
+        file.flush()
+        os.fsync( file.fileno() )
+    os.replace( strPath + PART_EXTENSION, strPath )
+
+# WAVファイルの連結（先頭のファイルのヘッダーの、サイズのみ書き換える）
+def _concatenateWav( astrPath, strOutputPath ):
+    with open( strOutputPath, "wb" ) as fileOutput:
+        iDataBytes = 0
+        for (i, strPath) in enumerate( astrPath ):
+            with open( strPath, "rb" ) as fileInput:
+                byHeader = fileInput.read( WAV_HEADER_SIZE )
+                if( 0 == i ):
+                    fileOutput.write( byHeader )
+                iDataBytes += _copyFile( fileInput, fileOutput )
+        if( astrPath ):
+            fileOutput.seek( 4 )
+            fileOutput.write( struct.pack( "<I", 36 + iDataBytes ) )
+            fileOutput.seek( 40 )
+            fileOutput.write( struct.pack( "<I", iDataBytes ) )
+        fileOutput.flush()
+        os.fsync( fileOutput.fileno() )
+
+# ffmpegのconcatでの連結（再エンコードしない）
+def _concatenateFFmpeg( astrPath, strOutputPath ):
+    with tempfile.NamedTemporaryFile( "w", suffix = ".txt", dir = os.path.dirname( os.path.abspath( strOutputPath ) ), delete = False ) as fileList:
+        for strPath in astrPath:
+            fileList.write( "file '%s'\n" % os.path.abspath( strPath ).replace( "'", "'\\''" ) )
+    try:
+        subprocess.run( [ "ffmpeg", "-y", "-f", "concat", "-safe", "0", "-i", fileList.name, "-c", "copy",
+                          "-f", os.path.splitext( astrPath[0] )[1][1:], strOutputPath, "-loglevel", "error" ], check = True )
+    finally:
+        os.remove( fileList.name )
+
+def _copyFile( fileInput, fileOutput ):
+    iBytes = 0
+    while( True ):
+        byData = fileInput.read( 1048576 )
+        if( not byData ):
+            return iBytes
+        fileOutput.write( byData )
+        iBytes += len( byData )
@@ -0,0 +1,155 @@
+# source.py
+#
+# Classes to capture PCM audio
+#
+# ソースのインターフェース
+#   iSampleRate, iChannels, iSampleWidth : PCMの形式（サンプリング周波数[Hz]、チャンネル数、1サンプルのバイト数）
+#   read( iFrames )                      : iFramesフレーム分のPCMを読み込む。終端に達した場合は、短いデータ、または空のbytesを返す。
+#   close()                              : 終了する。
+
+# Copyright 2023 Nobuki HIRAMINE
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import math
+import subprocess
+import sys
+import wave
+from array import array
+
+# --- 定数定義 ---
+
+# PCMの形式（USBオーディオアダプタのマイク端子からの入力。record.shのffmpeg/arecordの設定と同じ）
+SAMPLE_RATE  = 44100    # サンプリング周波数[Hz]
+CHANNELS     = 2        # チャンネル数（ステレオ）
+SAMPLE_WIDTH = 2        # 1サンプルのバイト数（S16_LE）
+
+# --- クラス定義 ---
+
+# ALSAのキャプチャデバイスからのPCM
+# arecordの標準出力から、RAW形式のPCMを読み込む。
+class AlsaSource:
+    iSampleRate = SAMPLE_RATE
+    iChannels = CHANNELS
+    iSampleWidth = SAMPLE_WIDTH
+    _process = None
+
+    # コンストラクタ
+    # strDevice : キャプチャデバイス名（arecord -D で指定する名前）
+    def __init__( self, strDevice = "default", iSampleRate = SAMPLE_RATE, iChannels = CHANNELS ):
+        self.iSampleRate = iSampleRate
+        self.iChannels = iChannels
+        self._process = subprocess.Popen( [ "arecord", "-D", strDevice, "-t", "raw", "-f", "S16_LE",
+                                            "-c", str( iChannels ), "-r", str( iSampleRate ), "--quiet" ],
+                                          stdout = subprocess.PIPE, bufsize = 0 )
+
+    def read( self, iFrames ):
+        return _readFully( self._process.stdout, iFrames * self.iChannels * self.iSampleWidth )
+
+    def close( self ):
+        if( self._process.poll() is None ):
+            self._process.terminate()
+        self._process.stdout.close()
+        self._process.wait()
+
+# WAVファイルからのPCM（テスト用）
+class WavFileSource:
+    iSampleRate = SAMPLE_RATE
+    iChannels = CHANNELS
+    iSampleWidth = SAMPLE_WIDTH
+    _wave = None
+
+    # コンストラクタ
+    def __init__( self, strPath ):
+        self._wave = wave.open( strPath, "rb" )
+        self.iSampleRate = self._wave.getframerate()
+        self.iChannels = self._wave.getnchannels()
+        self.iSampleWidth = self._wave.getsampwidth()
+
+    def read( self, iFrames ):
+        return self._wave.readframes( iFrames )
+
+    def close( self ):
+        self._wave.close()
+
+# 正弦波のPCM（テスト用）
+# fDurationSec[秒]分を生成したら、終端とする。（Noneの場合は、終端なし）
+class ToneSource:
+    iSampleRate = SAMPLE_RATE
+    iChannels = CHANNELS
+    iSampleWidth = SAMPLE_WIDTH
+    _byPeriod = None        # 1秒分のPCM（正弦波の周波数は整数なので、1秒ごとに同じ波形の繰り返しになる）
+    _iPosition = 0          # _byPeriod 内の現在位置[バイト]
+    _iRemainingBytes = None # 残りのバイト数（Noneの場合は、終端なし）
+
+    # コンストラクタ
+    def __init__( self, iFrequency = 440, fDurationSec = None, fAmplitude = 0.5, iSampleRate = SAMPLE_RATE, iChannels = CHANNELS ):
+        self.iSampleRate = iSampleRate
+        self.iChannels = iChannels
+
+        asSample = array( "h" )
+        for i in range( iSampleRate ):
+            sSample = int( 32767 * fAmplitude * math.sin( 2 * math.pi * iFrequency * i / iSampleRate ) )
+            asSample.extend( [ sSample ] * iChannels )
+        if( "big" == sys.byteorder ):
+            asSample.byteswap()     # S16_LE にする。
+        self._byPeriod = asSample.tobytes()
+
+        if( fDurationSec is not None ):
+            self._iRemainingBytes = int( fDurationSec * iSampleRate ) * iChannels * self.iSampleWidth
+
+    def read( self, iFrames ):
+        iBytes = iFrames * self.iChannels * self.iSampleWidth
+        if( self._iRemainingBytes is not None ):
+            iBytes = min( iBytes, self._iRemainingBytes )
+            self._iRemainingBytes -= iBytes
+
+        abyData = bytearray()
+        while( len( abyData ) < iBytes ):
+            iChunk = min( iBytes - len( abyData ), len( self._byPeriod ) - self._iPosition )
+            abyData += self._byPeriod[self._iPosition:self._iPosition + iChunk]
+            self._iPosition = (self._iPosition + iChunk) % len( self._byPeriod )
+        return bytes( abyData )
+
+    def close( self ):
+        pass
+
+# --- 関数定義 ---
+
+# ソース指定文字列からのソースの生成
+#   "alsa" または "alsa:デバイス名" : AlsaSource
+#   "wav:ファイルパス"              : WavFileSource
+#   "tone" または "tone:周波数[Hz]" : ToneSource
+#   "hub" または "hub:ソケットパス" : HubSource（capture_server.py が読み込んだPCMを購読する。capture_hub.py 参照）
+def openSource( strSpec ):
+    (strType, _, strArg) = strSpec.partition( ":" )
+    if( "alsa" == strType ):
+        return AlsaSource( strArg if strArg else "default" )
+    elif( "wav" == strType ):
+        return WavFileSource( strArg )
+    elif( "tone" == strType ):
+        return ToneSource( int( strArg ) if strArg else 440 )
+    elif( "hub" == strType ):
+        from .capture_hub import HubSource      # 循環importを避けるため、ここでimportする。
+        return HubSource( strArg if strArg else None )
+    raise ValueError( "Unknown source : %s" % strSpec )
+
+# iBytesバイトに達するか終端に達するまで読み込む
+def _readFully( file, iBytes ):
+    abyData = bytearray()
+    while( len( abyData ) < iBytes ):
+        byChunk = file.read( iBytes - len( abyData ) )
+        if( not byChunk ):
+            break
+        abyData += byChunk
+    return bytes( abyData )
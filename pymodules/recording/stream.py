@@ -0,0 +1,159 @@
+# stream.py
+#
+# Classes to encode audio once and fan it out to many stream listeners
+#
+# StreamBroadcaster : ソースからPCMを読み込み、1回だけエンコードして、StreamBuffer に書き込む。（RecordingPipeline を使用する）
+# StreamBuffer      : エンコード済みのデータ（チャンク）を、上限数まで保持するリングバッファー。
+#                     聴取者ごとに、読み込んだチャンクの通し番号を持ち、同じチャンクを共有して読み込む。（聴取者ごとのエンコードやコピーはしない）
+#                     読み込みが遅れて、バッファーから溢れたチャンクは、その聴取者には送らずに飛ばす。（キャプチャとエンコードは、聴取者を待たない）
+# BroadcastSink     : StreamBuffer に書き込むシンク（sink.py のシンクのインターフェース）
+
+# Copyright 2023 Nobuki HIRAMINE
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import collections
+import threading
+
+from .pipeline import RecordingPipeline
+
+# --- 定数定義 ---
+
+STREAM_BUFFER_SIZE = 100        # リングバッファーに保持するチャンク数（PCMの読み込み単位が100msの場合、約10秒分）
+STREAM_PREFILL_CHUNKS = 5       # 聴取の開始時に、何チャンク前から送るか（再生開始までの時間を短くする）
+
+# --- クラス定義 ---
+
+# エンコード済みデータのリングバッファー
+class StreamBuffer:
+    _deque = None               # ( 通し番号, チャンク ) の列
+    _iSequence = 0
+    _bClosed = False
+    _condition = None
+
+    # 統計
+    iBytes = 0                  # 書き込んだバイト数の合計
+
+    def __init__( self, iSize = STREAM_BUFFER_SIZE ):
+        self._deque = collections.deque( maxlen = iSize )
+        self._condition = threading.Condition()
+
+    # チャンクの追加（一杯の場合は、古いチャンクを捨てる）
+    def put( self, byData ):
+        with self._condition:
+            self._iSequence += 1
+            self._deque.append( (self._iSequence, byData) )
+            self.iBytes += len( byData )
+            self._condition.notify_all()
+
+    # 書き込みの終了（読み込みを待っている聴取者の待ちを解除する）
+    def close( self ):
+        with self._condition:
+            self._bClosed = True
+            self._condition.notify_all()
+
+    # iSequence より後のチャンクの読み込み
+    # fTimeoutSec : 新しいチャンクがない場合に待つ時間[秒]
+    # ( 最後のチャンクの通し番号, チャンクのリスト ) を返す。終了後で、新しいチャンクがない場合は、( iSequence, None ) を返す。
+    def read( self, iSequence, fTimeoutSec ):
+        with self._condition:
+            if( (self._iSequence <= iSequence) and (not self._bClosed) ):
+                self._condition.wait( fTimeoutSec )
+            if( (self._iSequence <= iSequence) and self._bClosed ):
+                return (iSequence, None)
+            abyChunk = [ byData for (iChunkSequence, byData) in self._deque if iSequence < iChunkSequence ]
+            return (self._iSequence, abyChunk)
+
+    # 聴取の開始位置（STREAM_PREFILL_CHUNKS 前のチャンクの通し番号）
+    def getStartSequence( self ):
+        with self._condition:
+            return max( 0, self._iSequence - STREAM_PREFILL_CHUNKS )
+
+# StreamBuffer に書き込むシンク
+class BroadcastSink:
+    iBytesWritten = 0
+    _buffer = None
+
+    def __init__( self, buffer ):
+        self._buffer = buffer
+
+    def write( self, byData ):
+        if( byData ):
+            self._buffer.put( byData )
+            self.iBytesWritten += len( byData )
+
+    def close( self, byFinalHeader = None ):
+        # ストリームでは、ヘッダーは書き戻せないので捨てる。
+        self._buffer.close()
+
+# エンコードと配信
+class StreamBroadcaster:
+    buffer = None
+    iListeners = 0              # 聴取中の聴取者数
+    _pipeline = None
+    _thread = None
+    _lock = None
+    _exception = None
+
+    # コンストラクタ
+    # source、encoder : ソースとエンコーダー（source.py、encoder.py）
+    def __init__( self, source, encoder, iBufferSize = STREAM_BUFFER_SIZE ):
+        self.buffer = StreamBuffer( iBufferSize )
+        self._pipeline = RecordingPipeline( source, encoder, BroadcastSink( self.buffer ) )
+        self._lock = threading.Lock()
+
+    # 開始
+    def start( self ):
+        self._thread = threading.Thread( target = self._run, daemon = True )
+        self._thread.start()
+
+    # 終了
+    def stop( self ):
+        self._pipeline.stop()
+        if( self._thread is not None ):
+            self._thread.join()
+            self._thread = None
+
+    def isRunning( self ):
+        return (self._thread is not None) and self._thread.is_alive()
+
+    # 聴取者へのエンコード済みデータの送信（聴取者ごとのスレッドから呼び出す）
+    # write : データを送信する関数 write( byData )。送信できない場合（切断等）は、OSErrorを送出する。
+    # ストリームが終了するか、送信できなくなるまで戻らない。
+    def serve( self, write, fTimeoutSec = 1.0 ):
+        with self._lock:
+            self.iListeners += 1
+        try:
+            iSequence = self.buffer.getStartSequence()
+            while( True ):
+                (iSequence, abyChunk) = self.buffer.read( iSequence, fTimeoutSec )
+                if( abyChunk is None ):
+                    break
+                for byData in abyChunk:
+                    write( byData )
+        except OSError:
+            pass
+        finally:
+            with self._lock:
+                self.iListeners -= 1
+
+    def getStatistics( self ):
+        return { "listeners" : self.iListeners, "bytes_encoded" : self.buffer.iBytes, "running" : self.isRunning(),
+                 "error" : None if (self._exception is None) else str( self._exception ) }
+
+    def _run( self ):
+        try:
+            self._pipeline.run()
+        except Exception as e:
+            self._exception = e
+            self.buffer.close()
@@ -0,0 +1,169 @@
+# timetable.py
+#
+# Timetable of scheduled recordings, and the plan to assign tuners to them
+#
+# 番組表（JSON）の形式
+#   [ { "name"       : 予約録音名,
+#       "frequency"  : 周波数[MHz],
+#       "start"      : 開始時刻 "HH:MM"（24時以降は、"25:00"のように指定しても良い。前日の番組として扱う）,
+#       "length"     : 録音時間[分],
+#       "days"       : 曜日のリスト [ "mon", "tue", ... ]。省略時は毎日。（"start"が24時以降の場合は、前日の曜日）
+#       "date"       : 日付 "YYYY-MM-DD"。指定した場合は、その日のみ録音する。（"days"より優先）
+#       "bitrate"    : MP3ビットレート[kbps]。省略時は128。
+#       "output_dir" : 出力ディレクトリパス。省略時は、番組表ファイルのディレクトリ。（相対パスは、番組表ファイルのディレクトリから）
+#       "wav2mp3"    : WAV2MP3モード（record.sh参照）。省略時はFalse。
+#       "transcode"  : 追加の変換プロファイルのリスト [ "aac_96", ... ]。指定した場合は、WAVで録音し、MP3（と追加のプロファイル）への変換を、
+#                      変換キューに追加する。（recording/transcode.py参照）省略時は、録音しながらMP3に変換する。
+#       "segment_sec": セグメントの時間[秒]。指定した場合は、セグメントに分けて録音し、終了時に連結する。（recording/sink.py参照）省略時はセグメントに分けない。 }, ... ]
+#
+# 割り当て
+#   時間が重なる録音には、別々のチューナーを割り当てる。チューナーが足りない録音は、競合として事前に検出する。
+#   前の録音の終了時刻に開始する録音には、前の録音と同じチューナーを優先して割り当てる。
+#   （チューナーの電源を入れたまま、周波数の変更のみで、連続して録音できる）
+
+# Copyright 2023 Nobuki HIRAMINE
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import collections
+import datetime
+import json
+import os
+
+from .transcode import parseProfile
+
+# --- 定数定義 ---
+
+DAY_NAMES = ( "mon", "tue", "wed", "thu", "fri", "sat", "sun" )    # datetime.weekday() の順
+BITRATE_KBPS_DEFAULT = 128
+
+# 番組表の項目
+ScheduleEntry = collections.namedtuple( "ScheduleEntry", [ "name", "frequency", "start_minute", "length_minute", "days", "date",
+                                                           "bitrate", "output_dir", "wav2mp3", "segment_sec", "transcode" ] )
+
+# 録音枠（番組表の項目の、1回分の録音）
+# start, end : 開始・終了時刻（datetime）
+Slot = collections.namedtuple( "Slot", [ "start", "end", "entry" ] )
+
+# 割り当て済みの録音枠
+# tuner : 割り当てたチューナーの番号。チューナーが足りない場合はNone。
+# conflicts : チューナーが足りない場合の、時間が重なる録音枠のリスト
+PlannedSlot = collections.namedtuple( "PlannedSlot", [ "slot", "tuner", "conflicts" ] )
+
+# --- 関数定義 ---
+
+# 番組表ファイルの読み込み
+# 形式が不正な場合は、ValueErrorを送出する。
+def loadTimetable( strPath ):
+    strBaseDir = os.path.dirname( os.path.abspath( strPath ) )
+    with open( strPath, encoding = "utf-8" ) as file:
+        return [ _parseEntry( dictEntry, strBaseDir ) for dictEntry in json.load( file ) ]
+
+# 期間内の録音枠の作成
+# dtFrom から dtTo までに開始する録音枠を、開始時刻順に返す。
+def expandSlots( aEntry, dtFrom, dtTo ):
+    aSlot = []
+    # 24時以降の開始時刻は前日の番組として扱うので、1日前から調べる。
+    dateDay = dtFrom.date() - datetime.timedelta( days = 1 )
+    while( dateDay <= dtTo.date() ):
+        for entry in aEntry:
+            if( entry.date is not None ):
+                if( entry.date != dateDay ):
+                    continue
+            elif( DAY_NAMES[dateDay.weekday()] not in entry.days ):
+                continue
+            dtStart = datetime.datetime.combine( dateDay, datetime.time() ) + datetime.timedelta( minutes = entry.start_minute )
+            if( dtFrom <= dtStart < dtTo ):
+                aSlot.append( Slot( dtStart, dtStart + datetime.timedelta( minutes = entry.length_minute ), entry ) )
+        dateDay += datetime.timedelta( days = 1 )
+
+    aSlot.sort( key = lambda slot: (slot.start, slot.entry.name) )
+    return aSlot
+
+# 録音枠へのチューナーの割り当て
+# iTunerCount : チューナーの数
+# aBusyUntil  : チューナーごとの、使用中の録音の終了時刻（録音中でない場合はNone）。省略時は、全チューナーが空き。
+# PlannedSlot のリストを、開始時刻順に返す。
+def planSlots( aSlot, iTunerCount, aBusyUntil = None ):
+    aEnd = list( aBusyUntil ) if (aBusyUntil is not None) else [None] * iTunerCount
+    afFrequency = [None] * iTunerCount      # チューナーごとの、直前の録音の周波数
+    aPlanned = []
+    for slot in aSlot:
+        # 空いているチューナーのうち、直前の録音の終了時刻が最も遅いもの（終了時刻に開始する録音では、同じチューナー）を割り当てる。
+        # 終了時刻が同じ場合は、同じ周波数のチューナーを優先する。
+        iTuner = None
+        for i in range( iTunerCount ):
+            if( (aEnd[i] is not None) and (slot.start < aEnd[i]) ):
+                continue
+            if( iTuner is None ):
+                iTuner = i
+            elif( aEnd[i] is None ):
+                continue
+            elif( (aEnd[iTuner] is None) or (aEnd[iTuner] < aEnd[i])
+                  or ((aEnd[iTuner] == aEnd[i]) and (slot.entry.frequency == afFrequency[i])) ):
+                iTuner = i
+
+        if( iTuner is None ):
+            aConflict = [ planned.slot for planned in aPlanned if (planned.tuner is not None) and (slot.start < planned.slot.end) and (planned.slot.start < slot.end) ]
+            aPlanned.append( PlannedSlot( slot, None, aConflict ) )
+        else:
+            aEnd[iTuner] = slot.end
+            afFrequency[iTuner] = slot.entry.frequency
+            aPlanned.append( PlannedSlot( slot, iTuner, [] ) )
+    return aPlanned
+
+# 録音枠の出力ファイルパスの作成（record.sh と同じ形式）
+def getOutputPath( slot ):
+    strFrequency = "%.1f" % slot.entry.frequency
+    strFileName = "%s_%s_%s.mp3" % (slot.entry.name, strFrequency, slot.start.strftime( "%Y%m%d%H%M" ))
+    return os.path.join( slot.entry.output_dir, strFileName )
+
+# 番組表の項目の解析
+def _parseEntry( dictEntry, strBaseDir ):
+    try:
+        strStart = str( dictEntry["start"] )
+        (strHour, strMinute) = strStart.split( ":" )
+        iStartMinute = int( strHour ) * 60 + int( strMinute )
+        iLengthMinute = int( dictEntry["length"] )
+        if( (not 0 <= iStartMinute < 48 * 60) or (0 >= iLengthMinute) ):
+            raise ValueError( "start or length is out of range" )
+
+        aDay = tuple( str( strDay ).lower()[:3] for strDay in dictEntry.get( "days", DAY_NAMES ) )
+        for strDay in aDay:
+            if( strDay not in DAY_NAMES ):
+                raise ValueError( "unknown day %s" % strDay )
+
+        date = datetime.date.fromisoformat( dictEntry["date"] ) if ("date" in dictEntry) else None
+
+        aTranscode = tuple( str( strProfile ) for strProfile in dictEntry["transcode"] ) if ("transcode" in dictEntry) else None
+        for strProfile in (aTranscode or ()):
+            parseProfile( strProfile )
+
+        fSegmentSec = float( dictEntry["segment_sec"] ) if ("segment_sec" in dictEntry) else None
+        if( (fSegmentSec is not None) and (0 >= fSegmentSec) ):
+            raise ValueError( "segment_sec is out of range" )
+
+        strOutputDir = os.path.expanduser( dictEntry.get( "output_dir", "." ) )
+        return ScheduleEntry( str( dictEntry["name"] ),
+                              float( dictEntry["frequency"] ),
+                              iStartMinute,
+                              iLengthMinute,
+                              aDay,
+                              date,
+                              int( dictEntry.get( "bitrate", BITRATE_KBPS_DEFAULT ) ),
+                              os.path.join( strBaseDir, strOutputDir ),
+                              bool( dictEntry.get( "wav2mp3", False ) ),
+                              fSegmentSec,
+                              aTranscode )
+    except (KeyError, TypeError, ValueError) as e:
+        raise ValueError( "Invalid timetable entry %s : %s" % (dictEntry, e) )
@@ -0,0 +1,250 @@
+# transcode.py
+#
+# Persistent queue and worker pool to transcode finished WAV recordings
+#
+# TranscodeQueue : 変換待ちのジョブを、キューディレクトリに1ジョブ1ファイル（JSON）で保持する。プロセスを再起動しても、ジョブは失われない。
+#                  ジョブファイルの状態は、拡張子で表す。
+#                    .json         : 変換待ち
+#                    .json.running : 変換中（起動時に変換待ちに戻す。変換中にプロセスが終了した場合は、最初から変換し直す）
+#                    .json.failed  : 変換失敗（"error" にエラー内容を追加する）
+# Transcoder     : キューのジョブを、同時実行数を制限して、ffmpegで変換する。
+#                  ffmpegは、キャプチャより優先度を下げて（nice値を指定して）実行する。
+#                  出力ファイルは、一時ファイル（.part）に書き込んでから名前を変更する。全ての出力の変換に成功したら、入力のWAVファイルを削除する。
+#
+# ジョブファイルの形式
+#   { "input" : 入力WAVファイルパス, "outputs" : [ { "profile" : 出力プロファイル名, "path" : 出力ファイルパス }, ... ], "delete_input" : 変換後に入力を削除するか }
+#
+# 出力プロファイル名
+#   "形式_ビットレート[kbps]"。形式は "mp3"、"aac"、"opus"。（例 : "mp3_128"、"aac_96"、"opus_64"）
+
+# Copyright 2023 Nobuki HIRAMINE
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import collections
+import concurrent.futures
+import itertools
+import json
+import os
+import subprocess
+import threading
+import time
+
+# --- 定数定義 ---
+
+JOB_EXTENSION = ".json"
+RUNNING_EXTENSION = ".running"
+FAILED_EXTENSION = ".failed"
+PART_EXTENSION = ".part"
+
+TRANSCODE_NICE = 15             # ffmpegのnice値（record.pyの Deferred encoding mode のエンコーダーより、さらに優先度を下げる）
+POLL_INTERVAL_SEC = 5.0         # キューディレクトリの確認間隔[秒]
+
+# 出力プロファイル
+# extension  : 出力ファイルの拡張子
+# codec_args : ffmpegの出力側の引数
+TranscodeProfile = collections.namedtuple( "TranscodeProfile", [ "name", "extension", "codec_args" ] )
+
+# 形式 → ( 拡張子, コーデック, フォーマット )
+PROFILE_FORMATS = {
+    "mp3"  : ( "mp3",  "libmp3lame", "mp3" ),
+    "aac"  : ( "m4a",  "aac",        "ipod" ),
+    "opus" : ( "opus", "libopus",    "ogg" ),
+}
+
+# --- クラス定義 ---
+
+# 変換待ちのキュー
+class TranscodeQueue:
+    strDir = None
+    _counter = None
+
+    # コンストラクタ
+    # strDir : キューディレクトリ（ない場合は作成する）
+    def __init__( self, strDir ):
+        self.strDir = strDir
+        self._counter = itertools.count()
+        os.makedirs( strDir, exist_ok = True )
+
+    # ジョブの追加
+    # aOutput : [ ( 出力プロファイル名, 出力ファイルパス ), ... ]
+    # 追加したジョブファイルのパスを返す。
+    def put( self, strInputPath, aOutput, bDeleteInput = True ):
+        for (strProfile, strPath) in aOutput:
+            parseProfile( strProfile )      # 不正なプロファイル名は、追加時にValueErrorとする
+        dictJob = { "input" : os.path.abspath( strInputPath ),
+                    "outputs" : [ { "profile" : strProfile, "path" : os.path.abspath( strPath ) } for (strProfile, strPath) in aOutput ],
+                    "delete_input" : bDeleteInput }
+
+        # 名前の順が追加順になるようにする。一時ファイルに書き込んでから名前を変更するので、Transcoderが書き込み途中のジョブを読むことはない。
+        strName = "%.6f_%d_%d%s" % (time.time(), os.getpid(), next( self._counter ), JOB_EXTENSION)
+        strPath = os.path.join( self.strDir, strName )
+        with open( strPath + PART_EXTENSION, "w", encoding = "utf-8" ) as file:
+            json.dump( dictJob, file )
+            file.flush()
+            os.fsync( file.fileno() )
+        os.replace( strPath + PART_EXTENSION, strPath )
+        return strPath
+
+    # 変換待ちのジョブファイルのパス（追加順）
+    def getPending( self ):
+        return [ os.path.join( self.strDir, strName ) for strName in sorted( os.listdir( self.strDir ) ) if strName.endswith( JOB_EXTENSION ) ]
+
+    # 変換失敗のジョブファイルのパス
+    def getFailed( self ):
+        return [ os.path.join( self.strDir, strName ) for strName in sorted( os.listdir( self.strDir ) ) if strName.endswith( FAILED_EXTENSION ) ]
+
+    # 変換中のジョブを、変換待ちに戻す（前回の異常終了時の、変換中のジョブ）
+    def recover( self ):
+        for strName in os.listdir( self.strDir ):
+            if( strName.endswith( JOB_EXTENSION + RUNNING_EXTENSION ) ):
+                strPath = os.path.join( self.strDir, strName )
+                os.replace( strPath, strPath[:-len( RUNNING_EXTENSION )] )
+
+    # 変換失敗のジョブを、変換待ちに戻す
+    def retryFailed( self ):
+        for strPath in self.getFailed():
+            os.replace( strPath, strPath[:-len( FAILED_EXTENSION )] )
+
+# 変換の実行
+class Transcoder:
+    queue = None
+    iCompleted = 0
+    iFailed = 0
+    _iWorkers = 1
+    _iNice = TRANSCODE_NICE
+    _setRunning = None          # 変換中のジョブファイルのパス（変換待ちの名前）
+    _lock = None
+    _eventStop = None
+    _log = None
+    _onComplete = None
+
+    # コンストラクタ
+    # iWorkers   : 同時に実行するffmpegの数。Noneの場合は、CPUのコア数 - 1（キャプチャ等のために、1コア空ける）。
+    # log        : メッセージを出力する関数 log( strMessage )
+    # onComplete : ジョブの全ての出力の変換に成功した時に呼び出す関数 onComplete( 出力ファイルパスのリスト )（変換のスレッドから呼び出す）
+    def __init__( self, queue, iWorkers = None, iNice = TRANSCODE_NICE, log = None, onComplete = None ):
+        self.queue = queue
+        self._iWorkers = iWorkers if (iWorkers is not None) else max( 1, (os.cpu_count() or 1) - 1 )
+        self._iNice = iNice
+        self._setRunning = set()
+        self._lock = threading.Lock()
+        self._eventStop = threading.Event()
+        self._log = log if (log is not None) else (lambda strMessage: None)
+        self._onComplete = onComplete
+
+    # 実行（stop()が呼ばれるまで戻らない）
+    # bExitWhenEmpty : キューが空になったら戻るか
+    def run( self, bExitWhenEmpty = False ):
+        self.queue.recover()
+        with concurrent.futures.ThreadPoolExecutor( max_workers = self._iWorkers, thread_name_prefix = "transcode" ) as executor:
+            setFuture = set()
+            while( not self._eventStop.is_set() ):
+                # 空いているワーカーの数だけ、ジョブを取り出す（残りのジョブは、ジョブファイルのまま変換待ちとする）
+                for strPath in self.queue.getPending():
+                    if( self._iWorkers <= len( setFuture ) ):
+                        break
+                    with self._lock:
+                        if( strPath in self._setRunning ):
+                            continue
+                        self._setRunning.add( strPath )
+                    setFuture.add( executor.submit( self._runJob, strPath ) )
+
+                if( not setFuture ):
+                    if( bExitWhenEmpty ):
+                        break
+                    self._eventStop.wait( POLL_INTERVAL_SEC )
+                    continue
+                # 変換が終わるか、一定時間（新しいジョブの確認）まで待つ
+                setFuture = concurrent.futures.wait( setFuture, timeout = POLL_INTERVAL_SEC, return_when = concurrent.futures.FIRST_COMPLETED ).not_done
+
+    # 終了要求（変換中のジョブは、終わるまで待つ）
+    def stop( self ):
+        self._eventStop.set()
+
+    # ジョブの変換
+    def _runJob( self, strPath ):
+        strRunningPath = strPath + RUNNING_EXTENSION
+        try:
+            try:
+                os.replace( strPath, strRunningPath )
+            except FileNotFoundError:
+                return      # 別のプロセスが処理した
+
+            # 読み込めないジョブファイル（壊れたJSON等）も、変換失敗とする。（recover()で、毎回変換待ちに戻さない）
+            dictJob = None
+            try:
+                with open( strRunningPath, encoding = "utf-8" ) as file:
+                    dictJob = json.load( file )
+                for dictOutput in dictJob["outputs"]:
+                    fStartSec = time.monotonic()
+                    self._transcode( dictJob["input"], dictOutput["path"], parseProfile( dictOutput["profile"] ) )
+                    self._log( "Transcoded. %s (%s, %.1f[sec])" % (dictOutput["path"], dictOutput["profile"], time.monotonic() - fStartSec) )
+            except (OSError, ValueError, KeyError, TypeError, subprocess.CalledProcessError) as e:
+                if( isinstance( dictJob, dict ) ):
+                    dictJob["error"] = str( e )
+                    with open( strRunningPath, "w", encoding = "utf-8" ) as file:
+                        json.dump( dictJob, file )
+                os.replace( strRunningPath, strPath + FAILED_EXTENSION )
+                with self._lock:
+                    self.iFailed += 1
+                self._log( "Error : Transcoding failed. %s : %s" % (dictJob.get( "input" ) if isinstance( dictJob, dict ) else strPath, e) )
+                return
+
+            if( dictJob.get( "delete_input", True ) ):
+                os.remove( dictJob["input"] )
+            os.remove( strRunningPath )
+            with self._lock:
+                self.iCompleted += 1
+            if( self._onComplete is not None ):
+                self._onComplete( [ dictOutput["path"] for dictOutput in dictJob["outputs"] ] )
+        finally:
+            with self._lock:
+                self._setRunning.discard( strPath )
+
+    # ffmpegでの変換
+    def _transcode( self, strInputPath, strOutputPath, profile ):
+        strPartPath = strOutputPath + PART_EXTENSION
+        try:
+            subprocess.run( [ "ffmpeg", "-y", "-i", strInputPath, "-vn" ] + profile.codec_args + [ strPartPath, "-loglevel", "error" ],
+                            check = True, stdin = subprocess.DEVNULL,
+                            preexec_fn = ( lambda: os.nice( self._iNice ) ) if self._iNice else None )
+        except (OSError, subprocess.CalledProcessError):
+            # 書きかけのファイルは残さない
+            if( os.path.exists( strPartPath ) ):
+                os.remove( strPartPath )
+            raise
+        os.replace( strPartPath, strOutputPath )
+
+# --- 関数定義 ---
+
+# 出力プロファイル名の解析
+def parseProfile( strProfile ):
+    try:
+        (strFormat, strBitrate) = strProfile.split( "_" )
+        (strExtension, strCodec, strMuxer) = PROFILE_FORMATS[strFormat]
+        iBitrateKbps = int( strBitrate )
+    except (KeyError, ValueError):
+        raise ValueError( "Unknown transcode profile : %s" % strProfile )
+    return TranscodeProfile( strProfile, strExtension, [ "-acodec", strCodec, "-ab", "%dk" % iBitrateKbps, "-f", strMuxer ] )
+
+# 出力ファイルパスの作成
+# 先頭のプロファイルは、録音ファイルパスの拡張子をプロファイルの拡張子にしたパス。
+# 2つ目以降のプロファイルは、さらにファイル名の末尾に "_プロファイル名" を付けたパス。
+def getOutputPaths( strBasePath, astrProfile ):
+    strBase = os.path.splitext( strBasePath )[0]
+    aOutput = []
+    for (i, strProfile) in enumerate( astrProfile ):
+        profile = parseProfile( strProfile )
+        aOutput.append( (strProfile, "%s%s.%s" % (strBase, ("_" + strProfile) if (0 < i) else "", profile.extension)) )
+    return aOutput
@@ -0,0 +1,62 @@
+# transcoder.py
+# 録音済みのWAVファイルを、バックグラウンドでMP3等に変換する常駐プロセス
+# record.py --transcode（record.shのWAV2MP3モードで "queue" を指定した場合等）が、キューディレクトリに変換のジョブを追加する。
+# このプロセスが、ジョブを、CPUのコア数に合わせた同時実行数で、キャプチャより低い優先度で変換する。（recording/transcode.py 参照）
+# ジョブはファイルで保持するので、このプロセスが起動していない間に追加されたジョブや、再起動前に変換中だったジョブも、起動後に変換する。
+# 変換後のファイルは、録音の目録に追加する。（catalogue.py 参照）
+# Arguments
+#   argv[1]    : Queue directory path : Optional. Default is transcode_queue in the repository root (or $TRANSCODE_QUEUE_DIR).
+#   --workers  : Number of conversions at the same time : Optional. Default is the number of CPU cores - 1.
+#   --nice     : Nice value of ffmpeg : Optional. Default is 15.
+#   --once     : キューが空になったら終了する : Optional.
+#   --retry    : 変換に失敗したジョブを、変換待ちに戻してから実行する : Optional.
+
+import argparse
+import datetime
+import os
+import signal
+import sys
+
+from recording.transcode import TranscodeQueue, Transcoder, TRANSCODE_NICE
+from catalogue import addRecordings
+
+# キューディレクトリのパス（リポジトリのルート。環境変数 TRANSCODE_QUEUE_DIR で変更可能）
+TRANSCODE_QUEUE_DIR_DEFAULT = os.path.join( os.path.dirname( os.path.abspath( __file__ ) ), "..", "transcode_queue" )
+
+# キューディレクトリのパスの取得
+def getQueueDir():
+    return os.environ.get( "TRANSCODE_QUEUE_DIR", TRANSCODE_QUEUE_DIR_DEFAULT )
+
+def _log( strMessage ):
+    print( "%s %s" % (datetime.datetime.now().strftime( "%Y/%m/%d %H:%M:%S" ), strMessage), flush = True )
+
+# 変換後のファイルの、録音の目録への追加
+def _catalogue( astrPath ):
+    strError = addRecordings( astrPath )
+    if( strError is not None ):
+        _log( "Warning : %s" % strError )
+
+def main():
+    # 引数の処理
+    parser = argparse.ArgumentParser()
+    parser.add_argument( "queue_dir", nargs = "?", default = None )
+    parser.add_argument( "--workers", type = int, default = None )
+    parser.add_argument( "--nice", type = int, default = TRANSCODE_NICE )
+    parser.add_argument( "--once", action = "store_true" )
+    parser.add_argument( "--retry", action = "store_true" )
+    args = parser.parse_args()
+
+    queue = TranscodeQueue( args.queue_dir if args.queue_dir else getQueueDir() )
+    if( args.retry ):
+        queue.retryFailed()
+    transcoder = Transcoder( queue, args.workers, args.nice, _log, _catalogue )
+
+    # SIGTERM、SIGINTで終了する（変換中のジョブは、変換が終わってから終了する）
+    signal.signal( signal.SIGTERM, lambda iSignal, frame: transcoder.stop() )
+    signal.signal( signal.SIGINT, lambda iSignal, frame: transcoder.stop() )
+
+    transcoder.run( args.once )
+    return 1 if queue.getFailed() else 0
+
+if( "__main__" == __name__ ):
+    sys.exit( main() )
@@ -9,6 +9,19 @@
 #   $4 : Output directory path : Optional. Default is current directory.
 #   $5 : Scheduled recording name : Optional.
 #   $6 : Enable 'Save as WAV and Convert to MP3 later' : Optional. Default is Disable.
+#        "queue" : WAVで録音し、MP3への変換を、変換キューに追加する。（transcoder.py が、バックグラウンドで変換する）
+# Environment variables
+#   RECORD_SEGMENT_SEC : Segment length [second] : Optional.
+#                        指定すると、録音中は一定時間ごとのセグメント（出力ファイル名.segments/）とプレイリスト（出力ファイル名.m3u8）に書き込み、
+#                        録音の終了時に、セグメントを連結して出力ファイルを作成する。（録音中の異常終了で失われるのは、最後のセグメントのみ）
+#   RECORD_DROPOUT     : "0" disables silence detection : Optional. Default is enabled.
+#                        録音中に無音が続いた場合、ラジオのRSSIを確認し、RSSIが低い場合は、チューナーを設定し直す。（recording/dropout.py 参照）
+#   TRANSCODE_PROFILES : Additional transcode profiles (comma separated. e.g. "aac_96,opus_64") : Optional. ($6 is "queue" only)
+#   RECORD_FLUSH_KB    : Write size [KiB] : Optional. Default is 1024[KiB]. "0" writes directly.
+#                        エンコードしたデータをメモリ上にためて、このサイズごとにまとめてSDカードに書き込む。
+#                        録音中は「出力ファイル名.part」に書き込み、録音の終了時に名前を変更する。（recording/sink.py 参照）
+#   RECORD_KEEP_LAST   : Number of recordings to keep for the scheduled recording name : Optional.
+#                        指定すると、録音の終了後、同じ予約録音名の録音のうち、新しいものからこの数より古い録音を削除する。（録音の目録で判定する。catalogue.py 参照）
 
 # Copyright 2023 Nobuki HIRAMINE
 #
@@ -81,12 +94,55 @@ else
     readonly MP3_FILE_PATH="${OUTPUT_DIR}/${SCHEDULED_RECORDING_NAME}_${FREQUENCY_MHZ}_${DATETIME}.mp3"
 fi
 
+# 受信状態の時系列ファイルのパス（録音ファイルと同じ名前で、拡張子は .signal.csv。集計は .signal.json）
+readonly SIGNAL_FILE_PATH="${MP3_FILE_PATH%.mp3}.signal.csv"
+
+# セグメント出力の指定
+SEGMENT_OPTIONS=()
+if [ "" != "${RECORD_SEGMENT_SEC}" ]; then
+    SEGMENT_OPTIONS=(--segment-sec "${RECORD_SEGMENT_SEC}" --concat)
+fi
+
+# 書き込みサイズの指定
+WRITE_OPTIONS=()
+if [ "" != "${RECORD_FLUSH_KB}" ]; then
+    WRITE_OPTIONS=(--flush-kb "${RECORD_FLUSH_KB}")
+fi
+
+# 無音の検出の指定
+DROPOUT_OPTIONS=()
+if [ "0" != "${RECORD_DROPOUT}" ]; then
+    DROPOUT_OPTIONS=(--dropout)
+fi
+
 # 録音時間[秒]
 readonly REC_LENGTH_SEC=$(( REC_LENGTH_MINUTE * 60 ))
 
 # ラジオの起動(quiet modeで起動)
-python3 ./pymodules/radio_on.py ${FREQUENCY_MHZ} quiet
-result=$?
+# radio_server.py（常駐プロセス）が起動している場合は、録音用のチューナーを確保する。
+# チューナーが複数ある場合（tuners.json）は、録音ごとに別のチューナーが割り当てられ、同時に複数の局を録音できる。
+# 常駐プロセスが起動していない場合は、このプロセス内でラジオを直接操作する。
+# 異常終了した常駐プロセスのソケットファイルが残っている場合もあるので、ソケットファイルの有無ではなく、応答の有無で判定する。
+# 解放、終了時も、確保時の判定に従う。
+python3 ./pymodules/radio_client.py server
+RADIO_SERVER_RUNNING=$?
+readonly RADIO_SERVER_RUNNING
+readonly RECORDING_JOB="record_${FREQUENCY_MHZ}_${DATETIME}_$$"
+# 録音中の受信状態は、常駐プロセス使用時は常駐プロセスが、使用しない場合はrecord.pyが監視する。
+CAPTURE_SOURCE="alsa"
+SIGNAL_OPTIONS=()
+if [ ${RADIO_SERVER_RUNNING} -eq 0 ]; then
+    CAPTURE_DEVICE=$(python3 ./pymodules/radio_client.py acquire "${RECORDING_JOB}" ${FREQUENCY_MHZ} quiet "${SIGNAL_FILE_PATH}")
+    result=$?
+    CAPTURE_SOURCE="alsa:${CAPTURE_DEVICE}"
+    if [ 0 -ne ${#DROPOUT_OPTIONS[@]} ]; then
+        DROPOUT_OPTIONS+=(--job "${RECORDING_JOB}")
+    fi
+else
+    python3 ./pymodules/radio_client.py on ${FREQUENCY_MHZ} quiet
+    result=$?
+    SIGNAL_OPTIONS=(--signal "${SIGNAL_FILE_PATH}")
+fi
 if [ $result -ne 0 ]; then
     echo "Error : Radio could not start."
     echo "${DATETIME}" >> debug.txt
@@ -94,44 +150,91 @@ if [ $result -ne 0 ]; then
     exit
 fi
 
+# capture_server.py（常駐プロセス）が、録音するキャプチャデバイスを読み込んでいる場合は、キャプチャデバイスを開かずに、そこから購読する。
+# （聴取中のループバック再生と、キャプチャデバイスを奪い合わない）
+# capture_server.pyが起動していない、異常終了したcapture_server.pyのソケットファイルが残っている場合（終了コードが0でない）や、
+# 別のデバイス、ALSA以外のソース（tone、wav）を読み込んでいる場合は、キャプチャデバイスを直接開く。
+CAPTURE_DEVICE_REQUESTED="${CAPTURE_SOURCE#alsa}"
+CAPTURE_DEVICE_REQUESTED="${CAPTURE_DEVICE_REQUESTED#:}"
+CAPTURE_HUB_DEVICE=$(python3 ./pymodules/capture_client.py device)
+result=$?
+if [ $result -eq 0 ] && [ "${CAPTURE_DEVICE_REQUESTED:-default}" = "${CAPTURE_HUB_DEVICE}" ]; then
+    CAPTURE_SOURCE="hub"
+fi
+
 # 録音の開始
-# ffmpegを利用しデフォルトキャプチャデバイス(=USBオーディオアダプタのマイク端子)に入る音声をmp3に変換する。
-# WAV2MP3が有効な場合は、arecordを利用しwavとして保存し、後で、mp3に変換する。ここでwavとして保存する。
-if [ "" != "${WAV2MP3}" ]; then
-    arecord -d "${REC_LENGTH_SEC}" \ 
-            -f S16_LE -c 2 -r 44100 \
-            "${MP3_FILE_PATH}".wav \
+# キャプチャデバイス(デフォルトは、USBオーディオアダプタのマイク端子)に入る音声を、エンコードしながらmp3として保存する。
+# WAV2MP3が有効な場合は、エンコーダーの優先度を下げ、エンコードがキャプチャに追いつかない分は一時ファイルに退避し、後でmp3に変換する。
+# WAV2MP3に "queue" を指定した場合は、WAVで録音し、mp3への変換（と、TRANSCODE_PROFILES の形式への変換）を、変換キューに追加する。
+if [ "queue" = "${WAV2MP3}" ]; then
+    python3 ./pymodules/record.py "${REC_LENGTH_SEC}" "${MP3_FILE_PATH}" \
+            --source "${CAPTURE_SOURCE}" \
+            "${SIGNAL_OPTIONS[@]}" \
+            "${SEGMENT_OPTIONS[@]}" \
+            "${WRITE_OPTIONS[@]}" \
+            "${DROPOUT_OPTIONS[@]}" \
+            --transcode "mp3_${BITRATE_KBPS}${TRANSCODE_PROFILES:+,${TRANSCODE_PROFILES}}" \
+            --quiet
+elif [ "" != "${WAV2MP3}" ]; then
+    python3 ./pymodules/record.py "${REC_LENGTH_SEC}" "${MP3_FILE_PATH}" \
+            --bitrate "${BITRATE_KBPS}" \
+            --source "${CAPTURE_SOURCE}" \
+            "${SIGNAL_OPTIONS[@]}" \
+            "${SEGMENT_OPTIONS[@]}" \
+            "${WRITE_OPTIONS[@]}" \
+            "${DROPOUT_OPTIONS[@]}" \
+            --deferred \
             --quiet
 else
-    ffmpeg -t "${REC_LENGTH_SEC}" \
-           -f alsa -i default \
-           -vn -ac 2 -ar 44100 -ab "${BITRATE_KBPS}"k -acodec libmp3lame \
-           "${MP3_FILE_PATH}" \
-           -loglevel error
+    python3 ./pymodules/record.py "${REC_LENGTH_SEC}" "${MP3_FILE_PATH}" \
+            --bitrate "${BITRATE_KBPS}" \
+            --source "${CAPTURE_SOURCE}" \
+            "${SIGNAL_OPTIONS[@]}" \
+            "${SEGMENT_OPTIONS[@]}" \
+            "${WRITE_OPTIONS[@]}" \
+            "${DROPOUT_OPTIONS[@]}" \
+            --quiet
+fi
+
+# ラジオの終了
+# 常駐プロセス使用時は、チューナーを解放する。他の録音、聴取に使用されていないチューナーのみ、電源が切られる。
+# 録音は、record.py が録音の目録に追加済み。
+if [ ${RADIO_SERVER_RUNNING} -eq 0 ]; then
+    python3 ./pymodules/radio_client.py release "${RECORDING_JOB}" quiet
+    # 受信状態の集計は、チューナーの解放時に書き出されるので、録音の目録を更新する。
+    if [ -f "${MP3_FILE_PATH}" ]; then
+        python3 ./pymodules/catalogue.py add "${MP3_FILE_PATH}" > /dev/null
+    fi
+fi
+
+# 古い録音の削除
+if [ "" != "${RECORD_KEEP_LAST}" ]; then
+    python3 ./pymodules/catalogue.py retain --keep "${RECORD_KEEP_LAST}" --name "${SCHEDULED_RECORDING_NAME}" --dir "${OUTPUT_DIR}" > /dev/null
+fi
+
+if [ ${RADIO_SERVER_RUNNING} -eq 0 ]; then
+    exit
 fi
 
 # ラジオの終了
 # 連続録音の場合はラジオ終了しない。
-# 5秒待機後、ffmpegのプロセスがあるかで、連続録音か判定。
+# 5秒待機後、別の録音があるかで、連続録音か判定。
 sleep 5
-# ffmpegのプロセスがない場合のみ処理。プロセスがある場合は、別のラジオ録音中なのでラジオ処理なし。
-# load済みのmodule-loopbackがない場合のみ処理。ある場合は、ラジオリスニング中なのでラジオ処理なし。
-readonly INFO_FFMPEG_PROCESS=$(ps aux | grep [f]fmpeg)
-readonly INFO_LOADED_MODULE_LOOPBACK=$(pactl list modules short | grep module-loopback)
-if [ "" != "${INFO_FFMPEG_PROCESS}" ]; then
+# 録音中でない場合のみ処理。録音中の場合は、別のラジオ録音中なのでラジオ処理なし。
+# 聴取中でない場合のみ処理。聴取中の場合は、ラジオリスニング中なのでラジオ処理なし。
+# capture_server.pyが起動している場合は、その購読者で、起動していない場合は、record.pyのプロセス、module-loopbackの有無で判定する。
+if python3 ./pymodules/capture_client.py status > /dev/null; then
+    readonly INFO_RECORDING=$(python3 ./pymodules/capture_client.py has record && echo "recording")
+    readonly INFO_LISTENING=$(python3 ./pymodules/capture_client.py has listen && echo "listening")
+else
+    readonly INFO_RECORDING=$(ps aux | grep "[r]ecord\.py")
+    readonly INFO_LISTENING=$(pactl list modules short | grep module-loopback)
+fi
+if [ "" != "${INFO_RECORDING}" ]; then
     echo "Now Recording! Skipped Radio-Off."
-elif [ "" != "${INFO_LOADED_MODULE_LOOPBACK}" ]; then
+elif [ "" != "${INFO_LISTENING}" ]; then
     echo "Now Listening! Skipped Radio-Off."
 else
     # ラジオの終了(quiet modeで終了)
-    python3 ./pymodules/radio_off.py quiet
-fi
-
-# WAV2MP3が有効な場合は、arecordでwav保存し、後で、mp3に変換する。ここでmp3に変換する。
-if [ "" != "${WAV2MP3}" ]; then
-    ffmpeg -i "${MP3_FILE_PATH}".wav \
-        -vn -ac 2 -ar 44100 -ab "${BITRATE_KBPS}"k -acodec libmp3lame \
-        "${MP3_FILE_PATH}" \
-        -loglevel error
-    rm -f "${MP3_FILE_PATH}".wav
+    python3 ./pymodules/radio_client.py off quiet
 fi